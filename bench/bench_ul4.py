@@ -0,0 +1,269 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# cython: language_level=3, always_allow_keywords=True
+
+"""
+Benchmark suite for the hot paths of :mod:`ll.ul4c`: compiling templates
+(:class:`ll.ul4c.Template` constructor), loading them from UL4ON dumps
+(:meth:`ll.ul4c.Template.loads`), rendering them (:meth:`render` and
+:meth:`renders`) and calling them (:meth:`__call__`) with both backends.
+
+The templates are modelled after real world templates: a table of records
+with heavy attribute access and formatting, a page that is assembled from
+nested local templates, a recursive tree and a function that aggregates data.
+
+For each benchmark the best time per call (from :obj:`--repeat` runs) and the
+peak memory allocated during one call (via :mod:`tracemalloc`) is measured.
+The results can be stored as JSON (:obj:`--output`) and compared against a
+stored baseline (:obj:`--baseline`). If any benchmark is slower (or needs more
+memory) than the baseline by more than :obj:`--threshold` percent, the exit
+code will be 1, so the script can be used for detecting regressions::
+
+	python bench/bench_ul4.py --output baseline.json
+	# change ll.ul4c
+	python bench/bench_ul4.py --baseline baseline.json
+
+Usage: ``python bench/bench_ul4.py [--output FILE] [--baseline FILE] [--threshold PERCENT] [--repeat N] [--mintime SECONDS] [--backend NAME] [PATTERN ...]``
+"""
+
+import sys, re, gc, json, datetime, platform, timeit, argparse, tracemalloc
+
+from ll import ul4c
+
+
+class Person:
+	ul4attrs = {"id", "firstname", "lastname", "email", "birthday", "balance", "active", "tags", "address"}
+
+	def __init__(self, id):
+		self.id = id
+		self.firstname = "First{}".format(id)
+		self.lastname = "Last{}".format(id % 97)
+		self.email = "person{}@example.org".format(id) if id % 7 else None
+		self.birthday = datetime.date(1950 + id % 50, 1 + id % 12, 1 + id % 28)
+		self.balance = (id * 37 % 10000) / 7
+		self.active = bool(id % 3)
+		self.tags = ["tag{}".format(i) for i in range(id % 4)]
+		self.address = dict(street="Street {}".format(id), zip="{:05}".format(id * 13 % 100000), city="City{}".format(id % 10))
+
+
+def tree(depth, width, prefix="node"):
+	return [dict(name="{}.{}".format(prefix, i), children=tree(depth-1, width, "{}.{}".format(prefix, i)) if depth > 1 else []) for i in range(width)]
+
+
+templates = dict(
+	table=dict(
+		source="""
+			<?whitespace strip?>
+			<table>
+				<tr><th>#</th><th>Name</th><th>Email</th><th>Birthday</th><th>Balance</th><th>Address</th><th>Tags</th></tr>
+				<?for (i, p) in enumerate(persons, 1)?>
+					<tr class="<?print "odd" if i % 2 else "even"?><?if not p.active?> inactive<?end if?>">
+						<td><?print i?>/<?print p.id?></td>
+						<td><?printx p.lastname?>, <?printx p.firstname?></td>
+						<td><?if p.email?><a href="mailto:<?printx p.email?>"><?printx p.email.lower()?></a><?else?>-<?end if?></td>
+						<td><?print format(p.birthday, "%d.%m.%Y")?></td>
+						<td><?print format(p.balance, ",.2f")?></td>
+						<td><?printx p.address.street?>, <?printx p.address.zip?> <?printx p.address.city?></td>
+						<td><?for (f, l, t) in isfirstlast(p.tags)?><?printx t?><?if not l?>, <?end if?><?end for?></td>
+					</tr>
+				<?end for?>
+			</table>
+		""",
+		vars=lambda: dict(persons=[Person(i) for i in range(300)]),
+	),
+	nested=dict(
+		source="""
+			<?whitespace smart?>
+			<?def field(label, value, cls="")?>
+				<div class="field <?printx cls?>"><label><?printx label?></label><span><?printx value?></span></div>
+			<?end def?>
+			<?def card(p)?>
+				<div class="card" id="p<?print p.id?>">
+					<?render field("Name", p.firstname + " " + p.lastname, "name")?>
+					<?render field("Email", p.email or "-")?>
+					<?render field("City", p.address.city, cls="city")?>
+					<?for tag in p.tags?>
+						<?render field("Tag", tag)?>
+					<?end for?>
+				</div>
+			<?end def?>
+			<?def section(title, persons)?>
+				<section>
+					<h2><?printx title?> (<?print len(persons)?>)</h2>
+					<?for p in persons?>
+						<?render card(p)?>
+					<?end for?>
+				</section>
+			<?end def?>
+			<html>
+				<body>
+					<?render section("Active", [p for p in persons if p.active])?>
+					<?render section("Inactive", [p for p in persons if not p.active])?>
+				</body>
+			</html>
+		""",
+		vars=lambda: dict(persons=[Person(i) for i in range(200)]),
+	),
+	tree=dict(
+		source="""
+			<?whitespace strip?>
+			<?def node(n, level)?>
+				<li class="level<?print level?>"><?printx n.name?>
+					<?if n.children?>
+						<ul><?for child in n.children?><?render node(child, level+1)?><?end for?></ul>
+					<?end if?>
+				</li>
+			<?end def?>
+			<ul><?for n in nodes?><?render node(n, 0)?><?end for?></ul>
+		""",
+		vars=lambda: dict(nodes=tree(5, 4)),
+	),
+	function=dict(
+		source="""
+			<?whitespace strip?>
+			<?code stats = {}?>
+			<?for p in persons?>
+				<?code city = p.address.city?>
+				<?code entry = stats.get(city)?>
+				<?if entry is None?>
+					<?code entry = {"count": 0, "balance": 0, "tags": set(), "emails": 0}?>
+					<?code stats[city] = entry?>
+				<?end if?>
+				<?code entry.count += 1?>
+				<?code entry.balance += p.balance?>
+				<?code entry.emails += bool(p.email)?>
+				<?for t in p.tags?>
+					<?code entry.tags.add(t)?>
+				<?end for?>
+			<?end for?>
+			<?return {city: [entry.count, round(entry.balance, 2), len(entry.tags), entry.emails] for (city, entry) in stats.items()}?>
+		""",
+		vars=lambda: dict(persons=[Person(i) for i in range(1000)]),
+	),
+)
+
+
+def benchmarks(backends):
+	"""
+	Generate the benchmarks as ``(name, function)`` tuples.
+	"""
+	for (name, info) in templates.items():
+		source = info["source"]
+		template = ul4c.Template(source, name)
+		dump = template.dumps()
+		vars = info["vars"]()
+
+		yield ("compile/{}".format(name), lambda source=source, name=name: ul4c.Template(source, name))
+		yield ("load/{}".format(name), lambda dump=dump: ul4c.Template.loads(dump))
+
+		for backend in backends:
+			template = ul4c.Template(source, name, backend=backend)
+			if name == "function":
+				yield ("call/{}/{}".format(name, backend), lambda template=template, vars=vars: template(**vars))
+			else:
+				yield ("render/{}/{}".format(name, backend), lambda template=template, vars=vars: "".join(template.render(**vars)))
+				yield ("renders/{}/{}".format(name, backend), lambda template=template, vars=vars: template.renders(**vars))
+
+
+def measure(function, repeat, mintime):
+	"""
+	Measure :obj:`function` and return a dictionary with the best time per
+	call, the times of all runs and the peak memory allocated during one call.
+	"""
+	function() # Warm up (and compile the template for the ``"compiled"`` backend)
+
+	# Find the number of calls so that one run takes at least :obj:`mintime` seconds
+	number = 1
+	while True:
+		t = timeit.timeit(function, number=number)
+		if t >= mintime:
+			break
+		number = max(number * 2, int(number * mintime / t * 1.1) if t else number * 10)
+
+	times = [t / number for t in timeit.repeat(function, number=number, repeat=repeat)]
+
+	gc.collect()
+	tracemalloc.start()
+	try:
+		function()
+		(size, peak) = tracemalloc.get_traced_memory()
+	finally:
+		tracemalloc.stop()
+
+	return dict(time=min(times), times=times, number=number, peak=peak)
+
+
+def compare(results, baseline, threshold):
+	"""
+	Print the comparison of :obj:`results` with :obj:`baseline` and return the
+	names of the benchmarks that have regressed by more than :obj:`threshold`
+	percent.
+	"""
+	regressions = []
+	print()
+	print("{:<28} {:>10} {:>10} {:>8}   {:>10} {:>10} {:>8}".format("benchmark", "baseline", "time", "change", "baseline", "peak", "change"))
+	for (name, result) in results.items():
+		old = baseline.get(name)
+		if old is None:
+			print("{:<28} {:>10} {:>8.2f}ms {:>8}   {:>10} {:>9,}B {:>8}".format(name, "-", result["time"]*1000, "new", "-", result["peak"], "new"))
+			continue
+		timechange = (result["time"] / old["time"] - 1) * 100
+		peakchange = (result["peak"] / old["peak"] - 1) * 100 if old["peak"] else 0.
+		flags = []
+		if timechange > threshold:
+			flags.append("slower")
+		if peakchange > threshold:
+			flags.append("more memory")
+		if flags:
+			regressions.append(name)
+		print("{:<28} {:>8.2f}ms {:>8.2f}ms {:>+7.1f}%   {:>9,}B {:>9,}B {:>+7.1f}%{}".format(name, old["time"]*1000, result["time"]*1000, timechange, old["peak"], result["peak"], peakchange, "   <- {}".format(", ".join(flags)) if flags else ""))
+	return regressions
+
+
+def main(args=None):
+	p = argparse.ArgumentParser(description="Benchmark compiling, loading, rendering and calling UL4 templates")
+	p.add_argument("patterns", metavar="PATTERN", help="Only run benchmarks whose name matches one of these regular expressions", nargs="*")
+	p.add_argument("-o", "--output", dest="output", help="Store the results as JSON in this file", default=None, metavar="FILE")
+	p.add_argument("-b", "--baseline", dest="baseline", help="Compare the results with the JSON results in this file", default=None, metavar="FILE")
+	p.add_argument("-t", "--threshold", dest="threshold", help="Report benchmarks that are slower (or use more memory) than the baseline by more than this percentage as regressions (default %(default)s)", type=float, default=10.)
+	p.add_argument("-r", "--repeat", dest="repeat", help="Number of runs for each benchmark (default %(default)s)", type=int, default=5)
+	p.add_argument("-m", "--mintime", dest="mintime", help="Minimum duration of one run in seconds (default %(default)s)", type=float, default=0.2)
+	p.add_argument(      "--backend", dest="backends", help="Backends to benchmark (default: both)", choices=("interpreted", "compiled"), action="append", default=None)
+	args = p.parse_args(args)
+
+	backends = args.backends or ["interpreted", "compiled"]
+	patterns = [re.compile(pattern) for pattern in args.patterns]
+
+	results = {}
+	for (name, function) in benchmarks(backends):
+		if patterns and not any(pattern.search(name) for pattern in patterns):
+			continue
+		result = measure(function, args.repeat, args.mintime)
+		results[name] = result
+		print("{:<28} {:8.2f}ms   {:9,}B peak".format(name, result["time"]*1000, result["peak"]))
+
+	if args.output is not None:
+		data = dict(
+			date=datetime.datetime.now().isoformat(),
+			python=platform.python_version(),
+			implementation=platform.python_implementation(),
+			platform=platform.platform(),
+			ul4version=ul4c.Template.version,
+			benchmarks=results,
+		)
+		with open(args.output, "w", encoding="utf-8") as f:
+			json.dump(data, f, indent="\t", sort_keys=True)
+
+	if args.baseline is not None:
+		with open(args.baseline, "r", encoding="utf-8") as f:
+			baseline = json.load(f)
+		regressions = compare(results, baseline["benchmarks"], args.threshold)
+		if regressions:
+			print()
+			print("{} regression(s) compared to {} (Python {}, {})".format(len(regressions), args.baseline, baseline.get("python", "?"), baseline.get("date", "?")))
+			return 1
+	return 0
+
+
+if __name__ == "__main__":
+	sys.exit(main())
@@ -0,0 +1,45 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# cython: language_level=3, always_allow_keywords=True
+
+"""
+Measure the speed of attribute access in UL4 templates with and without the
+type dispatch cache of :class:`ll.ul4c.Attr`, using a template that outputs a
+list of records (dictionaries).
+
+Usage: ``python bench/bench_ul4attr.py [--number N] [--records N]``
+"""
+
+import sys, timeit, argparse
+
+from ll import ul4c
+
+
+source = """
+<?for r in records?>
+	<?print r.id?>: <?print r.firstname?> <?print r.lastname?> (<?print r.email?>, <?print r.age?>)
+<?end for?>
+"""
+
+
+def main(args=None):
+	p = argparse.ArgumentParser(description="Benchmark attribute access in UL4 templates")
+	p.add_argument("-n", "--number", dest="number", help="Number of renders per measurement (default %(default)s)", type=int, default=10)
+	p.add_argument("-r", "--records", dest="records", help="Number of records (default %(default)s)", type=int, default=2000)
+	args = p.parse_args(args)
+
+	records = [dict(id=i, firstname="John", lastname="Doe", email="john{}@example.org".format(i), age=i % 100) for i in range(args.records)]
+
+	cached = ul4c.Attr.evalattr
+	results = {}
+	for backend in ("interpreted", "compiled"):
+		template = ul4c.Template(source, whitespace="smart", backend=backend)
+		for (mode, evalattr) in (("uncached", ul4c.Attr._evalattr), ("cached", cached)):
+			ul4c.Attr.evalattr = evalattr
+			results[mode] = min(timeit.repeat(lambda: template.renders(records=records), number=args.number, repeat=3)) / args.number
+		ul4c.Attr.evalattr = cached
+		print("{:<12} uncached {:8.2f}ms   cached {:8.2f}ms   speedup {:.2f}x".format(backend, results["uncached"]*1000, results["cached"]*1000, results["uncached"]/results["cached"]))
+
+
+if __name__ == "__main__":
+	sys.exit(main())
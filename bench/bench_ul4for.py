@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# cython: language_level=3, always_allow_keywords=True
+
+"""
+Benchmark ``<?for?>`` loops over various containers (lists, ranges, dict
+items, generators and the functions ``enumerate``, ``enumfl`` and
+``isfirstlast``) for both backends.
+
+Usage: ``python bench/bench_ul4for.py [--number N] [--items N]``
+"""
+
+import sys, timeit, argparse
+
+from ll import ul4c
+
+
+loops = [
+	("list", "<?for x in data?><?print x?><?end for?>"),
+	("range", "<?for i in range(count)?><?print i?><?end for?>"),
+	("unpack", "<?for (k, v) in pairs?><?print k?><?print v?><?end for?>"),
+	("dictitems", "<?for (k, v) in dict.items()?><?print k?><?print v?><?end for?>"),
+	("generator", "<?for x in (x for x in data)?><?print x?><?end for?>"),
+	("enumerate", "<?for (i, x) in enumerate(data)?><?print i?><?print x?><?end for?>"),
+	("enumfl", "<?for (i, f, l, x) in enumfl(data)?><?print i?><?print x?><?end for?>"),
+	("isfirstlast", "<?for (f, l, x) in isfirstlast(data)?><?print x?><?end for?>"),
+]
+
+
+def main(args=None):
+	p = argparse.ArgumentParser(description="Benchmark UL4 <?for?> loops")
+	p.add_argument("-n", "--number", dest="number", help="Number of renders per measurement (default %(default)s)", type=int, default=10)
+	p.add_argument("-i", "--items", dest="items", help="Number of items per loop (default %(default)s)", type=int, default=10000)
+	args = p.parse_args(args)
+
+	data = ["item{}".format(i) for i in range(args.items)]
+	vars = dict(
+		data=data,
+		count=args.items,
+		pairs=[(i, x) for (i, x) in enumerate(data)],
+		dict=dict(enumerate(data)),
+	)
+
+	for backend in ("interpreted", "compiled"):
+		print(backend)
+		for (name, source) in loops:
+			template = ul4c.Template(source, backend=backend)
+			template.renders(**vars)
+			result = min(timeit.repeat(lambda: template.renders(**vars), number=args.number, repeat=3)) / args.number
+			print("   {:<12} {:8.2f}ms".format(name, result*1000))
+
+
+if __name__ == "__main__":
+	sys.exit(main())
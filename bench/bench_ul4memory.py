@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# cython: language_level=3, always_allow_keywords=True
+
+"""
+Measure the memory used by the AST of large UL4 templates (created by
+compiling the template source and by loading the template from its UL4ON
+dump) via :mod:`tracemalloc`.
+
+Usage: ``python bench/bench_ul4memory.py [--sections N] [--number N]``
+"""
+
+import sys, gc, timeit, argparse, tracemalloc
+
+from ll import ul4c
+
+
+section = """
+<?def section{i}(records, title="Section {i}")?>
+	<h2><?print title?></h2>
+	<?if records?>
+		<table class="<?print "odd" if {i} % 2 else "even"?>">
+			<?for (j, r) in enumerate(records, 1)?>
+				<tr>
+					<td><?print j?>/<?print len(records)?></td>
+					<td><?printx r.firstname?> <?printx r.lastname?></td>
+					<td><?printx r.email.lower() if r.email else "-"?></td>
+					<td><?print "{{:,.2f}}".format(r.balance * 1.{i})?></td>
+				</tr>
+			<?end for?>
+		</table>
+	<?elif title?>
+		<p>No records for <?printx title?></p>
+	<?else?>
+		<p>No records</p>
+	<?end if?>
+<?end def?>
+<?render section{i}(records)?>
+"""
+
+
+def makesource(sections):
+	return "".join(section.format(i=i) for i in range(sections))
+
+
+def measure(factory):
+	gc.collect()
+	tracemalloc.start()
+	try:
+		obj = factory()
+		gc.collect()
+		(size, peak) = tracemalloc.get_traced_memory()
+	finally:
+		tracemalloc.stop()
+	return (obj, size, peak)
+
+
+def main(args=None):
+	p = argparse.ArgumentParser(description="Measure the memory footprint of UL4 template ASTs")
+	p.add_argument("-s", "--sections", dest="sections", help="Number of template sections in the generated template (default %(default)s)", type=int, default=500)
+	p.add_argument("-n", "--number", dest="number", help="Number of repetitions for the timing (default %(default)s)", type=int, default=3)
+	args = p.parse_args(args)
+
+	source = makesource(args.sections)
+	dump = ul4c.Template(source, whitespace="smart").dumps()
+
+	def compile():
+		return ul4c.Template(source, whitespace="smart")
+
+	def load():
+		return ul4c.Template.loads(dump)
+
+	print("source: {:,} characters; dump: {:,} characters".format(len(source), len(dump)))
+	for f in (compile, load):
+		(template, size, peak) = measure(f)
+		nodes = ul4c.Optimizer.count(template)
+		time = min(timeit.repeat(f, number=args.number, repeat=3)) / args.number
+		print("{:<8} {:9,} nodes   {:7.2f}MB ({:5.1f} bytes/node)   peak {:7.2f}MB   {:8.2f}ms".format(f.__name__, nodes, size/1024/1024, size/nodes, peak/1024/1024, time*1000))
+
+
+if __name__ == "__main__":
+	sys.exit(main())
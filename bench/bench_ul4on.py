@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# cython: language_level=3, always_allow_keywords=True
+
+"""
+Measure the throughput of encoding UL4ON dumps with :func:`ll.ul4on.dumps`
+and :meth:`ll.ul4c.Template.dumps` and of decoding them with
+:func:`ll.ul4on.loads` (from a string), :func:`ll.ul4on.load` (from a stream)
+and via :class:`ll.ul4on.StreamBuffer` (as used by :func:`ll.ul4on.loadclob`).
+The data is a list of records as it would be produced from database data.
+
+For comparison the same data is encoded and decoded as binary UL4ON, as JSON
+(with datetimes as ISO strings) and with :mod:`pickle`.
+
+Usage: ``python bench/bench_ul4on.py [--records N] [--number N] [--indent]``
+"""
+
+import sys, io, json, pickle, datetime, timeit, argparse
+
+from ll import ul4on, ul4c
+
+
+def makedata(records):
+	return [
+		dict(
+			id=i,
+			name="Name {}".format(i),
+			description="Line 1\nLine 2 with 'quotes' and \\backslash\\ {}".format(i) if i % 5 == 0 else "Description of record {} with some more text".format(i),
+			price=i * 1.25,
+			created=datetime.datetime(2017, 1 + i % 12, 1 + i % 28, i % 24, i % 60, i % 60),
+			tags=["tag{}".format(i % 10), "tag{}".format(i % 7)],
+			parent=None if i % 3 else i // 3,
+			active=bool(i % 2),
+		)
+		for i in range(records)
+	]
+
+
+def maketemplate(records):
+	source = "".join("<?def t{0}(r)?><tr><td><?printx r.name?></td><td><?print r.price * {0}?></td></tr><?end def?><?for r in records?><?render t{0}(r)?><?end for?>".format(i) for i in range(records // 20))
+	return ul4c.Template(source, whitespace="smart")
+
+
+def main(args=None):
+	p = argparse.ArgumentParser(description="Measure the throughput of the UL4ON encoder and decoder")
+	p.add_argument("-r", "--records", dest="records", help="Number of records in the dump (default %(default)s)", type=int, default=20000)
+	p.add_argument("-n", "--number", dest="number", help="Number of repetitions (default %(default)s)", type=int, default=3)
+	p.add_argument("-i", "--indent", dest="indent", help="Use an indented dump", action="store_true", default=False)
+	args = p.parse_args(args)
+
+	indent = "\t" if args.indent else None
+	data = makedata(args.records)
+	template = maketemplate(args.records)
+	dump = ul4on.dumps(data, indent=indent)
+	templatedump = ul4on.dumps(template, indent=indent)
+	binarydump = ul4on.dumps(data, binary=True)
+	binarytemplatedump = ul4on.dumps(template, binary=True)
+	jsondump = json.dumps(data, default=datetime.datetime.isoformat)
+	pickledump = pickle.dumps(data, pickle.HIGHEST_PROTOCOL)
+	print("dump: {:,} characters; template dump: {:,} characters".format(len(dump), len(templatedump)))
+	print("binary dump: {:,} bytes; binary template dump: {:,} bytes; JSON: {:,} characters; pickle: {:,} bytes".format(len(binarydump), len(binarytemplatedump), len(jsondump), len(pickledump)))
+
+	tests = [
+		("dumps", len(dump), lambda: ul4on.dumps(data, indent=indent)),
+		("templatedumps", len(templatedump), lambda: ul4on.dumps(template, indent=indent)),
+		("loads", len(dump), lambda: ul4on.loads(dump)),
+		("load", len(dump), lambda: ul4on.load(io.StringIO(dump))),
+		("streambuffer", len(dump), lambda: ul4on.Decoder(ul4on.StreamBuffer(io.StringIO(dump)), bufsize=64*1024).load()),
+		("binarydumps", len(binarydump), lambda: ul4on.dumps(data, binary=True)),
+		("binarytemplatedumps", len(binarytemplatedump), lambda: ul4on.dumps(template, binary=True)),
+		("binaryloads", len(binarydump), lambda: ul4on.loads(binarydump)),
+		("binaryload", len(binarydump), lambda: ul4on.load(io.BytesIO(binarydump))),
+		("jsondumps", len(jsondump), lambda: json.dumps(data, default=datetime.datetime.isoformat)),
+		("jsonloads", len(jsondump), lambda: json.loads(jsondump)),
+		("pickledumps", len(pickledump), lambda: pickle.dumps(data, pickle.HIGHEST_PROTOCOL)),
+		("pickleloads", len(pickledump), lambda: pickle.loads(pickledump)),
+	]
+	for (name, size, f) in tests:
+		time = min(timeit.repeat(f, number=1, repeat=args.number))
+		print("{:<20} {:8.2f}ms {:8.2f}MB/s".format(name, time*1000, size/time/1024/1024))
+
+
+if __name__ == "__main__":
+	sys.exit(main())
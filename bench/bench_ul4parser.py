@@ -0,0 +1,38 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# cython: language_level=3, always_allow_keywords=True
+
+"""
+Compare the speed of compiling UL4 templates with the native parser and with
+the ANTLR based parser.
+
+Usage: ``python bench/bench_ul4parser.py [--number N]``
+"""
+
+import sys, os, timeit, argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "test"))
+
+from ll import ul4c
+
+import test_ul4
+
+
+def main(args=None):
+	p = argparse.ArgumentParser(description="Benchmark the UL4 parsers")
+	p.add_argument("-n", "--number", dest="number", help="Number of compilations per parser (default %(default)s)", type=int, default=20)
+	args = p.parse_args(args)
+
+	source = test_ul4.universaltemplate().source
+	signature = "x, y=42, *args, **kwargs"
+
+	results = {}
+	for parser in ("antlr", "native"):
+		ul4c.Template.parser = parser
+		results[parser] = min(timeit.repeat(lambda: ul4c.Template(source, "universal", signature=signature), number=args.number, repeat=3)) / args.number
+		print("{:<6} {:8.2f}ms per compilation".format(parser, results[parser]*1000))
+	print("speedup {:.1f}x".format(results["antlr"]/results["native"]))
+
+
+if __name__ == "__main__":
+	sys.exit(main())
@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# cython: language_level=3, always_allow_keywords=True
+
+"""
+Compare :meth:`ll.ul4c.Template.render` and :meth:`ll.ul4c.Template.renders`
+with :meth:`ll.ul4c.Template.renderto` (writing into a list, an
+:class:`io.StringIO` object and a :class:`ll.ul4c.ChunkWriter`), using a
+template that outputs a list of records via a nested template.
+
+Usage: ``python bench/bench_ul4renderto.py [--number N] [--records N] [--chunksize N]``
+"""
+
+import sys, io, timeit, argparse
+
+from ll import ul4c
+
+
+source = """
+<?def row(r)?>
+	<tr><td><?print r.id?></td><td><?print r.firstname?> <?print r.lastname?></td><td><?print r.email?></td></tr>
+<?end def?>
+<table>
+<?for r in records?>
+	<?render row(r)?>
+<?end for?>
+</table>
+"""
+
+
+def main(args=None):
+	p = argparse.ArgumentParser(description="Benchmark rendering UL4 templates into a stream")
+	p.add_argument("-n", "--number", dest="number", help="Number of renders per measurement (default %(default)s)", type=int, default=10)
+	p.add_argument("-r", "--records", dest="records", help="Number of records (default %(default)s)", type=int, default=2000)
+	p.add_argument("-c", "--chunksize", dest="chunksize", help="Chunk size for the ChunkWriter (default %(default)s)", type=int, default=8192)
+	args = p.parse_args(args)
+
+	records = [dict(id=i, firstname="John", lastname="Doe", email="john{}@example.org".format(i)) for i in range(args.records)]
+
+	def render():
+		"".join(template.render(records=records))
+
+	def renders():
+		template.renders(records=records)
+
+	def renderto_list():
+		output = []
+		template.renderto(output.append, records=records)
+		"".join(output)
+
+	def renderto_stringio():
+		stream = io.StringIO()
+		template.renderto(stream, records=records)
+		stream.getvalue()
+
+	def renderto_chunked():
+		stream = io.StringIO()
+		template.renderto(ul4c.ChunkWriter(stream, args.chunksize), records=records)
+		stream.getvalue()
+
+	for backend in ("interpreted", "compiled"):
+		template = ul4c.Template(source, whitespace="smart", backend=backend)
+		results = {}
+		for f in (render, renders, renderto_list, renderto_stringio, renderto_chunked):
+			results[f.__name__] = min(timeit.repeat(f, number=args.number, repeat=3)) / args.number
+		print(backend)
+		for (name, result) in results.items():
+			print("   {:<18} {:8.2f}ms   {:.2f}x".format(name, result*1000, results["render"]/result))
+
+
+if __name__ == "__main__":
+	sys.exit(main())
@@ -35,6 +35,14 @@ Options
 	of the files (i.e. ``foo.ul4`` will be ``globals.templates.foo``; stdin will
 	be ``globals.templates.stdin``).
 
+.. option:: -T <directory>, --templatedir <directory>
+
+	A directory (or URL) containing additional templates (with the extension
+	``.ul4``). These templates will be available in ``globals.templates`` too,
+	but they will only be compiled when they are used (see
+	:class:`ll.ul4c.TemplateLoader`). Templates specified on the command line
+	take precedence.
+
 .. option:: --oracle <flag>
 
 	Provide the method :meth:`Globals.oracle` (as ``globals.oracle``) to the
@@ -109,6 +117,78 @@ Options
 	``keep``, ``strip``, or ``smart``). This can of course be overwritten with
 	the template tag ``<?whitespace ...?>`` in the template files.
 
+.. option:: --profile <flag>
+
+	Profile the rendering of the template and output a report to
+	:obj:`sys.stderr` that shows where the time was spent (see
+	:class:`ll.ul4c.Profiler`). (Allowed values are ``false``, ``no``, ``0``,
+	``true``, ``yes`` or ``1``; the default is ``false``)
+
+.. option:: -b <filename>, --batch <filename>
+
+	Switch to batch mode: The main template will be rendered once for each
+	variable set read from this file (``-`` reads from standard input). The
+	variables of each set will be available in ``globals.vars`` (in addition
+	to those defined via :option:`-D`). The template is compiled only once
+	and the variable sets are rendered on a pool of processes.
+
+.. option:: --batchformat <format>
+
+	The format of the batch input: ``json`` (the default) means one JSON object
+	per line, ``ul4on`` means a sequence of UL4ON dumps of dictionaries.
+
+.. option:: --batchoutput <pattern>
+
+	Write the output for each variable set into its own file instead of to
+	standard output. The filename is created by calling :meth:`str.format` on
+	:obj:`pattern` with the variables of the set and ``index`` (the number of
+	the set, starting with 0) as keyword arguments (e.g.
+	``--batchoutput=out/{index}.html`` or ``--batchoutput=out/{id}.html``).
+
+.. option:: -j <count>, --jobs <count>
+
+	The number of processes used in batch mode (the default is the number of
+	CPUs). With ``-j1`` everything is rendered in the main process.
+
+.. option:: --ordered <flag>
+
+	Output the results in the order of the batch input (the default) or in the
+	order in which they are finished? (Allowed values are ``false``, ``no``,
+	``0``, ``true``, ``yes`` or ``1``)
+
+.. option:: --onerror <action>
+
+	What to do when rendering a variable set fails: ``continue`` (the default)
+	reports the error and continues with the next set, ``abort`` stops batch
+	processing. In both cases the exit status will be 1.
+
+.. option:: --serve <socket>
+
+	Start a server that listens on the Unix domain socket ``socket`` and
+	renders templates for clients (see :option:`--connect`). All other
+	arguments are ignored (they must be passed by the clients). The server
+	keeps compiled templates and the database connections created via
+	``globals.oracle``, ``globals.mysql`` and ``globals.sqlite`` (or
+	:option:`-D`) open between requests, so rendering doesn't have to pay the
+	startup costs each time. Open transactions are rolled back after each
+	request. Requests are handled one after the other.
+
+	System commands executed via ``globals.system`` use the environment
+	variables of the client. Database connections however are created with the
+	environment of the server, so variables like :envvar:`ORACLE_HOME`,
+	:envvar:`TNS_ADMIN`, :envvar:`NLS_LANG` (for Oracle) or
+	:envvar:`MYSQL_HOST` and :envvar:`MYSQL_UNIX_PORT` (for MySQL) must be set
+	when the server is started.
+
+.. option:: --connect <socket>
+
+	Don't render the template in this process, but pass the command line to the
+	server listening on ``socket`` (see :option:`--serve`) and output the
+	result. If this option isn't specified, the environment variable
+	:envvar:`RUL4_SOCKET` will be used. (In this case, if no server is
+	running, the template will be rendered locally.) So existing scripts can
+	use a server simply by setting :envvar:`RUL4_SOCKET`.
+
 .. option:: -D, --define
 
 	Defines an additional variable that will be available inside the template
@@ -214,13 +294,25 @@ system commands:
 
 Then the template can use the Oracle connection object :obj:`db` directly.
 
+If :program:`rul4` is called often (e.g. from shell scripts) we can start a
+server once and let all calls use it:
+
+.. sourcecode:: bash
+
+	rul4 --serve /tmp/rul4.sock &
+	export RUL4_SOCKET=/tmp/rul4.sock
+	rul4 person.ul4 -Ddb:oracle=user/password@database >person.xml
+
+Now the template will only be compiled again when the file changes and the
+database connection will be reused by the next call.
+
 
 API
 ===
 """
 
 
-import sys, os, argparse, datetime, keyword
+import sys, os, io, argparse, datetime, keyword, contextlib, collections, json, copy, traceback, multiprocessing, subprocess
 
 from ll import ul4c, misc
 
@@ -510,7 +602,8 @@ class Globals:
 
 	``templates`` : dictionary
 		A dictionary containing the templates specified on the command line. This
-		will include the main template.
+		will include the main template. (If :option:`--templatedir` is used, the
+		templates from the directory will be available too.)
 
 	``vars`` : dictionary
 		A dictionary containing the variables that have been specified via the
@@ -553,38 +646,23 @@ class Globals:
 		if not compile:
 			self.compile = None
 
-	def from_args(self, args):
+	def from_args(self, args, templates=None):
 		"""
 		Sets the attributes of :obj:`self` from the object :obj:`args` (which
 		must be an instance of :class:`argparse.Namespace`).
 
+		If :obj:`templates` is not :const:`None` it must be a list of already
+		compiled templates (with the main template first), that will be used
+		instead of loading the template files.
+
 		Returns the main template.
 		"""
-		templates = {}
-		maintemplate = None
-		for templatename in args.templates:
-			if templatename == "-":
-				templatesource = sys.stdin.read()
-				templatename = "stdin"
-			else:
-				with open(templatename, "r", encoding=args.encoding) as f:
-					templatesource = f.read()
-				templatename = os.path.basename(templatename)
-				if os.path.extsep in templatename:
-					templatename = templatename.rpartition(os.extsep)[0]
-			templatename = fixname(templatename)
-			if args.stacktrace == "short":
-				try:
-					template = ul4c.Template(templatesource, name=templatename, whitespace=args.whitespace)
-				except Exception as exc:
-					print_exception_chain(exc)
-					raise SystemExit(1)
-			else:
-				template = ul4c.Template(templatesource, name=templatename, whitespace=args.whitespace)
-			# The first template is the main template
-			if maintemplate is None:
-				maintemplate = template
-			templates[template.name] = template
+		if templates is None:
+			templates = self._load_templates(args)
+		maintemplate = templates[0]
+		templates = {template.name: template for template in templates}
+		if args.templatedir is not None:
+			templates = collections.ChainMap(templates, self._templateloader(args))
 		self.templates = templates
 
 		self.vars = dict(args.vars) if args.vars is not None else {}
@@ -608,6 +686,41 @@ class Globals:
 
 		return maintemplate
 
+	def _templateloader(self, args):
+		# Return the :class:`ll.ul4c.TemplateLoader` for the directory specified via :option:`--templatedir`
+		from ll import url
+		templatedir = url.URL(args.templatedir) if "://" in args.templatedir else url.Dir(args.templatedir)
+		return ul4c.TemplateLoader(templatedir, encoding=args.encoding, whitespace=args.whitespace)
+
+	def _template(self, source, name, whitespace):
+		# Compile the template :obj:`source`
+		return ul4c.Template(source, name=name, whitespace=whitespace)
+
+	def _load_templates(self, args):
+		# Load and compile the templates specified on the command line
+		templates = []
+		for templatename in args.templates:
+			if templatename == "-":
+				templatesource = sys.stdin.read()
+				templatename = "stdin"
+			else:
+				with open(templatename, "r", encoding=args.encoding) as f:
+					templatesource = f.read()
+				templatename = os.path.basename(templatename)
+				if os.path.extsep in templatename:
+					templatename = templatename.rpartition(os.extsep)[0]
+			templatename = fixname(templatename)
+			if args.stacktrace == "short":
+				try:
+					template = self._template(templatesource, templatename, args.whitespace)
+				except Exception as exc:
+					print_exception_chain(exc)
+					raise SystemExit(1)
+			else:
+				template = self._template(templatesource, templatename, args.whitespace)
+			templates.append(template)
+		return templates
+
 	def error(self, message, ast=None):
 		"""
 		Can be called to output an error message and abort template execution.
@@ -703,9 +816,10 @@ class Globals:
 
 			<?print globals.system("whoami")?>
 
-		will output the user name.
+		will output the user name. The command is executed with the environment
+		variables from :attr:`env`.
 		"""
-		return os.popen(cmd).read()
+		return subprocess.run(cmd, shell=True, stdout=subprocess.PIPE, env=self.env, universal_newlines=True).stdout
 
 	def load(self, filename, encoding="utf-8"):
 		"""
@@ -780,13 +894,360 @@ class Globals:
 		return (name, value)
 
 
-def main(args=None):
+def read_batch(stream, format):
+	"""
+	Iterate through the variable sets in the batch input :obj:`stream`.
+	:obj:`format` can be ``"json"`` (one JSON object per line) or ``"ul4on"``
+	(a sequence of UL4ON dumps of dictionaries).
+	"""
+	if format == "json":
+		for line in stream:
+			line = line.strip()
+			if line:
+				yield json.loads(line)
+	else:
+		from ll import ul4on
+		# :func:`ul4on.iterload` doesn't wait for more input than each record needs
+		yield from ul4on.iterload(stream)
+
+
+# State of a process rendering records in batch mode (see :func:`_batch_init`)
+_batch = None
+
+
+def _batch_init(argv, templatedump, vars=None):
+	# Initialize a process for rendering batch records: As the values defined via
+	# :option:`-D` (e.g. database connections) can't be passed to other processes
+	# the command line is parsed again. The templates are passed as an UL4ON dump
+	# (so they don't have to be compiled again). :obj:`vars` are the additional
+	# variables passed to :func:`run`.
+	from ll import ul4on
+	global _batch
 	globals = Globals()
+	args = argparser(globals).parse_args(argv)
+	maintemplate = globals.from_args(args, ul4on.loads(templatedump))
+	if vars is not None:
+		globals.vars.update(vars)
+	_batch = (args, globals, maintemplate)
+
+
+def _batch_render(item):
+	# Render the main template for the record :obj:`item` (a tuple ``(index, vars)``)
+	# and return a tuple ``(index, output, error)``. If the output is written to a
+	# file ``output`` is :const:`None`.
+	(index, vars) = item
+	(args, globals, maintemplate) = _batch
+	try:
+		if not isinstance(vars, dict):
+			raise TypeError("batch record must be a dictionary, not {}".format(misc.format_class(vars)))
+		recordglobals = copy.copy(globals)
+		recordglobals.vars = dict(globals.vars)
+		recordglobals.vars.update(vars)
+		output = maintemplate.renders(globals=recordglobals)
+		if args.batchoutput is not None:
+			filename = args.batchoutput.format(index, **dict(vars, index=index))
+			dirname = os.path.dirname(filename)
+			if dirname:
+				os.makedirs(dirname, exist_ok=True)
+			with open(filename, "w", encoding=args.encoding) as f:
+				f.write(output)
+			output = None
+		return (index, output, None)
+	except Exception as exc:
+		if args.stacktrace == "short":
+			error = "\n\n".join(misc.format_exception(exc) for exc in misc.exception_chain(exc))
+		else:
+			error = "".join(traceback.format_exception(type(exc), exc, exc.__traceback__))
+		return (index, None, error)
+
+
+def batch(argv, args, templates, vars=None):
+	"""
+	Render the main template for every variable set from the batch input
+	specified in :obj:`args` (using a pool of :obj:`args.jobs` processes).
+	:obj:`vars` can be a dictionary with additional variables for
+	``globals.vars`` (the variables from the batch records take precedence).
+	Returns the exit code.
+	"""
+	from ll import ul4on
+	templatedump = ul4on.dumps(templates)
+	if args.batch == "-":
+		stream = sys.stdin
+	else:
+		stream = open(args.batch, "r", encoding="utf-8")
+	errors = 0
+	with contextlib.ExitStack() as stack:
+		if args.batch != "-":
+			stack.enter_context(stream)
+		items = enumerate(read_batch(stream, args.batchformat))
+		if args.jobs == 1:
+			_batch_init(argv, templatedump, vars)
+			results = map(_batch_render, items)
+		else:
+			pool = stack.enter_context(multiprocessing.Pool(args.jobs, _batch_init, (argv, templatedump, vars)))
+			if args.ordered:
+				results = pool.imap(_batch_render, items)
+			else:
+				results = pool.imap_unordered(_batch_render, items)
+		for (index, output, error) in results:
+			if error is not None:
+				errors += 1
+				print("Error in batch record {}:".format(index), file=sys.stderr)
+				print(error, file=sys.stderr)
+				if args.onerror == "abort":
+					break
+			elif output is not None:
+				sys.stdout.write(output)
+	return 1 if errors else 0
+
+
+class ServerGlobals(Globals):
+	"""
+	The :class:`Globals` object used by :class:`Server` for rendering a
+	request. Compiled templates, template loaders and the database connections
+	created via :meth:`oracle`, :meth:`mysql` and :meth:`sqlite` are stored in
+	the :class:`Server` object :obj:`server` and are reused by later requests.
+
+	:obj:`env` is the environment of the client and is used by :meth:`system`.
+	Database connections however are created in the server process, so they
+	use the environment of the server (e.g. :envvar:`ORACLE_HOME`,
+	:envvar:`TNS_ADMIN`, :envvar:`NLS_LANG` and :envvar:`NLS_DATE_FORMAT` for
+	Oracle or :envvar:`MYSQL_HOST`, :envvar:`MYSQL_TCP_PORT` and
+	:envvar:`MYSQL_UNIX_PORT` for MySQL), because connections are shared
+	between clients.
+	"""
+
+	def __init__(self, server, env=None, **kwargs):
+		super().__init__(**kwargs)
+		self.server = server
+		if env is not None:
+			self.env = env
+
+	def _templateloader(self, args):
+		key = (os.path.abspath(args.templatedir) if "://" not in args.templatedir else args.templatedir, args.encoding, args.whitespace)
+		loader = self.server.loaders.get(key)
+		if loader is None:
+			loader = self.server.loaders[key] = super()._templateloader(args)
+		return loader
+
+	def _template(self, source, name, whitespace):
+		key = (name, whitespace)
+		entry = self.server.templates.get(key)
+		if entry is not None and entry[0] == source:
+			return entry[1]
+		template = super()._template(source, name, whitespace)
+		self.server.templates[key] = (source, template)
+		return template
+
+	def _connection(self, key, factory):
+		connection = self.server.connections.get(key)
+		if connection is None:
+			connection = self.server.connections[key] = factory()
+		return connection
+
+	def oracle(self, connectstring):
+		return self._connection(("oracle", connectstring), lambda: super(ServerGlobals, self).oracle(connectstring))
+
+	def mysql(self, connectstring):
+		return self._connection(("mysql", connectstring), lambda: super(ServerGlobals, self).mysql(connectstring))
+
+	def sqlite(self, connectstring):
+		if connectstring in ("", ":memory:"):
+			# Temporary databases can't be shared between requests
+			return super().sqlite(connectstring)
+		connectstring = os.path.abspath(connectstring)
+		return self._connection(("sqlite", connectstring), lambda: super(ServerGlobals, self).sqlite(connectstring))
+
+
+class _RemoteStream(io.TextIOBase):
+	# Replaces :obj:`sys.stdout`/:obj:`sys.stderr` while the server renders a
+	# request: The output is passed to the client in chunks (as messages for the
+	# channel :obj:`name`). Before anything is written, :obj:`before` (the stream
+	# for the other channel) will be flushed to keep the output in order.
+
+	def __init__(self, send, name, encoding, chunksize, before=None):
+		self._writer = ul4c.ChunkWriter(lambda s: send([name, s]), chunksize)
+		self._encoding = encoding
+		self._before = before
+
+	@property
+	def encoding(self):
+		return self._encoding
+
+	def writable(self):
+		return True
+
+	def write(self, s):
+		if self._before is not None:
+			self._before.flush()
+		self._writer.write(s)
+		return len(s)
+
+	def flush(self):
+		self._writer.flush()
+
+
+class Server:
+	"""
+	A :class:`Server` renders templates for clients that connect to the Unix
+	domain socket :obj:`path` (see :option:`--serve` and :func:`client`).
+
+	The server keeps compiled templates and database connections between
+	requests. Requests are handled one after the other in the process of the
+	server, so the server changes into the working directory of the client and
+	replaces :obj:`sys.stdin`, :obj:`sys.stdout` and :obj:`sys.stderr` while
+	handling a request.
+
+	A request is a line containing the UL4ON dump of a dictionary with the keys
+	``argv`` (the command line arguments for :program:`rul4`), ``cwd`` (the
+	working directory of the client), ``env`` (the environment variables),
+	``encoding`` (the output encoding), ``stdin`` (the input for the template
+	file ``-`` or :const:`None`) and ``vars`` (a dictionary with additional
+	variables for ``globals.vars`` or :const:`None`). The response is a sequence
+	of lines containing UL4ON dumps of lists: ``["stdout", output]`` and
+	``["stderr", output]`` for the output of :program:`rul4` and finally
+	``["exit", exitcode]``.
+	"""
+
+	def __init__(self, path):
+		self.path = path
+		self.templates = {} # Maps ``(name, whitespace)`` to ``(source, template)``
+		self.loaders = {} # Maps ``(templatedir, encoding, whitespace)`` to :class:`ll.ul4c.TemplateLoader` objects
+		self.connections = {} # Maps ``(type, connectstring)`` to :class:`Connection` objects
+		self._server = None
+
+	def serve_forever(self):
+		"""
+		Listen on the socket and handle requests until :meth:`shutdown` is
+		called.
+		"""
+		import socket, socketserver
+		from ll import ul4on
+
+		# Remove the socket file if there's no server listening on it anymore
+		if os.path.exists(self.path):
+			with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+				try:
+					s.connect(self.path)
+				except ConnectionRefusedError:
+					os.unlink(self.path)
+
+		def handle(request, address, server):
+			with request.makefile("rwb") as f:
+				line = f.readline()
+				if line:
+					def send(message):
+						f.write((ul4on.dumps(message) + "\n").encode("utf-8"))
+						f.flush()
+					send(["exit", self.render(ul4on.loads(line.decode("utf-8")), send)])
+
+		self._server = socketserver.UnixStreamServer(self.path, handle)
+		try:
+			self._server.serve_forever()
+		finally:
+			self._server.server_close()
+			os.unlink(self.path)
 
+	def shutdown(self):
+		"""
+		Stop the server (this must be called from another thread than the one
+		running :meth:`serve_forever`).
+		"""
+		if self._server is not None:
+			self._server.shutdown()
+
+	def render(self, request, send):
+		"""
+		Handle the request :obj:`request` (a dictionary) and pass the output to
+		:obj:`send`. Returns the exit code.
+		"""
+		stdout = _RemoteStream(send, "stdout", request.get("encoding") or "utf-8", 8192)
+		stderr = _RemoteStream(send, "stderr", stdout.encoding, 0, stdout)
+		stdin = io.StringIO(request.get("stdin") or "")
+		cwd = os.getcwd()
+		(oldstdin, sys.stdin) = (sys.stdin, stdin)
+		try:
+			with contextlib.redirect_stdout(stdout), contextlib.redirect_stderr(stderr):
+				try:
+					os.chdir(request["cwd"])
+					globals = ServerGlobals(self, env=request.get("env"))
+					return run(request["argv"], globals, request.get("vars"))
+				except SystemExit as exc: # raised by :mod:`argparse`
+					if exc.code is None or isinstance(exc.code, int):
+						return exc.code or 0
+					print(exc.code, file=sys.stderr)
+					return 1
+				except Exception:
+					traceback.print_exc()
+					return 1
+				finally:
+					stdout.flush()
+		finally:
+			sys.stdin = oldstdin
+			os.chdir(cwd)
+			self._rollback()
+
+	def _rollback(self):
+		# Roll back all open transactions (as :program:`rul4` would do on exit),
+		# connections that don't work anymore will be dropped
+		for (key, connection) in list(self.connections.items()):
+			try:
+				connection.connection.rollback()
+			except Exception:
+				del self.connections[key]
+
+
+def client(path, argv, vars=None, stdout=None, stderr=None):
+	"""
+	Let the :program:`rul4` server listening on the Unix domain socket
+	:obj:`path` execute the command line :obj:`argv` (a list of arguments) and
+	write the output to :obj:`stdout` and :obj:`stderr` (which default to
+	:obj:`sys.stdout` and :obj:`sys.stderr`). If :obj:`vars` is not
+	:const:`None` it must be a dictionary with additional variables for
+	``globals.vars``. Returns the exit code.
+
+	If the argument ``-`` is used the template will be read from
+	:obj:`sys.stdin` and passed to the server.
+	"""
+	import socket
+	from ll import ul4on
+
+	if stdout is None:
+		stdout = sys.stdout
+	if stderr is None:
+		stderr = sys.stderr
+	request = dict(
+		argv=list(argv),
+		cwd=os.getcwd(),
+		env=dict(os.environ),
+		encoding=getattr(stdout, "encoding", None),
+		stdin=sys.stdin.read() if "-" in argv else None,
+		vars=vars,
+	)
+	with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+		s.connect(path)
+		with s.makefile("rwb") as f:
+			f.write((ul4on.dumps(request) + "\n").encode("utf-8"))
+			f.flush()
+			for line in f:
+				(channel, data) = ul4on.loads(line.decode("utf-8"))
+				if channel == "exit":
+					return data
+				(stdout if channel == "stdout" else stderr).write(data)
+	raise ConnectionError("connection to rul4 server at {!r} closed unexpectedly".format(path))
+
+
+def argparser(globals):
+	"""
+	Return the :class:`argparse.ArgumentParser` for the command line arguments
+	of :program:`rul4` (:obj:`globals` is used for creating the variables
+	defined via :option:`-D`).
+	"""
 	define = globals.define
 
 	p = argparse.ArgumentParser(description="render UL4 templates with access to Oracle, MySQL, SQLite or Redis databases", epilog="For more info see http://www.livinglogic.de/Python/scripts_rul4.html")
 	p.add_argument("templates", metavar="template", help="templates to be used (first template gets rendered)", nargs="+")
+	p.add_argument("-T", "--templatedir", dest="templatedir", help="Directory (or URL) containing additional templates that will be loaded on demand", default=None, metavar="DIRECTORY")
 	p.add_argument("-e", "--encoding", dest="encoding", help="Encoding for template sources (default %(default)s)", default="utf-8", metavar="ENCODING")
 	p.add_argument("-w", "--whitespace", dest="whitespace", help="How to treat whitespace in template sources? (default %(default)s)", choices=("keep", "strip", "smart"), default="smart")
 	p.add_argument("-t", "--stacktrace", dest="stacktrace", help="How to display stack traces in case of an error? (default %(default)s)", choices=("full", "short"), default="short")
@@ -798,22 +1259,85 @@ def main(args=None):
 	p.add_argument(      "--load", dest="load", help="Allow the templates to load data from arbitrary paths? (default %(default)s)", action=misc.FlagAction, default=True)
 	p.add_argument(      "--save", dest="save", help="Allow the templates to save data to arbitrary paths? (default %(default)s)", action=misc.FlagAction, default=True)
 	p.add_argument(      "--compile", dest="compile", help="Allow the templates access to the compile function? (default %(default)s)", action=misc.FlagAction, default=True)
+	p.add_argument(      "--profile", dest="profile", help="Output a profile of the template rendering to stderr? (default %(default)s)", action=misc.FlagAction, default=False)
 	p.add_argument("-D", "--define", dest="vars", metavar="var=value", help="Pass additional parameters to the template (can be specified multiple times).", action="append", type=define)
+	p.add_argument("-b", "--batch", dest="batch", help="Render the main template once for each variable set from this file ('-' for stdin)", default=None, metavar="FILE")
+	p.add_argument(      "--batchformat", dest="batchformat", help="Format of the batch input (default %(default)s)", choices=("json", "ul4on"), default="json")
+	p.add_argument(      "--batchoutput", dest="batchoutput", help="Filename pattern for the output of each batch record (e.g. 'out/{index}.html'; default: write to stdout)", default=None, metavar="PATTERN")
+	p.add_argument("-j", "--jobs", dest="jobs", help="Number of processes used in batch mode (default: number of CPUs)", type=int, default=None)
+	p.add_argument(      "--ordered", dest="ordered", help="Output batch results in input order? (default %(default)s)", action=misc.FlagAction, default=True)
+	p.add_argument(      "--onerror", dest="onerror", help="What to do if rendering a batch record fails? (default %(default)s)", choices=("continue", "abort"), default="continue")
+	# ``--serve`` and ``--connect`` are handled by :func:`main` before the other arguments are parsed
+	p.add_argument(      "--serve", dest="serve", help="Render templates for clients connecting to this Unix domain socket (all other arguments are ignored)", default=None, metavar="SOCKET")
+	p.add_argument(      "--connect", dest="connect", help="Let the rul4 server listening on this Unix domain socket do the rendering (default: $RUL4_SOCKET)", default=None, metavar="SOCKET")
+	return p
+
+
+def run(argv, globals, vars=None):
+	"""
+	Execute the :program:`rul4` command line :obj:`argv` (without
+	:option:`--serve` and :option:`--connect`) using the :class:`Globals`
+	object :obj:`globals`. :obj:`vars` can be a dictionary with additional
+	variables for ``globals.vars``. Returns the exit code.
+	"""
+	args = argparser(globals).parse_args(argv)
 
-	args = p.parse_args(args)
+	if args.batch is not None:
+		if args.jobs is None:
+			args.jobs = os.cpu_count() or 1
+		templates = globals._load_templates(args)
+		return batch(argv, args, templates, vars)
 
 	maintemplate = globals.from_args(args)
-
-	if args.stacktrace == "short":
-		try:
+	if vars is not None:
+		globals.vars.update(vars)
+
+	with contextlib.ExitStack() as stack:
+		if args.profile:
+			profiler = ul4c.Profiler()
+			# Write the report when the profiler is finished, even if rendering fails
+			stack.callback(lambda: sys.stderr.write(profiler.report()))
+			stack.enter_context(profiler)
+		if args.stacktrace == "short":
+			try:
+				for part in maintemplate.render(globals=globals):
+					sys.stdout.write(part)
+			except Exception as exc:
+				print_exception_chain(exc)
+				return 1
+		else:
 			for part in maintemplate.render(globals=globals):
 				sys.stdout.write(part)
-		except Exception as exc:
-			print_exception_chain(exc)
-			return 1
-	else:
-		for part in maintemplate.render(globals=globals):
-			sys.stdout.write(part)
+	return 0
+
+
+def main(args=None):
+	argv = sys.argv[1:] if args is None else list(args)
+
+	p = argparse.ArgumentParser(add_help=False, allow_abbrev=False)
+	p.add_argument("--serve", dest="serve", default=None)
+	p.add_argument("--connect", dest="connect", default=None)
+	(mode, argv) = p.parse_known_args(argv)
+
+	if mode.serve is not None:
+		server = Server(mode.serve)
+		try:
+			server.serve_forever()
+		except KeyboardInterrupt:
+			pass
+		return 0
+
+	connect = mode.connect if mode.connect is not None else os.environ.get("RUL4_SOCKET")
+	if connect:
+		try:
+			return client(connect, argv)
+		except (FileNotFoundError, ConnectionRefusedError) as exc:
+			# If the socket comes from the environment, fall back to rendering locally
+			if mode.connect is not None:
+				print("rul4: can't connect to server at {!r}: {}".format(connect, exc), file=sys.stderr)
+				return 1
+
+	return run(argv, Globals())
 
 
 if __name__ == "__main__":
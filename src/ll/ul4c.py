@@ -23,9 +23,7 @@ possible to implement template renderers in multiple programming languages.
 __docformat__ = "reStructuredText"
 
 
-import sys, re, os.path, types, datetime, urllib.parse as urlparse, json, collections, locale, itertools, random, functools, math, inspect, contextlib
-
-import antlr3
+import sys, re, os.path, types, codecs, time, datetime, urllib.parse as urlparse, json, collections, collections.abc, threading, locale, itertools, random, functools, math, inspect, contextlib, hashlib, tempfile, ast
 
 
 # Regular expression used for splitting dates in isoformat
@@ -70,6 +68,10 @@ def withcontext(f):
 error_underline = os.environ.get("LL_UL4_ERRORUNDERLINE", "~")[:1] or "~"
 
 
+# How the interpreter tracks the location of errors (see :func:`locationtracking`)
+_locationtracking = os.environ.get("LL_UL4_LOCATIONTRACKING", "eager")
+
+
 ###
 ### Exceptions
 ###
@@ -234,6 +236,8 @@ class Context:
 		self.vars = {}
 		self.indents = [] # Stack of additional indentations for the ``<?render?>`` tag
 		self.asts = [] # Call stack (of :class:`AST` objects)
+		profilers = getattr(_profiling, "profilers", None)
+		self.profiler = profilers[-1] if profilers else None # The :class:`Profiler` that records the evaluation of AST nodes (in this thread)
 
 	@classmethod
 	def makefunction(cls, f):
@@ -262,10 +266,578 @@ class Context:
 			self.vars = oldvars
 
 
+class ChunkWriter:
+	"""
+	A :class:`ChunkWriter` collects the strings passed to its :meth:`write`
+	method and passes them on to :obj:`target` (a stream or a callable) in
+	chunks of (at least) :obj:`chunksize` characters. This reduces the number
+	of calls to :obj:`target` when a template produces many small strings.
+
+	:meth:`flush` must be called to write the remaining output (this is done
+	automatically by :meth:`Template.renderto` and when the :class:`ChunkWriter`
+	is used as a context manager).
+	"""
+
+	def __init__(self, target, chunksize=8192):
+		self.target = target
+		self.chunksize = chunksize
+		self._write = getattr(target, "write", target)
+		self._buffer = []
+		self._size = 0
+
+	def write(self, s):
+		self._buffer.append(s)
+		self._size += len(s)
+		if self._size >= self.chunksize:
+			self.flush()
+
+	def flush(self):
+		"""
+		Pass the output collected so far to the target.
+		"""
+		if self._buffer:
+			chunk = "".join(self._buffer)
+			self._buffer = []
+			self._size = 0
+			self._write(chunk)
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, type, value, traceback):
+		self.flush()
+
+
+class _BytesWriter:
+	# Used by :meth:`Template.renderbytes` and :meth:`Template.iterbytes`:
+	# Collects the output strings, encodes them in chunks of (at least)
+	# :obj:`chunksize` characters and passes the resulting bytes to :obj:`write`
+
+	def __init__(self, write, encoding, chunksize):
+		if encoding == "xml":
+			from ll import xml_codec # registers the ``"xml"`` codec
+		self._encode = codecs.getincrementalencoder(encoding)().encode
+		self._write = write
+		self.chunksize = chunksize
+		self._buffer = []
+		self._size = 0
+
+	def write(self, s):
+		self._buffer.append(s)
+		self._size += len(s)
+		if self._size >= self.chunksize:
+			self._flush(False)
+
+	def _flush(self, final):
+		data = self._encode("".join(self._buffer), final)
+		self._buffer = []
+		self._size = 0
+		if data:
+			self._write(data)
+
+	def close(self):
+		self._flush(True)
+
+
+###
+### Asynchronous rendering
+###
+
+class _AsyncRenderCancelled(BaseException):
+	# Raised in the rendering thread when the consumer of :meth:`Template.render_async` has gone away
+	pass
+
+
+class _AsyncRender:
+	"""
+	The asynchronous iterator returned by :meth:`Template.render_async`.
+
+	The template is rendered by the synchronous renderer in a thread of its own
+	(not in an executor of the event loop: The rendering thread blocks while
+	waiting for awaits, which might themselves need the executor, e.g.
+	:meth:`loop.getaddrinfo`). Output is collected into chunks, which
+	are passed back to the event loop. When the template needs a value that
+	isn't available yet (an awaitable or the next item of an asynchronous
+	iterator) the rendering thread schedules the await in the event loop and
+	waits for the result (after passing on the output collected so far).
+	"""
+
+	chunksize = 8192 # Number of characters collected before a chunk is passed to the event loop
+	maxchunks = 16 # Number of chunks that may be pending before the rendering thread blocks
+
+	def __init__(self, template, args, kwargs):
+		self.template = template
+		self.args = args
+		self.kwargs = kwargs
+		self._loop = None
+		self._queue = None
+		self._future = None
+		self._semaphore = None
+		self._writer = None
+		self._cancelled = False
+		self._done = False
+
+	def __aiter__(self):
+		return self
+
+	async def __anext__(self):
+		import asyncio, threading
+		if self._done:
+			raise StopAsyncIteration
+		if self._queue is None:
+			self._loop = asyncio.get_event_loop()
+			self._queue = asyncio.Queue()
+			self._semaphore = threading.Semaphore(self.maxchunks)
+			self._future = self._loop.create_future()
+			threading.Thread(target=self._run, name="ul4c render_async", daemon=True).start()
+		chunk = await self._queue.get()
+		if chunk is None: # End of output
+			self._done = True
+			await self._future # Propagate exceptions
+			raise StopAsyncIteration
+		self._semaphore.release()
+		return chunk
+
+	async def aclose(self):
+		"""
+		Stop rendering the template (and wait until the rendering thread has
+		finished).
+		"""
+		self._done = True
+		self._cancel()
+		if self._future is not None:
+			await self._future
+
+	def _cancel(self):
+		self._cancelled = True
+		if self._semaphore is not None:
+			self._semaphore.release() # Wake up the rendering thread
+
+	def __del__(self):
+		if not self._done:
+			self._cancel()
+
+	def _run(self):
+		# Executed in the rendering thread
+		exception = None
+		try:
+			self._writer = ChunkWriter(self._send, self.chunksize)
+			context = Context()
+			vars = _makevars(self.template.signature, self.args, self.kwargs)
+			with context.replacevars(_AsyncVars(self, vars)):
+				self.template._rendertobound(context, self._writer.write)
+			self._writer.flush()
+		except _AsyncRenderCancelled:
+			pass
+		except BaseException as exc:
+			exception = exc
+		finally:
+			self._loop.call_soon_threadsafe(self._finish, exception)
+
+	def _finish(self, exception):
+		# Executed in the event loop when the rendering thread has finished
+		if exception is not None:
+			self._future.set_exception(exception)
+		else:
+			self._future.set_result(None)
+		self._queue.put_nowait(None)
+
+	def _send(self, chunk):
+		self._semaphore.acquire()
+		if self._cancelled:
+			raise _AsyncRenderCancelled()
+		self._loop.call_soon_threadsafe(self._queue.put_nowait, chunk)
+
+	def _await(self, coroutine):
+		# Wait for the result of :obj:`coroutine` (which will be executed in the event loop)
+		import asyncio
+		self._writer.flush()
+		result = asyncio.run_coroutine_threadsafe(coroutine, self._loop).result()
+		if self._cancelled:
+			raise _AsyncRenderCancelled()
+		return result
+
+	def resolve(self, value):
+		"""
+		Return the synchronous version of :obj:`value`: Awaitables are replaced
+		by their result, asynchronous iterators by synchronous iterators and
+		coroutine functions by normal functions.
+		"""
+		if inspect.isawaitable(value):
+			return self.resolve(self._await(_awaitresult(value)))
+		elif hasattr(value, "__aiter__"):
+			return _AsyncIterator(self, value.__aiter__())
+		elif inspect.iscoroutinefunction(value) or getattr(inspect, "isasyncgenfunction", bool)(value):
+			@functools.wraps(value)
+			def wrapper(*args, **kwargs):
+				return self.resolve(value(*args, **kwargs))
+			return wrapper
+		return value
+
+
+async def _awaitresult(awaitable):
+	return await awaitable
+
+
+async def _anext(iterator):
+	return await iterator.__anext__()
+
+
+class _AsyncIterator:
+	# Synchronous iterator that fetches the items of an asynchronous iterator from the event loop
+	def __init__(self, render, iterator):
+		self._render = render
+		self._iterator = iterator
+
+	def __iter__(self):
+		return self
+
+	def __next__(self):
+		try:
+			return self._render._await(_anext(self._iterator))
+		except StopAsyncIteration:
+			raise StopIteration
+
+
+class _AsyncVars(dict):
+	# Variables of a template rendered via :meth:`Template.render_async`: Values are resolved on first access
+	def __init__(self, render, vars):
+		super().__init__(vars)
+		self._render = render
+		self._resolved = set()
+
+	def __getitem__(self, key):
+		value = dict.__getitem__(self, key)
+		if key not in self._resolved:
+			value = self._render.resolve(value)
+			dict.__setitem__(self, key, value)
+			self._resolved.add(key)
+		return value
+
+	def __setitem__(self, key, value):
+		dict.__setitem__(self, key, value)
+		self._resolved.add(key)
+
+	def get(self, key, default=None):
+		try:
+			return self[key]
+		except KeyError:
+			return default
+
+
+###
+### Profiling
+###
+
+# The stack of active :class:`Profiler` objects of each thread is stored in the attribute ``profilers``
+_profiling = threading.local()
+
+# Number of active :class:`Profiler` objects in all threads. While there are
+# any, the profiling versions of the :meth:`eval` methods are installed.
+_profilercount = 0
+_profilerlock = threading.Lock()
+
+
+def _profiled(f):
+	# Return a version of the :meth:`eval` method :obj:`f` that records its calls and run time in ``context.profiler``
+	if inspect.isgeneratorfunction(f):
+		@functools.wraps(f)
+		def profiled(self, context, *args, **kwargs):
+			profiler = context.profiler
+			# Calls via ``super().eval()`` are part of the evaluation of the node that is already being recorded
+			if profiler is None or (profiler._stack and profiler._stack[-1][0] is self):
+				yield from f(self, context, *args, **kwargs)
+				return
+			profiler._count(self)
+			iterator = f(self, context, *args, **kwargs)
+			while True:
+				# Only the time spent inside the generator counts
+				profiler._start(self)
+				try:
+					output = next(iterator)
+				except StopIteration:
+					return
+				finally:
+					profiler._stop()
+				yield output
+	else:
+		@functools.wraps(f)
+		def profiled(self, context, *args, **kwargs):
+			profiler = context.profiler
+			if profiler is None or (profiler._stack and profiler._stack[-1][0] is self):
+				return f(self, context, *args, **kwargs)
+			profiler._count(self)
+			profiler._start(self)
+			try:
+				return f(self, context, *args, **kwargs)
+			finally:
+				profiler._stop()
+	profiled._unprofiled = f
+	return profiled
+
+
+def _swapprofiling(install):
+	# Install the profiling version of all :meth:`eval` methods (or restore the original ones)
+	classes = [Code]
+	while classes:
+		cls = classes.pop()
+		classes.extend(cls.__subclasses__())
+		value = vars(cls).get("eval")
+		if value is not None:
+			if install and not hasattr(value, "_unprofiled"):
+				setattr(cls, "eval", _profiled(value))
+			elif not install and hasattr(value, "_unprofiled"):
+				setattr(cls, "eval", value._unprofiled)
+
+
+class ProfileRecord:
+	"""
+	The profiling information for one AST node collected by a :class:`Profiler`.
+	"""
+
+	def __init__(self, node):
+		self.node = node
+		self.calls = 0 # Number of evaluations
+		self.cumtime = 0. # Time spent evaluating the node (including the nodes it evaluates)
+		self.owntime = 0. # Time spent evaluating the node (excluding the nodes it evaluates)
+
+	@property
+	def template(self):
+		"""
+		The template whose source contains the node.
+		"""
+		node = self.node
+		if isinstance(node, Text):
+			return node.template
+		elif getattr(node, "tag", None) is not None:
+			return node.tag.template
+		return node
+
+	@property
+	def pos(self):
+		"""
+		The position of the tag containing the node in the template source.
+		"""
+		node = self.node
+		if isinstance(node, Code) and node.tag is not None:
+			return node.tag.pos
+		return node.pos
+
+	def __repr__(self):
+		return "<{0.__class__.__module__}.{0.__class__.__qualname__} node={0.node!r} calls={0.calls!r} cumtime={0.cumtime!r} owntime={0.owntime!r} at {1:#x}>".format(self, id(self))
+
+
+class Profiler:
+	"""
+	A :class:`Profiler` records how often each AST node is evaluated and how
+	much time the evaluation takes. Profiling is active for all templates that
+	are rendered (or called) inside the ``with`` block (in the same thread,
+	templates rendered in other threads are neither recorded nor affected)::
+
+		with ul4c.Profiler() as profiler:
+			template.renders(data=data)
+		print(profiler.report())
+
+	Templates will be evaluated by the interpreter while profiling is active,
+	even if they use the ``"compiled"`` backend.
+
+	:obj:`timer` is the function used for getting the current time.
+	"""
+
+	def __init__(self, timer=time.perf_counter):
+		self.timer = timer
+		self.records = {} # Maps AST nodes to :class:`ProfileRecord` objects
+		self._stack = [] # Nodes that are currently being evaluated (as ``[node, starttime, time of child nodes]``)
+
+	def __enter__(self):
+		global _profilercount
+		with _profilerlock:
+			if not _profilercount:
+				_swapprofiling(True)
+			_profilercount += 1
+		try:
+			profilers = _profiling.profilers
+		except AttributeError:
+			profilers = _profiling.profilers = []
+		profilers.append(self)
+		return self
+
+	def __exit__(self, type, value, traceback):
+		global _profilercount
+		_profiling.profilers.remove(self)
+		with _profilerlock:
+			_profilercount -= 1
+			if not _profilercount:
+				_swapprofiling(False)
+
+	def _record(self, node):
+		try:
+			return self.records[node]
+		except KeyError:
+			record = self.records[node] = ProfileRecord(node)
+			return record
+
+	def _count(self, node):
+		self._record(node).calls += 1
+
+	def _start(self, node):
+		self._stack.append([node, self.timer(), 0.])
+
+	def _stop(self):
+		(node, start, childtime) = self._stack.pop()
+		elapsed = self.timer() - start
+		record = self._record(node)
+		record.owntime += elapsed - childtime
+		# Don't count recursive evaluations twice
+		if not any(entry[0] is node for entry in self._stack):
+			record.cumtime += elapsed
+		if self._stack:
+			self._stack[-1][2] += elapsed
+
+	def stats(self):
+		"""
+		Return a list of :class:`ProfileRecord` objects sorted by descending
+		:attr:`owntime`.
+		"""
+		return sorted(self.records.values(), key=lambda record: record.owntime, reverse=True)
+
+	def report(self, hotspots=10):
+		"""
+		Return a report of the collected information as a string.
+
+		The report starts with a list of the :obj:`hotspots` AST nodes with the
+		most time spent in them. Then the source of each template is output
+		where each line is annotated with the number of evaluations, the own time
+		and the cumulative time of the tags starting in this line.
+		"""
+		records = self.stats()
+		total = sum(record.owntime for record in records) or 1.
+		lines = []
+
+		lines.append("Hot spots:")
+		lines.append("{:>10} {:>12} {:>7} {:>12}  {}".format("calls", "own ms", "own %", "cum ms", "location"))
+		for record in records[:hotspots]:
+			template = record.template
+			(line, col) = AST._linecol(template.source, record.pos)
+			if record.node is template:
+				text = ""
+			else:
+				text = " ".join(template.source[record.node.pos].split())
+				if len(text) > 40:
+					text = text[:37] + "..."
+			lines.append("{:>10,} {:>12.3f} {:>6.1f}% {:>12.3f}  {}:{}:{} {} {}".format(record.calls, record.owntime*1000, record.owntime/total*100, record.cumtime*1000, template.name, line, col, record.node.type, text))
+
+		# Group the records by tag (as tags contain nested nodes, the cumulative time of the tag is the maximum)
+		templates = collections.OrderedDict() # Maps top level templates to ``(record, tags)``
+		for record in records:
+			template = record.template
+			while template.parenttemplate is not None:
+				template = template.parenttemplate
+			(toprecord, tags) = templates.get(template, (None, {}))
+			if record.node is template:
+				toprecord = record
+			else:
+				key = record.pos.start
+				(calls, owntime, cumtime) = tags.get(key, (0, 0., 0.))
+				tags[key] = (max(calls, record.calls), owntime+record.owntime, max(cumtime, record.cumtime))
+			templates[template] = (toprecord, tags)
+
+		for (template, (toprecord, tags)) in templates.items():
+			# Group the tags by line
+			linestats = {}
+			for (start, (calls, owntime, cumtime)) in tags.items():
+				(line, col) = AST._linecol(template.source, slice(start, start))
+				(linecalls, lineowntime, linecumtime) = linestats.get(line, (0, 0., 0.))
+				linestats[line] = (max(linecalls, calls), lineowntime+owntime, linecumtime+cumtime)
+			lines.append("")
+			if toprecord is not None:
+				lines.append("Template {!r} ({:,} calls, {:.3f} ms):".format(template.name, toprecord.calls, toprecord.cumtime*1000))
+			else:
+				lines.append("Template {!r}:".format(template.name))
+			lines.append("{:>10} {:>12} {:>7} {:>12} | {}".format("calls", "own ms", "own %", "cum ms", "source"))
+			for (i, sourceline) in enumerate(template.source.splitlines(), 1):
+				if i in linestats:
+					(calls, owntime, cumtime) = linestats[i]
+					lines.append("{:>10,} {:>12.3f} {:>6.1f}% {:>12.3f} | {}".format(calls, owntime*1000, owntime/total*100, cumtime*1000, sourceline))
+				else:
+					lines.append("{:>10} {:>12} {:>7} {:>12} | {}".format("", "", "", "", sourceline))
+		return "\n".join(lines) + "\n"
+
+
 ###
 ### Helper functions
 ###
 
+# Code objects of all methods decorated with :func:`_handleexpressioneval` or :func:`_handleoutputeval`
+_evalcodes = set()
+
+
+def _evaldecorator(f, wrapped):
+	# Register the undecorated method :obj:`f` and return the method to be used in the current location tracking mode
+	_evalcodes.add(f.__code__)
+	f._eager = wrapped
+	return f if _locationtracking == "lazy" else wrapped
+
+
+def _innermost(exc, node):
+	"""
+	Return the innermost AST node whose evaluation has been aborted by the
+	exception :obj:`exc` (or :obj:`node` if there is none).
+
+	This uses the frames of the traceback of :obj:`exc`, so it works without the
+	decorated :meth:`eval` methods (i.e. in ``"lazy"`` location tracking mode).
+	"""
+	# A :exc:`LocationError` already knows its location
+	if isinstance(exc, LocationError):
+		return node
+	tb = exc.__traceback__
+	while tb is not None:
+		frame = tb.tb_frame
+		if frame.f_code in _evalcodes:
+			self = frame.f_locals.get("self")
+			if isinstance(self, AST):
+				node = self
+		tb = tb.tb_next
+	return node
+
+
+def locationtracking(mode):
+	"""
+	Set how the interpreter tracks the location of errors and return the
+	previous mode. :obj:`mode` can be:
+
+	``"eager"``
+		Every AST node wraps its evaluation in an exception handler that
+		converts exceptions into :exc:`LocationError` objects (and maintains the
+		stack :obj:`Context.asts`).
+
+	``"lazy"``
+		The AST nodes are evaluated without any overhead. When an exception
+		happens, the node where it happened is determined from the traceback.
+
+	The resulting :exc:`LocationError` exceptions are the same in both modes.
+	The initial mode can be set with the environment variable
+	``LL_UL4_LOCATIONTRACKING``.
+	"""
+	global _locationtracking
+	if mode not in ("eager", "lazy"):
+		raise ValueError("location tracking mode {!r} unknown".format(mode))
+	oldmode = _locationtracking
+	_locationtracking = mode
+	classes = [AST]
+	while classes:
+		cls = classes.pop()
+		classes.extend(cls.__subclasses__())
+		for (name, value) in list(vars(cls).items()):
+			if hasattr(value, "_eager"): # the undecorated method
+				if mode == "eager":
+					setattr(cls, name, value._eager)
+			elif hasattr(value, "__wrapped__") and getattr(value.__wrapped__, "_eager", None) is value: # the decorated method
+				if mode == "lazy":
+					setattr(cls, name, value.__wrapped__)
+	return oldmode
+
+
 def _handleexpressioneval(f):
 	"""
 	Decorator for an implementation of the :meth:`eval` method that does not
@@ -290,7 +862,7 @@ def _handleexpressioneval(f):
 			raise LocationError(self) from exc
 		finally:
 			context.asts.pop()
-	return wrapped
+	return _evaldecorator(f, wrapped)
 
 
 def _handleoutputeval(f):
@@ -317,7 +889,7 @@ def _handleoutputeval(f):
 			raise LocationError(self) from exc
 		finally:
 			context.asts.pop()
-	return wrapped
+	return _evaldecorator(f, wrapped)
 
 
 def _unpackvar(lvalue, value):
@@ -332,18 +904,49 @@ def _unpackvar(lvalue, value):
 	if isinstance(lvalue, AST):
 		yield (lvalue, value)
 	else:
-		# Materialize iterators on the right hand side, but protect against infinite iterators
-		if not isinstance(value, (tuple, list, str)):
-			# If we get one item more than required, we have an error
-			# Also :func:`islice` might fail if the right hand side isn't iterable (e.g. ``(a, b) = 42``)
-			value = list(itertools.islice(value, len(lvalue)+1))
-		if len(lvalue) != len(value):
-			# The number of variables on the left hand side doesn't match the number of values on the right hand side
-			raise TypeError("need {} value{} to unpack".format(len(lvalue), "s" if len(lvalue) != 1 else ""))
+		value = _unpackitems(value, len(lvalue))
 		for (lvalue, value) in zip(lvalue, value):
 			yield from _unpackvar(lvalue, value)
 
 
+def _unpackitems(value, count):
+	"""
+	Return the items of :obj:`value` as a sequence of exactly :obj:`count`
+	items (for unpacking them into :obj:`count` variables).
+
+	If the number of items doesn't match :obj:`count` a :exc:`TypeError` will
+	be raised.
+	"""
+	# Materialize iterators on the right hand side, but protect against infinite iterators
+	if not isinstance(value, (tuple, list, str)):
+		# If we get one item more than required, we have an error
+		# Also :func:`islice` might fail if the right hand side isn't iterable (e.g. ``(a, b) = 42``)
+		value = list(itertools.islice(value, count+1))
+	if count != len(value):
+		# The number of variables on the left hand side doesn't match the number of values on the right hand side
+		raise TypeError("need {} value{} to unpack".format(count, "s" if count != 1 else ""))
+	return value
+
+
+def _unpackkwargs(kwargs, item):
+	"""
+	Add the keyword arguments from the ``**`` argument :obj:`item` to the
+	keyword argument dictionary :obj:`kwargs`.
+
+	:obj:`item` may be a mapping or an iterable of (key, value) pairs.
+	"""
+	if hasattr(item, "keys"):
+		for key in item:
+			if key in kwargs:
+				raise SyntaxError("duplicate keyword argument {!r}".format(key))
+			kwargs[key] = item[key]
+	else:
+		for (key, value) in item:
+			if key in kwargs:
+				raise SyntaxError("duplicate keyword argument {!r}".format(key))
+			kwargs[key] = value
+
+
 def _makevars(signature, args, kwargs):
 	"""
 	Bind :obj:`args` and :obj:`kwargs` to the :class:`inspect.Signature` object
@@ -373,6 +976,66 @@ def _makevars(signature, args, kwargs):
 		return vars.arguments
 
 
+def _signatureplan(signature):
+	"""
+	Return a function that binds positional and keyword arguments to the
+	:class:`inspect.Signature` object :obj:`signature` (or ``None``) in the same
+	way as :func:`_makevars` does, i.e. the function must be called with a tuple
+	of positional arguments and a dictionary of keyword arguments and returns
+	the argument dictionary.
+
+	The work of analyzing the signature is done once in advance, so this is
+	faster than calling :func:`_makevars` when the same signature is used
+	repeatedly. For signatures that the plan can't handle and for calls that
+	don't match the signature (i.e. that raise an exception) :func:`_makevars`
+	is used.
+	"""
+	if signature is None:
+		return functools.partial(_makevars, None)
+
+	positional = [] # List of ``(name, default)`` tuples
+	varargs = varkwargs = None
+	for param in signature.parameters.values():
+		if param.kind is inspect.Parameter.POSITIONAL_OR_KEYWORD and varargs is None and varkwargs is None:
+			positional.append((param.name, param.default))
+		elif param.kind is inspect.Parameter.VAR_POSITIONAL and varargs is None and varkwargs is None:
+			varargs = param.name
+		elif param.kind is inspect.Parameter.VAR_KEYWORD:
+			varkwargs = param.name
+		else:
+			return functools.partial(_makevars, signature)
+
+	count = len(positional)
+	names = {name for (name, default) in positional}
+	empty = inspect.Parameter.empty
+
+	def bind(args, kwargs):
+		if len(args) > count and varargs is None:
+			return _makevars(signature, args, kwargs)
+		vars = {}
+		used = 0
+		for (i, (name, default)) in enumerate(positional):
+			if i < len(args):
+				if name in kwargs:
+					return _makevars(signature, args, kwargs)
+				vars[name] = args[i]
+			elif name in kwargs:
+				vars[name] = kwargs[name]
+				used += 1
+			elif default is not empty:
+				vars[name] = default
+			else:
+				return _makevars(signature, args, kwargs)
+		if varargs is not None:
+			vars[varargs] = tuple(args[count:])
+		if varkwargs is not None:
+			vars[varkwargs] = {key: value for (key, value) in kwargs.items() if key not in names} if used < len(kwargs) else {}
+		elif used < len(kwargs):
+			return _makevars(signature, args, kwargs)
+		return vars
+	return bind
+
+
 def _ul4getattr(obj, name):
 	"""
 	Return the attribute :obj:`name` of the object :obj`obj` and honor 
@@ -606,6 +1269,695 @@ def _xmlescape(obj):
 		return misc.xmlescape(str(obj))
 
 
+# Attributes of AST nodes that reference enclosing nodes instead of nodes contained in them
+_parentattrs = {"tag", "template", "parenttemplate", "endtag"}
+
+
+_slotnames = {}
+
+
+def _attrs(node):
+	# Return an iterator over the ``(name, value)`` pairs of the public attributes of the AST node :obj:`node`
+	# (i.e. the values of all slots and the content of the instance dictionary (for :class:`Template`)).
+	# Private attributes (like caches) are skipped.
+	cls = type(node)
+	try:
+		names = _slotnames[cls]
+	except KeyError:
+		names = _slotnames[cls] = tuple(name for c in reversed(cls.__mro__) for name in c.__dict__.get("__slots__", ()) if not name.startswith("_"))
+	for name in names:
+		try:
+			yield (name, getattr(node, name))
+		except AttributeError: # unset slot
+			pass
+	for (name, value) in getattr(node, "__dict__", {}).items():
+		if not name.startswith("_"):
+			yield (name, value)
+
+
+def _flattennodes(value):
+	# Return an iterator over the AST nodes in :obj:`value` (which might be a node or a nested list/tuple of nodes)
+	if isinstance(value, AST):
+		yield value
+	elif type(value) in (list, tuple):
+		for item in value:
+			yield from _flattennodes(item)
+
+
+###
+### Python source code generation (for the ``"compiled"`` backend)
+###
+
+class PythonSource:
+	"""
+	A :class:`PythonSource` object generates the Python source code for a
+	template that will be used by the ``"compiled"`` backend.
+
+	Every AST node generates the code for itself in its method :meth:`_python`.
+	Expressions are flattened into assignments to temporary variables, so that
+	each operation that might fail can be wrapped in an exception handler that
+	produces the same :exc:`LocationError` as the interpreter does.
+
+	The source code defines a function ``factory`` that returns a dictionary
+	with the generated functions ``render`` (a generator that yields the output
+	of the template), ``write`` (which passes the output of the template to a
+	callable instead of yielding it) and ``call`` (which returns the return
+	value of the template).
+
+	Variables of the template are stored in local variables of the generated
+	functions ("slots") which are initialized from ``context.vars`` when the
+	function is entered. If the template contains code that accesses
+	``context.vars`` directly (local templates, comprehensions and calls of
+	objects that might get the context passed in, i.e. anything but builtin
+	functions that don't need the context) assignments will be written through
+	to ``context.vars`` too. After such a call the slots will be reloaded from
+	``context.vars``, so that changes made by the called object are visible.
+	"""
+
+	def __init__(self, template):
+		self.template = template
+		self.mode = None
+		self.level = 0
+		self._lines = []
+		self._asts = [] # AST nodes referenced by the generated code
+		self._ast2index = {}
+		self._consts = [] # Constants that don't have a Python literal
+		self._temps = 0
+		self._slots = {} # Maps variable names to the local variables used for them
+		self._assigned = set() # Names of variables that the template assigns to
+		self._dynamic = False # Must ``context.vars`` be kept up to date?
+		self._calls = [] # :class:`Call` nodes that might access ``context.vars``
+		self._reload = set() # ``id``s of the :class:`Call` nodes after which the slots must be reloaded
+		self._fallback = False # Are there nodes that are evaluated by the interpreter?
+		self._chained = 0 # Nesting level of :meth:`chainvars`
+		self._defined = set() # Names of variables that are known to be defined at the current point in the code
+		self._scope(template.content)
+		for node in self._calls:
+			if not self._builtincall(node):
+				self._dynamic = True
+				self._reload.add(id(node))
+		if self._fallback:
+			self._slots = {}
+		self._function("render")
+		self._function("write")
+		self._function("call")
+
+	def __str__(self):
+		lines = ["def factory(_asts, _consts):"]
+		for i in range(len(self._asts)):
+			lines.append("\t_ast{0} = _asts[{0}]".format(i))
+		for i in range(len(self._consts)):
+			lines.append("\t_const{0} = _consts[{0}]".format(i))
+		for (level, code) in self._lines:
+			lines.append("\t"*level + code)
+		lines.append("\treturn dict(render=render, write=write, call=call)")
+		return "\n".join(lines) + "\n"
+
+	def functions(self):
+		"""
+		Compile the source code and return the dictionary with the generated
+		functions.
+		"""
+		name = repr(self.template.name) if self.template.name is not None else "(unnamed)"
+		code = compile(str(self), "<ul4 template {}>".format(name), "exec")
+		namespace = {}
+		exec(code, globals(), namespace)
+		return namespace["factory"](self._asts, self._consts)
+
+	def _scope(self, nodes):
+		# Collect the names of the variables used in :obj:`nodes` and check
+		# whether there's code that uses ``context.vars`` directly
+		for node in nodes:
+			if isinstance(node, Var):
+				self._slots.setdefault(node.name, "_v{}".format(len(self._slots)+1))
+			elif isinstance(node, (SetVar, ChangeVar)):
+				self._lvalue(node.lvalue)
+			elif isinstance(node, ForBlock):
+				self._lvalue(node.varname)
+			elif isinstance(node, Template):
+				# A local template references ``context.vars``, we don't have to look into it,
+				# as it will be compiled separately
+				self._dynamic = True
+				self._assigned.add(node.name)
+				self._slots.setdefault(node.name, "_v{}".format(len(self._slots)+1))
+				continue
+			elif isinstance(node, (ListComp, SetComp, DictComp, GenExpr)):
+				self._dynamic = True
+			elif isinstance(node, Call):
+				self._calls.append(node)
+			elif type(node)._python is AST._python and not isinstance(node, (SeqItem, UnpackSeqItem, DictItem, UnpackDictItem, PosArg, KeywordArg, UnpackListArg, UnpackDictArg)):
+				# Items and arguments generate their code via their container/call
+				self._fallback = True
+			self._scope(node._subnodes())
+
+	def _builtincall(self, node):
+		# Is :obj:`node` a call of a builtin function that doesn't get the context passed in?
+		# (This can only be decided once all assignments have been collected)
+		if isinstance(node, Render) or not isinstance(node.obj, Var) or node.obj.name in self._assigned:
+			return False
+		function = Context.functions.get(node.obj.name)
+		return function is not None and not getattr(function, "ul4context", False)
+
+	def _lvalue(self, lvalue):
+		if isinstance(lvalue, Var):
+			self._assigned.add(lvalue.name)
+		elif not isinstance(lvalue, AST):
+			for item in lvalue:
+				self._lvalue(item)
+
+	def _function(self, mode):
+		self.mode = mode
+		self.level = 1
+		if mode == "write":
+			self.line("def write(context, _write):")
+		else:
+			self.line("def {}(context):".format(mode))
+		self.level += 1
+		self.line("vars = context.vars")
+		# Parameters of the template are always defined
+		self._defined = set()
+		signature = self.template.signature
+		if isinstance(signature, inspect.Signature):
+			self._defined.update(signature.parameters)
+		elif isinstance(signature, Signature):
+			self._defined.update(name.lstrip("*") for (name, default) in signature.params)
+		self._loadslots()
+		if mode == "render":
+			self.line("if 0: yield # make this a generator")
+		with self.guard(self.template):
+			self.body(self.template.content)
+
+	def _loadslots(self):
+		for (name, slot) in self._slots.items():
+			self.line("{} = vars.get({!r}, _defaultitem)".format(slot, name))
+			# Variables that are never assigned to can be resolved completely here
+			if name not in self._assigned:
+				self.line("if {} is _defaultitem:".format(slot))
+				self.line("\t{} = context.functions.get({!r}, _defaultitem)".format(slot, name))
+				self.line("\tif {} is _defaultitem:".format(slot))
+				self.line("\t\t{} = UndefinedVariable({!r})".format(slot, name))
+
+	def reloadslots(self, node):
+		"""
+		Generate the code for reloading the slots from ``vars`` after the call
+		:obj:`node`, if the called object might have changed ``context.vars``.
+		"""
+		# Inside of comprehensions assignments go to the inner ``ChainMap`` and the slots aren't used
+		if id(node) in self._reload and not self._chained:
+			self._loadslots()
+			# The called object might have deleted variables
+			self._defined = set()
+
+	def line(self, code):
+		"""
+		Add the line of code :obj:`code` at the current indentation level.
+		"""
+		self._lines.append((self.level, code))
+
+	def temp(self):
+		"""
+		Return the name of a new temporary variable.
+		"""
+		self._temps += 1
+		return "_t{}".format(self._temps)
+
+	def ast(self, node):
+		"""
+		Return the name of the variable that references the AST node :obj:`node`
+		in the generated code.
+		"""
+		key = id(node)
+		try:
+			index = self._ast2index[key]
+		except KeyError:
+			index = self._ast2index[key] = len(self._asts)
+			self._asts.append(node)
+		return "_ast{}".format(index)
+
+	def slot(self, name):
+		"""
+		Return the name of the local variable used for the template variable
+		:obj:`name` or :const:`None` if the variable must be accessed via
+		``vars``.
+		"""
+		if self._chained:
+			return None
+		return self._slots.get(name)
+
+	def storeslot(self, name, value):
+		"""
+		Generate the code for storing :obj:`value` (a Python expression) in the
+		slot for the variable :obj:`name` (and in ``vars`` if required).
+		"""
+		if self._dynamic:
+			self.line("{} = vars[{!r}] = {}".format(self.slot(name), name, value))
+		else:
+			self.line("{} = {}".format(self.slot(name), value))
+		self._defined.add(name)
+
+	def const(self, value):
+		"""
+		Return a Python expression for the constant :obj:`value`.
+		"""
+		if type(value) in (type(None), bool, int, str) or (type(value) is float and math.isfinite(value)):
+			return repr(value)
+		self._consts.append(value)
+		return "_const{}".format(len(self._consts)-1)
+
+	def expr(self, node):
+		"""
+		Generate the code for evaluating the expression :obj:`node` and return a
+		Python expression for the result.
+		"""
+		return node._python(self)
+
+	def body(self, nodes):
+		"""
+		Generate the code for the sequence of AST nodes :obj:`nodes` as the body
+		of a Python block statement.
+		"""
+		count = len(self._lines)
+		defined = set(self._defined)
+		for node in nodes:
+			node._python(self)
+		if len(self._lines) == count:
+			self.line("pass")
+		# Assignments in the block might not have been executed
+		self._defined = defined
+
+	@contextlib.contextmanager
+	def guard(self, node, stopiteration=None):
+		"""
+		Wrap the code generated in the ``with`` block in an exception handler that
+		reports exceptions at the location of the AST node :obj:`node`.
+
+		If :obj:`stopiteration` is not :const:`None` it is a line of code that
+		will be executed when the code raises a :exc:`StopIteration`.
+		"""
+		self.line("try:")
+		self.level += 1
+		yield
+		self.level -= 1
+		if stopiteration is not None:
+			self.line("except StopIteration:")
+			self.line("\t" + stopiteration)
+		self.line("except LocationError:")
+		self.line("\traise")
+		self.line("except Exception as exc:")
+		self.line("\traise LocationError(_innermost(exc, {})) from exc".format(self.ast(node)))
+
+	@contextlib.contextmanager
+	def chainvars(self):
+		"""
+		Execute the code generated in the ``with`` block with a new set of local
+		variables (that is chained to the current one).
+		"""
+		oldvars = self.temp()
+		self.line("{} = vars".format(oldvars))
+		self.line("vars = context.vars = collections.ChainMap({}, vars)")
+		self.line("try:")
+		self.level += 1
+		self._chained += 1
+		yield
+		self._chained -= 1
+		self.level -= 1
+		self.line("finally:")
+		self.line("\tvars = context.vars = {}".format(oldvars))
+
+	def truth(self, value, valuenode, node):
+		"""
+		Return a Python expression for the truth value of :obj:`value` (which is
+		the result of the AST node :obj:`valuenode`). Errors will be reported at
+		the location of :obj:`node`.
+		"""
+		if isinstance(valuenode, (Not, Is, IsNot)):
+			return value
+		result = self.temp()
+		with self.guard(node):
+			self.line("{} = True if {} else False".format(result, value))
+		return result
+
+	def loop(self, iterator, node):
+		"""
+		Generate the head of a loop over the iterator :obj:`iterator`. Returns
+		the variable that contains the current item.
+
+		The caller is responsible for generating the body of the loop and
+		decrementing the indentation level afterwards.
+		"""
+		item = self.temp()
+		self.line("while True:")
+		self.level += 1
+		with self.guard(node, stopiteration="break"):
+			self.line("{} = next({})".format(item, iterator))
+		return item
+
+	def comprehension(self, node, container, add):
+		"""
+		Generate the code for the comprehension :obj:`node` iterating through
+		:obj:`container` (a Python expression). :obj:`add` will be called without
+		arguments to generate the code for the item.
+		"""
+		with self.chainvars():
+			iterator = self.temp()
+			with self.guard(node):
+				self.line("{} = iter({})".format(iterator, container))
+			item = self.loop(iterator, node)
+			self.assign(node.varname, item, node)
+			if node.condition is not None:
+				condition = self.expr(node.condition)
+				self.line("if {}:".format(self.truth(condition, node.condition, node)))
+				self.level += 1
+			add()
+			if node.condition is not None:
+				self.level -= 1
+			self.level -= 1
+
+	def assign(self, lvalue, value, node):
+		"""
+		Generate the code that assigns the Python expression :obj:`value` to the
+		left hand side :obj:`lvalue` (an AST node or a nested list of AST nodes).
+		Unpacking errors will be reported at the location of :obj:`node`.
+		"""
+		if isinstance(lvalue, AST):
+			lvalue._pythonassign(self, value)
+		else:
+			for (lvalue, value) in zip(lvalue, self._unpack(lvalue, value, node)):
+				self.assign(lvalue, value, node)
+
+	def modify(self, lvalue, operator, value, node):
+		"""
+		Like :meth:`assign`, but for augmented assigment with the :class:`Binary`
+		subclass :obj:`operator`.
+		"""
+		if isinstance(lvalue, AST):
+			lvalue._pythonmodify(self, operator, value)
+		else:
+			for (lvalue, value) in zip(lvalue, self._unpack(lvalue, value, node)):
+				self.modify(lvalue, operator, value, node)
+
+	def _unpack(self, lvalue, value, node):
+		items = [self.temp() for item in lvalue]
+		with self.guard(node):
+			if items:
+				self.line("({},) = _unpackitems({}, {})".format(", ".join(items), value, len(items)))
+			else:
+				self.line("_unpackitems({}, 0)".format(value))
+		return items
+
+	def aug(self, operator, obj1, obj2):
+		"""
+		Generate the code for the augmented assignment operator :obj:`operator`
+		(a :class:`Binary` subclass) applied to the Python expressions :obj:`obj1`
+		and :obj:`obj2`. Returns the variable containing the new value.
+		"""
+		result = self.temp()
+		if operator._pythonop is not None:
+			self.line("{} = {}".format(result, obj1))
+			self.line("{} {}= {}".format(result, operator._pythonop, obj2))
+		else:
+			self.line("{} = {}.evalfoldaug({}, {})".format(result, self.const(operator), obj1, obj2))
+		return result
+
+	def args(self, args):
+		"""
+		Generate the code for evaluating the arguments :obj:`args` of a call
+		(a list of :class:`PosArg`, :class:`KeywordArg`,
+		:class:`UnpackListArg` and :class:`UnpackDictArg` objects).
+
+		Returns a pair of Python expressions for the positional and keyword
+		arguments.
+		"""
+		simple = True
+		names = set()
+		for arg in args:
+			if isinstance(arg, KeywordArg):
+				if arg.name in names:
+					simple = False
+				names.add(arg.name)
+			elif not isinstance(arg, PosArg):
+				simple = False
+		if simple:
+			posargs = []
+			kwargs = []
+			for arg in args:
+				value = self.expr(arg.value)
+				if isinstance(arg, KeywordArg):
+					kwargs.append("{!r}: {}".format(arg.name, value))
+				else:
+					posargs.append(value)
+			return ("[{}]".format(", ".join(posargs)), "{{{}}}".format(", ".join(kwargs)))
+		else:
+			posargs = self.temp()
+			kwargs = self.temp()
+			self.line("{} = []".format(posargs))
+			self.line("{} = {{}}".format(kwargs))
+			for arg in args:
+				arg._pythoncall(self, posargs, kwargs)
+			return (posargs, kwargs)
+
+	def output(self, value):
+		"""
+		Generate the code for outputting the string :obj:`value` (a Python
+		expression).
+		"""
+		if self.mode == "render":
+			self.line("yield {}".format(value))
+		elif self.mode == "write":
+			self.line("_write({})".format(value))
+
+	def outputfrom(self, iterable):
+		"""
+		Generate the code for outputting all strings produced by the iterable
+		:obj:`iterable` (a Python expression).
+		"""
+		if self.mode == "render":
+			self.line("yield from {}".format(iterable))
+		elif self.mode == "write":
+			self.line("for _ in {}:".format(iterable))
+			self.line("\t_write(_)")
+		else:
+			self.line("for _ in {}:".format(iterable))
+			self.line("\tpass")
+
+	def returnvalue(self, value):
+		"""
+		Generate the code for returning the value :obj:`value` from the template.
+		"""
+		if self.mode in ("render", "write"):
+			self.line("return")
+		else:
+			self.line("return {}".format(value))
+
+
+###
+### AST optimizer
+###
+
+class Optimizer:
+	"""
+	An :class:`Optimizer` object optimizes the AST of the template
+	:obj:`template` in place:
+
+	*	Constant expressions are folded (this includes operators whose operands
+		became constant and ``and``/``or``/``if`` with a constant condition);
+
+	*	Unreachable blocks (e.g. ``<?if False?>`` or ``<?while False?>``) are
+		removed and blocks that are always executed are replaced by their
+		content;
+
+	*	Constant expressions used as statements are removed;
+
+	*	Adjacent literal text and ``<?print?>``/``<?printx?>`` tags with
+		constant values are merged into one node.
+
+	Blocks and text nodes created by the optimizer use existing node types,
+	so an optimized template can be serialized via UL4ON like any other.
+	"""
+
+	# Attributes referencing nodes that are not part of the subtree of the node
+	_skipattrs = {"tag", "template", "parenttemplate", "endtag", "content"}
+
+	def __init__(self, template):
+		self.template = template
+
+	def optimize(self):
+		"""
+		Optimize the template and return the number of AST nodes that have been
+		removed.
+		"""
+		count = self.count(self.template)
+		self.node(self.template)
+		return count - self.count(self.template)
+
+	@classmethod
+	def count(cls, node):
+		"""
+		Return the number of AST nodes in :obj:`node` (which might also be a list
+		or tuple of nodes).
+		"""
+		if isinstance(node, Const):
+			return 1
+		elif isinstance(node, AST):
+			count = 1
+			for (name, value) in _attrs(node):
+				if name not in cls._skipattrs:
+					count += cls.count(value)
+			if isinstance(node, Block):
+				count += cls.count(node.content)
+			return count
+		elif isinstance(node, (list, tuple)):
+			return sum(cls.count(item) for item in node)
+		return 0
+
+	def _value(self, value):
+		# Optimize the nodes in the attribute value :obj:`value`
+		if isinstance(value, AST):
+			return self.node(value)
+		elif isinstance(value, list):
+			return [self._value(item) for item in value]
+		elif isinstance(value, tuple):
+			return tuple(self._value(item) for item in value)
+		return value
+
+	@staticmethod
+	def _const(node):
+		return isinstance(node, Const) and not isinstance(node.value, Undefined)
+
+	def node(self, node):
+		"""
+		Optimize the AST node :obj:`node` and return the replacement for it.
+
+		This is either a node, :const:`None` (if the node can be removed) or a
+		list of nodes (if a block can be replaced by its content).
+		"""
+		if isinstance(node, Const):
+			return node
+		for (name, value) in list(_attrs(node)):
+			if name not in self._skipattrs:
+				newvalue = self._value(value)
+				if newvalue is not value:
+					setattr(node, name, newvalue)
+
+		if isinstance(node, CondBlock):
+			return self._condblock(node)
+		elif isinstance(node, Block):
+			node.content = self.block(node.content)
+			if isinstance(node, WhileBlock) and self._const(node.condition) and not node.condition.value:
+				return None
+			elif isinstance(node, ForBlock) and self._const(node.container) and isinstance(node.container.value, str) and not node.container.value:
+				return None
+		elif isinstance(node, And):
+			if self._const(node.obj1):
+				return node.obj2 if node.obj1.value else node.obj1
+		elif isinstance(node, Or):
+			if self._const(node.obj1):
+				return node.obj1 if node.obj1.value else node.obj2
+		elif isinstance(node, If):
+			return If.make(node.tag, node.pos, node.objif, node.objcond, node.objelse)
+		elif isinstance(node, Unary) and hasattr(node, "evalfold"):
+			return node.make(node.tag, node.pos, node.obj)
+		elif isinstance(node, Binary) and hasattr(node, "evalfold"):
+			return node.make(node.tag, node.pos, node.obj1, node.obj2)
+		return node
+
+	def _condblock(self, node):
+		blocks = []
+		for block in node.content:
+			if not isinstance(block, ElseBlock):
+				block.condition = self.node(block.condition)
+			block.content = self.block(block.content)
+			if isinstance(block, ElseBlock) or self._const(block.condition):
+				if isinstance(block, ElseBlock) or block.condition.value:
+					# All following blocks are unreachable
+					if not blocks:
+						return block.content
+					elseblock = ElseBlock(block.tag, block.pos)
+					elseblock.content = block.content
+					elseblock.endtag = block.endtag
+					blocks.append(elseblock)
+					break
+			else:
+				blocks.append(block)
+		if not blocks:
+			return None
+		if not isinstance(blocks[0], IfBlock):
+			ifblock = IfBlock(blocks[0].tag, blocks[0].pos, blocks[0].condition)
+			ifblock.content = blocks[0].content
+			ifblock.endtag = blocks[0].endtag
+			blocks[0] = ifblock
+		node.content = blocks
+		return node
+
+	def block(self, content):
+		"""
+		Optimize the content of a block (i.e. the list :obj:`content`) and return
+		the new content.
+		"""
+		newcontent = []
+		for node in content:
+			node = self.node(node)
+			if isinstance(node, list):
+				newcontent.extend(node)
+			elif node is not None and not isinstance(node, Const):
+				newcontent.append(node)
+		return self._merge(newcontent)
+
+	@staticmethod
+	def _literal(node):
+		# Return the output of :obj:`node` if it is constant, else :const:`None`
+		if isinstance(node, Text):
+			return node.text
+		elif isinstance(node, Print) and isinstance(node.obj, Const):
+			return _str(node.obj.value)
+		elif isinstance(node, PrintX) and isinstance(node.obj, Const):
+			return _xmlescape(node.obj.value)
+		return None
+
+	def _merge(self, content):
+		# Merge runs of literal output in :obj:`content`
+		newcontent = []
+		run = []
+		for node in content:
+			text = self._literal(node)
+			# An :class:`Indent` outputs the current indentation first, so it must start a new run
+			if text is None or isinstance(node, Indent):
+				newcontent.extend(self._mergerun(run))
+				run = []
+			if text is None:
+				newcontent.append(node)
+			else:
+				run.append((node, text))
+		newcontent.extend(self._mergerun(run))
+		return newcontent
+
+	def _mergerun(self, run):
+		if not run:
+			return []
+		(first, text) = run[0]
+		text = "".join(text for (node, text) in run)
+		if isinstance(first, Indent):
+			if len(run) == 1:
+				return [first]
+			return [Indent(first.template, first.pos, text)]
+		elif not text:
+			return []
+		elif len(run) == 1 and isinstance(first, Text):
+			return [first]
+		prints = [node for (node, text) in run if not isinstance(node, Text)]
+		if prints:
+			node = prints[0]
+			return [Print(node.tag, node.pos, Const(node.tag, node.obj.pos, text))]
+		# Only text nodes: merge the ones that are adjacent in the source
+		merged = []
+		for (node, text) in run:
+			if merged and merged[-1].pos.stop == node.pos.start:
+				merged[-1] = Text(node.template, slice(merged[-1].pos.start, node.pos.stop))
+			else:
+				merged.append(node)
+		return merged
+
+
 ###
 ### Node classes for the abstract syntax tree
 ###
@@ -615,6 +1967,8 @@ class AST:
 	Base class for all syntax tree nodes.
 	"""
 
+	__slots__ = ("_startpos", "_stoppos")
+
 	# Set of attributes available to UL4 templates
 	ul4attrs = {"type", "pos"}
 
@@ -625,6 +1979,21 @@ class AST:
 	def __init__(self, pos=None):
 		self.pos = pos
 
+	# The position is stored as two integers instead of a :class:`slice` object
+	# (which saves memory for large templates)
+	@property
+	def pos(self):
+		start = self._startpos
+		return slice(start, self._stoppos) if start is not None else None
+
+	@pos.setter
+	def pos(self, pos):
+		if pos is None:
+			self._startpos = self._stoppos = None
+		else:
+			self._startpos = pos.start
+			self._stoppos = pos.stop
+
 	@staticmethod
 	def _linecol(source, pos):
 		lastlinefeed = source.rfind("\n", 0, pos.start)
@@ -700,6 +2069,40 @@ class AST:
 		"""
 		pass
 
+	def _python(self, python):
+		"""
+		Generate the Python code for this node (for the ``"compiled"`` backend).
+
+		:obj:`python` is the :class:`PythonSource` object that collects the
+		code. For expressions this returns a Python expression for the value of
+		the node.
+
+		The default implementation delegates to the interpreter, i.e. it calls
+		:meth:`eval`.
+		"""
+		ast = python.ast(self)
+		if self.output:
+			python.outputfrom("{}.eval(context)".format(ast))
+		else:
+			result = python.temp()
+			python.line("{} = {}.eval(context)".format(result, ast))
+			return result
+
+	def _subnodes(self):
+		"""
+		Return an iterator over the AST nodes that are part of this node (i.e.
+		its operands or content), excluding references to enclosing nodes.
+		"""
+		for (name, value) in _attrs(self):
+			if name not in _parentattrs:
+				yield from _flattennodes(value)
+
+	def _pythonassign(self, python, value):
+		python.line("{}.evalset(context, {})".format(python.ast(self), value))
+
+	def _pythonmodify(self, python, operator, value):
+		python.line("{}.evalmodify(context, {}, {})".format(python.ast(self), python.const(operator), value))
+
 	def ul4ondump(self, encoder):
 		encoder.dump(self.pos)
 
@@ -713,6 +2116,8 @@ class Text(AST):
 	AST node for literal text.
 	"""
 
+	__slots__ = ("template",)
+
 	ul4attrs = AST.ul4attrs.union({"template", "text"})
 
 	output = True
@@ -734,7 +2139,7 @@ class Text(AST):
 
 	@property
 	def text(self):
-		return self.template.source[self.pos]
+		return self.template.source[self._startpos:self._stoppos]
 
 	def _str(self):
 		yield "text {!r}".format(self.text)
@@ -742,6 +2147,9 @@ class Text(AST):
 	def eval(self, context):
 		yield self.text
 
+	def _python(self, python):
+		python.output(repr(self.text))
+
 	def ul4ondump(self, encoder):
 		super().ul4ondump(encoder)
 		encoder.dump(self.template)
@@ -757,6 +2165,8 @@ class Indent(Text):
 	AST node for literal text that is an indentation at the start of the line.
 	"""
 
+	__slots__ = ("_text",)
+
 	def __init__(self, template=None, pos=None, text=None):
 		super().__init__(template, pos)
 		self._text = text
@@ -764,7 +2174,7 @@ class Indent(Text):
 	@property
 	def text(self):
 		if self._text is None:
-			return self.template.source[self.pos]
+			return self.template.source[self._startpos:self._stoppos]
 		else:
 			return self._text
 
@@ -789,6 +2199,10 @@ class Indent(Text):
 		yield from context.indents
 		yield self.text
 
+	def _python(self, python):
+		python.outputfrom("context.indents")
+		python.output(repr(self.text))
+
 
 @register("lineend")
 class LineEnd(Text):
@@ -796,6 +2210,8 @@ class LineEnd(Text):
 	AST node for literal text that is the end of a line.
 	"""
 
+	__slots__ = ()
+
 	def _str(self):
 		yield "lineend {!r}".format(self.text)
 
@@ -805,6 +2221,9 @@ class Tag(AST):
 	"""
 	A :class:`Tag` object is the location of a template tag in a template.
 	"""
+
+	__slots__ = ("template", "tag", "_startcodepos", "_stopcodepos")
+
 	ul4attrs = AST.ul4attrs.union({"template", "tag", "pos", "text", "code"})
 
 	def __init__(self, template=None, tag=None, tagpos=None, codepos=None):
@@ -830,11 +2249,24 @@ class Tag(AST):
 
 	@property
 	def text(self):
-		return self.template.source[self.pos]
+		return self.template.source[self._startpos:self._stoppos]
+
+	@property
+	def codepos(self):
+		start = self._startcodepos
+		return slice(start, self._stopcodepos) if start is not None else None
+
+	@codepos.setter
+	def codepos(self, codepos):
+		if codepos is None:
+			self._startcodepos = self._stopcodepos = None
+		else:
+			self._startcodepos = codepos.start
+			self._stopcodepos = codepos.stop
 
 	@property
 	def code(self):
-		return self.template.source[self.codepos]
+		return self.template.source[self._startcodepos:self._stopcodepos]
 
 	def ul4ondump(self, encoder):
 		super().ul4ondump(encoder)
@@ -854,6 +2286,8 @@ class Code(AST):
 	The base class of all AST nodes that appear inside a :class:`Tag`.
 	"""
 
+	__slots__ = ("tag",)
+
 	ul4attrs = AST.ul4attrs.union({"tag"})
 
 	def __init__(self, tag=None, pos=None):
@@ -867,7 +2301,7 @@ class Code(AST):
 
 	@property
 	def text(self):
-		return self.tag.template.source[self.pos]
+		return self.tag.template.source[self._startpos:self._stoppos]
 
 	def _str(self):
 		yield " ".join(self.text.splitlines(False))
@@ -886,6 +2320,9 @@ class Const(Code):
 	"""
 	Load a constant
 	"""
+
+	__slots__ = ("value",)
+
 	ul4attrs = Code.ul4attrs.union({"value"})
 
 	def __init__(self, tag=None, pos=None, value=None):
@@ -896,6 +2333,9 @@ class Const(Code):
 		# We don't need a decorator, because this can't fail anyway.
 		return self.value
 
+	def _python(self, python):
+		return python.const(self.value)
+
 	def ul4ondump(self, encoder):
 		super().ul4ondump(encoder)
 		encoder.dump(self.value)
@@ -921,6 +2361,8 @@ class SeqItem(Code):
 	AST node for an item in a list/set "literal"
 	"""
 
+	__slots__ = ("value",)
+
 	ul4attrs = Code.ul4attrs.union({"value"})
 
 	def __init__(self, tag=None, pos=None, value=None):
@@ -943,6 +2385,15 @@ class SeqItem(Code):
 	def eval_set(self, context, result):
 		result.add(self.value.eval(context))
 
+	def _pythonlist(self, python, result):
+		value = python.expr(self.value)
+		python.line("{}.append({})".format(result, value))
+
+	def _pythonset(self, python, result):
+		value = python.expr(self.value)
+		with python.guard(self):
+			python.line("{}.add({})".format(result, value))
+
 	def ul4ondump(self, encoder):
 		super().ul4ondump(encoder)
 		encoder.dump(self.value)
@@ -958,6 +2409,8 @@ class UnpackSeqItem(Code):
 	AST nodes for '*' unpacking expressions in a list/ set "literal".
 	"""
 
+	__slots__ = ("value",)
+
 	ul4attrs = Code.ul4attrs.union({"value"})
 
 	def __init__(self, tag=None, pos=None, value=None):
@@ -984,6 +2437,16 @@ class UnpackSeqItem(Code):
 		for item in self.value.eval(context):
 			result.add(item)
 
+	def _pythonlist(self, python, result):
+		value = python.expr(self.value)
+		with python.guard(self):
+			python.line("{}.extend({})".format(result, value))
+
+	def _pythonset(self, python, result):
+		value = python.expr(self.value)
+		with python.guard(self):
+			python.line("{}.update({})".format(result, value))
+
 	def ul4ondump(self, encoder):
 		super().ul4ondump(encoder)
 		encoder.dump(self.value)
@@ -999,6 +2462,8 @@ class DictItem(Code):
 	AST node for a dictionary key
 	"""
 
+	__slots__ = ("key", "value")
+
 	ul4attrs = Code.ul4attrs.union({"key", "value"})
 
 	def __init__(self, tag=None, pos=None, key=None, value=None):
@@ -1023,6 +2488,12 @@ class DictItem(Code):
 		value = self.value.eval(context)
 		result[key] = value
 
+	def _pythondict(self, python, result):
+		key = python.expr(self.key)
+		value = python.expr(self.value)
+		with python.guard(self):
+			python.line("{}[{}] = {}".format(result, key, value))
+
 	def ul4ondump(self, encoder):
 		super().ul4ondump(encoder)
 		encoder.dump(self.key)
@@ -1040,6 +2511,8 @@ class UnpackDictItem(Code):
 	AST nodes for '**' unpacking expressions in dict "literal".
 	"""
 
+	__slots__ = ("item",)
+
 	ul4attrs = Code.ul4attrs.union({"item"})
 
 	def __init__(self, tag=None, pos=None, item=None):
@@ -1058,6 +2531,11 @@ class UnpackDictItem(Code):
 	def eval_dict(self, context, result):
 		result.update(self.item.eval(context))
 
+	def _pythondict(self, python, result):
+		item = python.expr(self.item)
+		with python.guard(self):
+			python.line("{}.update({})".format(result, item))
+
 	def ul4ondump(self, encoder):
 		super().ul4ondump(encoder)
 		encoder.dump(self.item)
@@ -1075,6 +2553,8 @@ class PosArg(Code):
 	AST node for a positional argument
 	"""
 
+	__slots__ = ("value",)
+
 	ul4attrs = Code.ul4attrs.union({"value"})
 
 	def __init__(self, tag=None, pos=None, value=None):
@@ -1101,6 +2581,10 @@ class PosArg(Code):
 	def eval_call(self, context, args, kwargs):
 		args.append(self.value.eval(context))
 
+	def _pythoncall(self, python, args, kwargs):
+		value = python.expr(self.value)
+		python.line("{}.append({})".format(args, value))
+
 	def ul4ondump(self, encoder):
 		super().ul4ondump(encoder)
 		encoder.dump(self.value)
@@ -1116,6 +2600,8 @@ class KeywordArg(Code):
 	AST node for a keyword argument
 	"""
 
+	__slots__ = ("name", "value")
+
 	ul4attrs = Code.ul4attrs.union({"name", "value"})
 
 	def __init__(self, tag=None, pos=None, name=None, value=None):
@@ -1143,6 +2629,13 @@ class KeywordArg(Code):
 			raise SyntaxError("duplicate keyword argument {!r}".format(self.name))
 		kwargs[self.name] = self.value.eval(context)
 
+	def _pythoncall(self, python, args, kwargs):
+		with python.guard(self):
+			python.line("if {!r} in {}:".format(self.name, kwargs))
+			python.line("\traise SyntaxError({!r})".format("duplicate keyword argument {!r}".format(self.name)))
+		value = python.expr(self.value)
+		python.line("{}[{!r}] = {}".format(kwargs, self.name, value))
+
 	def ul4ondump(self, encoder):
 		super().ul4ondump(encoder)
 		encoder.dump(self.name)
@@ -1160,6 +2653,8 @@ class UnpackListArg(Code):
 	AST nodes for '*' unpacking expressions in calls.
 	"""
 
+	__slots__ = ("item",)
+
 	ul4attrs = Code.ul4attrs.union({"item"})
 
 	def __init__(self, tag=None, pos=None, item=None):
@@ -1185,6 +2680,11 @@ class UnpackListArg(Code):
 		for item in self.item.eval(context):
 			args.append(item)
 
+	def _pythoncall(self, python, args, kwargs):
+		item = python.expr(self.item)
+		with python.guard(self):
+			python.line("{}.extend({})".format(args, item))
+
 	def ul4ondump(self, encoder):
 		super().ul4ondump(encoder)
 		encoder.dump(self.item)
@@ -1200,6 +2700,8 @@ class UnpackDictArg(Code):
 	AST nodes for '**' unpacking expressions in calls.
 	"""
 
+	__slots__ = ("item",)
+
 	ul4attrs = Code.ul4attrs.union({"item"})
 
 	def __init__(self, tag=None, pos=None, item=None):
@@ -1219,17 +2721,12 @@ class UnpackDictArg(Code):
 
 	@_handleexpressioneval
 	def eval_call(self, context, args, kwargs):
-		item = self.item.eval(context)
-		if hasattr(item, "keys"):
-			for key in item:
-				if key in kwargs:
-					raise SyntaxError("duplicate keyword argument {!r}".format(key))
-				kwargs[key] = item[key]
-		else:
-			for (key, value) in item:
-				if key in kwargs:
-					raise SyntaxError("duplicate keyword argument {!r}".format(key))
-				kwargs[key] = value
+		_unpackkwargs(kwargs, self.item.eval(context))
+
+	def _pythoncall(self, python, args, kwargs):
+		item = python.expr(self.item)
+		with python.guard(self):
+			python.line("_unpackkwargs({}, {})".format(kwargs, item))
 
 	def ul4ondump(self, encoder):
 		super().ul4ondump(encoder)
@@ -1246,6 +2743,8 @@ class List(Code):
 	AST nodes for loading a list object.
 	"""
 
+	__slots__ = ("items",)
+
 	ul4attrs = Code.ul4attrs.union({"items"})
 
 	def __init__(self, tag=None, pos=None, *items):
@@ -1267,6 +2766,13 @@ class List(Code):
 			item.eval_list(context, result)
 		return result
 
+	def _python(self, python):
+		result = python.temp()
+		python.line("{} = []".format(result))
+		for item in self.items:
+			item._pythonlist(python, result)
+		return result
+
 	def ul4ondump(self, encoder):
 		super().ul4ondump(encoder)
 		encoder.dump(self.items)
@@ -1282,6 +2788,8 @@ class ListComp(Code):
 	AST node for list comprehension.
 	"""
 
+	__slots__ = ("item", "varname", "container", "condition")
+
 	ul4attrs = Code.ul4attrs.union({"item", "varname", "container", "condition"})
 
 	def __init__(self, tag=None, pos=None, item=None, varname=None, container=None, condition=None):
@@ -1328,6 +2836,16 @@ class ListComp(Code):
 					result.append(self.item.eval(context))
 			return result
 
+	def _python(self, python):
+		container = python.expr(self.container)
+		result = python.temp()
+		python.line("{} = []".format(result))
+		def add():
+			item = python.expr(self.item)
+			python.line("{}.append({})".format(result, item))
+		python.comprehension(self, container, add)
+		return result
+
 	def ul4ondump(self, encoder):
 		super().ul4ondump(encoder)
 		encoder.dump(self.item)
@@ -1349,6 +2867,8 @@ class Set(Code):
 	AST nodes for loading a set object.
 	"""
 
+	__slots__ = ("items",)
+
 	ul4attrs = Code.ul4attrs.union({"items"})
 
 	def __init__(self, tag=None, pos=None, *items):
@@ -1370,6 +2890,13 @@ class Set(Code):
 			item.eval_set(context, result)
 		return result
 
+	def _python(self, python):
+		result = python.temp()
+		python.line("{} = set()".format(result))
+		for item in self.items:
+			item._pythonset(python, result)
+		return result
+
 	def ul4ondump(self, encoder):
 		super().ul4ondump(encoder)
 		encoder.dump(self.items)
@@ -1385,6 +2912,8 @@ class SetComp(Code):
 	AST node for set comprehension.
 	"""
 
+	__slots__ = ("item", "varname", "container", "condition")
+
 	ul4attrs = Code.ul4attrs.union({"item", "varname", "container", "condition"})
 
 	def __init__(self, tag=None, pos=None, item=None, varname=None, container=None, condition=None):
@@ -1431,6 +2960,17 @@ class SetComp(Code):
 					result.add(self.item.eval(context))
 		return result
 
+	def _python(self, python):
+		container = python.expr(self.container)
+		result = python.temp()
+		python.line("{} = set()".format(result))
+		def add():
+			item = python.expr(self.item)
+			with python.guard(self):
+				python.line("{}.add({})".format(result, item))
+		python.comprehension(self, container, add)
+		return result
+
 	def ul4ondump(self, encoder):
 		super().ul4ondump(encoder)
 		encoder.dump(self.item)
@@ -1452,6 +2992,8 @@ class Dict(Code):
 	AST node for loading a dict object.
 	"""
 
+	__slots__ = ("items",)
+
 	ul4attrs = Code.ul4attrs.union({"items"})
 
 	def __init__(self, tag=None, pos=None, *items):
@@ -1473,6 +3015,13 @@ class Dict(Code):
 			item.eval_dict(context, result)
 		return result
 
+	def _python(self, python):
+		result = python.temp()
+		python.line("{} = ordereddict()".format(result))
+		for item in self.items:
+			item._pythondict(python, result)
+		return result
+
 	def ul4ondump(self, encoder):
 		super().ul4ondump(encoder)
 		encoder.dump(self.items)
@@ -1488,6 +3037,8 @@ class DictComp(Code):
 	AST node for dictionary comprehension.
 	"""
 
+	__slots__ = ("key", "value", "varname", "container", "condition")
+
 	ul4attrs = Code.ul4attrs.union({"key", "value", "varname", "container", "condition"})
 
 	def __init__(self, tag=None, pos=None, key=None, value=None, varname=None, container=None, condition=None):
@@ -1536,6 +3087,18 @@ class DictComp(Code):
 					result[self.key.eval(context)] = self.value.eval(context)
 			return result
 
+	def _python(self, python):
+		container = python.expr(self.container)
+		result = python.temp()
+		python.line("{} = ordereddict()".format(result))
+		def add():
+			key = python.expr(self.key)
+			value = python.expr(self.value)
+			with python.guard(self):
+				python.line("{}[{}] = {}".format(result, key, value))
+		python.comprehension(self, container, add)
+		return result
+
 	def ul4ondump(self, encoder):
 		super().ul4ondump(encoder)
 		encoder.dump(self.key)
@@ -1559,6 +3122,8 @@ class GenExpr(Code):
 	AST node for a generator expression.
 	"""
 
+	__slots__ = ("item", "varname", "container", "condition")
+
 	ul4attrs = Code.ul4attrs.union({"item", "varname", "container", "condition"})
 
 	def __init__(self, tag=None, pos=None, item=None, varname=None, container=None, condition=None):
@@ -1604,7 +3169,24 @@ class GenExpr(Code):
 			raise
 		except Exception as exc:
 			# Wrap original exception in another exception that shows the location
-			raise LocationError(self) from exc
+			raise LocationError(_innermost(exc, self)) from exc
+
+	def _python(self, python):
+		# The generator expression will be compiled into a local generator function
+		container = python.expr(self.container)
+		function = python.temp()
+		argument = python.temp()
+		python.line("def {}({}):".format(function, argument))
+		python.level += 1
+		python.line("vars = context.vars")
+		def add():
+			item = python.expr(self.item)
+			python.line("yield {}".format(item))
+		python.comprehension(self, argument, add)
+		python.level -= 1
+		result = python.temp()
+		python.line("{} = {}({})".format(result, function, container))
+		return result
 
 	def ul4ondump(self, encoder):
 		super().ul4ondump(encoder)
@@ -1627,6 +3209,8 @@ class Var(Code):
 	AST nodes for loading a variable.
 	"""
 
+	__slots__ = ("name",)
+
 	ul4attrs = Code.ul4attrs.union({"name"})
 
 	def __init__(self, tag=None, pos=None, name=None):
@@ -1659,6 +3243,44 @@ class Var(Code):
 	def evalmodify(self, context, operator, value):
 		context.vars[self.name] = operator.evalfoldaug(context.vars[self.name], value)
 
+	def _python(self, python):
+		slot = python.slot(self.name)
+		if slot is not None and (self.name not in python._assigned or self.name in python._defined):
+			if not python._reload:
+				return slot
+			# The slots might be reloaded by a call later in the same expression, so use a copy of the value
+			result = python.temp()
+			python.line("{} = {}".format(result, slot))
+			return result
+		result = python.temp()
+		if slot is not None:
+			python.line("{} = {}".format(result, slot))
+		else:
+			python.line("{} = vars.get({!r}, _defaultitem)".format(result, self.name))
+		python.line("if {} is _defaultitem:".format(result))
+		python.line("\t{} = context.functions.get({!r}, _defaultitem)".format(result, self.name))
+		python.line("\tif {} is _defaultitem:".format(result))
+		python.line("\t\t{} = UndefinedVariable({!r})".format(result, self.name))
+		return result
+
+	def _pythonassign(self, python, value):
+		if python.slot(self.name) is not None:
+			python.storeslot(self.name, value)
+		else:
+			python.line("vars[{!r}] = {}".format(self.name, value))
+
+	def _pythonmodify(self, python, operator, value):
+		slot = python.slot(self.name)
+		with python.guard(self):
+			if slot is not None:
+				python.line("if {} is _defaultitem:".format(slot))
+				python.line("\traise KeyError({!r})".format(self.name))
+				newvalue = python.aug(operator, slot, value)
+				python.storeslot(self.name, newvalue)
+			else:
+				newvalue = python.aug(operator, "vars[{!r}]".format(self.name), value)
+				python.line("vars[{!r}] = {}".format(self.name, newvalue))
+
 	def ul4ondump(self, encoder):
 		super().ul4ondump(encoder)
 		encoder.dump(self.name)
@@ -1677,6 +3299,8 @@ class Block(Code):
 	(e.g. a ``<?for?>`` block).
 	"""
 
+	__slots__ = ("endtag", "content")
+
 	output = True
 
 	ul4attrs = Code.ul4attrs.union({"endtag", "content"})
@@ -1705,6 +3329,10 @@ class Block(Code):
 			if node.output:
 				yield from result
 
+	def _python(self, python):
+		for node in self.content:
+			node._python(python)
+
 	def ul4ondump(self, encoder):
 		super().ul4ondump(encoder)
 		encoder.dump(self.endtag)
@@ -1725,6 +3353,9 @@ class CondBlock(Block):
 	followed by zero or more :class:`ElIfBlock` blocks followed by zero or one
 	:class:`ElseBlock` block.
 	"""
+
+	__slots__ = ()
+
 	def __init__(self, tag=None, pos=None, condition=None):
 		super().__init__(tag, pos)
 		if condition is not None:
@@ -1754,6 +3385,38 @@ class CondBlock(Block):
 				yield from node.eval(context)
 				break
 
+	def _python(self, python):
+		if len(self.content) == 1 or (len(self.content) == 2 and isinstance(self.content[1], ElseBlock)):
+			for node in self.content:
+				if isinstance(node, ElseBlock):
+					python.line("else:")
+				else:
+					condition = python.expr(node.condition)
+					python.line("if {}:".format(python.truth(condition, node.condition, self)))
+				python.level += 1
+				python.body(node.content)
+				python.level -= 1
+		else:
+			# Use a flag instead of nested ``else`` blocks, so that long
+			# ``<?elif?>`` chains don't exceed Python's nesting limit
+			done = python.temp()
+			python.line("{} = False".format(done))
+			for (i, node) in enumerate(self.content):
+				if i:
+					python.line("if not {}:".format(done))
+					python.level += 1
+				if isinstance(node, ElseBlock):
+					python.body(node.content)
+				else:
+					condition = python.expr(node.condition)
+					python.line("if {}:".format(python.truth(condition, node.condition, self)))
+					python.level += 1
+					python.line("{} = True".format(done))
+					python.body(node.content)
+					python.level -= 1
+				if i:
+					python.level -= 1
+
 
 @register("ifblock")
 class IfBlock(Block):
@@ -1761,6 +3424,8 @@ class IfBlock(Block):
 	AST node for an ``<?if?>`` block.
 	"""
 
+	__slots__ = ("condition",)
+
 	ul4attrs = Block.ul4attrs.union({"condition"})
 
 	def __init__(self, tag=None, pos=None, condition=None):
@@ -1802,6 +3467,8 @@ class ElIfBlock(Block):
 	AST node for an ``<?elif?>`` block.
 	"""
 
+	__slots__ = ("condition",)
+
 	ul4attrs = Block.ul4attrs.union({"condition"})
 
 	def __init__(self, tag=None, pos=None, condition=None):
@@ -1843,6 +3510,8 @@ class ElseBlock(Block):
 	AST node for an ``<?else?>`` block.
 	"""
 
+	__slots__ = ()
+
 	def _repr_pretty(self, p):
 		for node in self.content:
 			p.breakable()
@@ -1862,12 +3531,16 @@ class ForBlock(Block):
 	AST node for a ``<?for?>`` loop.
 	"""
 
+	__slots__ = ("varname", "container", "_plan")
+
 	ul4attrs = Block.ul4attrs.union({"varname", "container"})
 
 	def __init__(self, tag=None, pos=None, varname=None, container=None):
 		super().__init__(tag, pos)
 		self.varname = varname
 		self.container = container
+		# Plan for executing the loop (see :meth:`_makeplan`), created on first use
+		self._plan = None
 
 	def _repr(self):
 		yield "varname={!r}".format(self.varname)
@@ -1893,6 +3566,7 @@ class ForBlock(Block):
 		super().ul4onload(decoder)
 		self.varname = decoder.load()
 		self.container = decoder.load()
+		self._plan = None
 
 	def _str(self):
 		yield "for "
@@ -1903,21 +3577,145 @@ class ForBlock(Block):
 		yield from super()._str()
 		yield -1
 
+	# Functions producing tuples that :meth:`_evalenumerated` can handle without creating the tuples (and the size of these tuples)
+	_enumfunctions = {"enumerate": 2, "isfirstlast": 3, "enumfl": 4}
+
+	def _makeplan(self):
+		# Return a tuple ``(names, function)``: ``names`` is the variable name
+		# if the loop variable is a variable, a tuple of variable names if the
+		# items are unpacked into variables and ``None`` otherwise. If the
+		# container is a call to one of the functions in :obj:`_enumfunctions`
+		# and the items are unpacked into the right number of variables,
+		# ``function`` is the name of the function, else it is ``None``.
+		varname = self.varname
+		if isinstance(varname, Var):
+			return (varname.name, None)
+		elif isinstance(varname, AST) or not all(isinstance(lvalue, Var) for lvalue in varname):
+			return (None, None)
+		names = tuple(lvalue.name for lvalue in varname)
+		container = self.container
+		if type(container) is Call and isinstance(container.obj, Var) and self._enumfunctions.get(container.obj.name) == len(names):
+			return (names, container.obj.name)
+		return (names, None)
+
 	@_handleoutputeval
 	def eval(self, context):
-		container = self.container.eval(context)
+		plan = self._plan
+		if plan is None:
+			plan = self._plan = self._makeplan()
+		(names, function) = plan
+		if function is not None and context.profiler is None:
+			# Evaluate the call ourselves (like :meth:`Call.eval` would do), so that we can bypass the function if possible
+			call = self.container
+			obj = call.obj.eval(context)
+			(args, kwargs) = call._evalargs(context)
+			if obj is context.functions.get(function) and not kwargs and 1 <= len(args) <= (1 if function == "isfirstlast" else 2):
+				iterator = None
+				if function != "enumerate":
+					iterator = True # :func:`iter` will be called when the loop starts
+				elif len(args) == 1 or type(args[1]) is int:
+					try:
+						iterator = iter(args[0])
+					except Exception:
+						pass # Let :meth:`Call.evalcall` report the error
+				if iterator is not None:
+					yield from self._evalenumerated(context, function, names, args, iterator)
+					return
+			container = call.evalcall(context, obj, args, kwargs)
+		else:
+			container = self.container.eval(context)
 		if hasattr(container, "ul4attrs"):
 			container = container.ul4attrs
+		content = self.content
 		for item in container:
-			for (lvalue, value) in _unpackvar(self.varname, item):
-				lvalue.evalset(context, value)
+			if names is None:
+				for (lvalue, value) in _unpackvar(self.varname, item):
+					lvalue.evalset(context, value)
+			elif type(names) is str:
+				context.vars[names] = item
+			else:
+				vars = context.vars
+				for (name, value) in zip(names, _unpackitems(item, len(names))):
+					vars[name] = value
 			try:
-				yield from super().eval(context)
+				for node in content:
+					result = node.eval(context)
+					if node.output:
+						yield from result
 			except BreakException:
 				break
 			except ContinueException:
 				pass
 
+	def _evalenumerated(self, context, function, names, args, iterator):
+		# Loop for ``enumerate``, ``enumfl`` or ``isfirstlast``: The loop variables
+		# are set directly, so the tuples (and for ``enumfl``/``isfirstlast`` the
+		# generator) created by those functions aren't required
+		if iterator is True:
+			iterator = iter(args[0])
+		index = args[1] if len(args) > 1 else 0
+		first = True
+		last = False
+		try:
+			item = next(iterator)
+		except StopIteration:
+			return
+		content = self.content
+		while True:
+			vars = context.vars
+			if function == "enumerate":
+				vars[names[0]] = index
+				vars[names[1]] = item
+			else:
+				# Look ahead to find out whether this is the last item
+				try:
+					nextitem = next(iterator)
+				except StopIteration:
+					last = True
+				if function == "enumfl":
+					vars[names[0]] = index
+					vars[names[1]] = first
+					vars[names[2]] = last
+					vars[names[3]] = item
+				else:
+					vars[names[0]] = first
+					vars[names[1]] = last
+					vars[names[2]] = item
+			try:
+				for node in content:
+					result = node.eval(context)
+					if node.output:
+						yield from result
+			except BreakException:
+				return
+			except ContinueException:
+				pass
+			if function == "enumerate":
+				try:
+					item = next(iterator)
+				except StopIteration:
+					return
+			elif last:
+				return
+			else:
+				item = nextitem
+			index += 1
+			first = False
+
+	def _python(self, python):
+		container = python.expr(self.container)
+		iterator = python.temp()
+		with python.guard(self):
+			# :obj:`container` might be a literal, so copy it into a variable first
+			python.line("{} = {}".format(iterator, container))
+			python.line("{0} = iter({0}.ul4attrs if hasattr({0}, 'ul4attrs') else {0})".format(iterator))
+		item = python.loop(iterator, self)
+		defined = set(python._defined)
+		python.assign(self.varname, item, self)
+		python.body(self.content)
+		python._defined = defined
+		python.level -= 1
+
 
 @register("whileblock")
 class WhileBlock(Block):
@@ -1925,6 +3723,8 @@ class WhileBlock(Block):
 	AST node for a ``<?while?>`` loop.
 	"""
 
+	__slots__ = ("condition",)
+
 	ul4attrs = Block.ul4attrs.union({"condition"})
 
 	def __init__(self, tag=None, pos=None, condition=None):
@@ -1972,6 +3772,15 @@ class WhileBlock(Block):
 			except ContinueException:
 				pass
 
+	def _python(self, python):
+		python.line("while True:")
+		python.level += 1
+		condition = python.expr(self.condition)
+		python.line("if not {}:".format(python.truth(condition, self.condition, self)))
+		python.line("\tbreak")
+		python.body(self.content)
+		python.level -= 1
+
 
 @register("break")
 class Break(Code):
@@ -1979,6 +3788,8 @@ class Break(Code):
 	AST node for a ``<?break?>`` inside a ``<?for?>`` block.
 	"""
 
+	__slots__ = ()
+
 	def _str(self):
 		yield "break"
 
@@ -1986,6 +3797,9 @@ class Break(Code):
 	def eval(self, context):
 		raise BreakException()
 
+	def _python(self, python):
+		python.line("break")
+
 
 @register("continue")
 class Continue(Code):
@@ -1993,6 +3807,8 @@ class Continue(Code):
 	AST node for a ``<?continue?>`` inside a ``<?for?>`` block.
 	"""
 
+	__slots__ = ()
+
 	def _str(self):
 		yield "continue"
 
@@ -2000,6 +3816,9 @@ class Continue(Code):
 	def eval(self, context):
 		raise ContinueException()
 
+	def _python(self, python):
+		python.line("continue")
+
 
 @register("attr")
 class Attr(Code):
@@ -2009,12 +3828,17 @@ class Attr(Code):
 	The object is loaded from the AST node :obj:`obj` and the attribute name
 	is stored in the string :obj:`attrname`.
 	"""
+
+	__slots__ = ("obj", "attrname", "_cache")
+
 	ul4attrs = AST.ul4attrs.union({"obj", "attrname"})
 
 	def __init__(self, tag=None, pos=None, obj=None, attrname=None):
 		super().__init__(tag, pos)
 		self.obj = obj
 		self.attrname = attrname
+		# Inline cache for the last type seen by this node: A tuple containing the type and the handler
+		self._cache = None
 
 	def _repr(self):
 		yield "obj={!r}".format(self.obj)
@@ -2028,9 +3852,64 @@ class Attr(Code):
 		p.text("attrname=")
 		p.pretty(self.attrname)
 
+	# Maps types to the method handling attribute access for their instances
+	# (or :const:`None` if this depends on the instance)
+	_typehandlers = {}
+
 	@_handleexpressioneval
 	def eval(self, context):
 		obj = self.obj.eval(context)
+		return self.evalattr(obj)
+
+	def evalattr(self, obj):
+		cache = self._cache
+		if cache is not None and cache[0] is type(obj):
+			return cache[1](self, obj, self.attrname)
+		handler = self._typehandler(type(obj))
+		if handler is None:
+			return self._evalattr(obj)
+		if handler is Attr.attr_dict and self.attrname not in {"items", "values", "update", "get", "clear"}:
+			handler = Attr.attr_dictitem
+		self._cache = (type(obj), handler)
+		return handler(self, obj, self.attrname)
+
+	@classmethod
+	def _typehandler(cls, type):
+		# Return the method implementing attribute access for instances of :obj:`type`
+		try:
+			return cls._typehandlers[type]
+		except KeyError:
+			pass
+		if hasattr(type, "ul4attrs"):
+			handler = cls.attr_ul4object
+		elif type.__dictoffset__ or hasattr(type, "__getattr__"):
+			# Instances might have their own ``ul4attrs`` or ``ul4getattr`` attributes
+			handler = None
+		elif hasattr(type, "ul4getattr"):
+			handler = cls.attr_object
+		elif issubclass(type, str):
+			handler = cls.attr_str
+		elif issubclass(type, collections.Mapping):
+			handler = cls.attr_dict
+		elif issubclass(type, collections.Set):
+			handler = cls.attr_set
+		elif issubclass(type, collections.Sequence):
+			handler = cls.attr_list
+		elif issubclass(type, (datetime.datetime, datetime.date)):
+			handler = cls.attr_date
+		elif issubclass(type, datetime.timedelta):
+			handler = cls.attr_timedelta
+		elif issubclass(type, slice):
+			handler = cls.attr_slice
+		elif issubclass(type, BaseException):
+			handler = cls.attr_exception
+		else:
+			handler = cls.attr_object
+		cls._typehandlers[type] = handler
+		return handler
+
+	def _evalattr(self, obj):
+		# Attribute access without using the type cache
 		if hasattr(obj, "ul4getattr"):
 			if hasattr(obj, "ul4attrs") and self.attrname in {"items", "values"}:
 				return self.attr_ul4attrs(obj, self.attrname)
@@ -2189,6 +4068,14 @@ class Attr(Code):
 			result = UndefinedKey(attrname)
 		return result
 
+	def attr_object(self, obj, attrname):
+		return _ul4getattr(obj, attrname)
+
+	def attr_ul4object(self, obj, attrname):
+		if attrname in {"items", "values"}:
+			return self.attr_ul4attrs(obj, attrname)
+		return _ul4getattr(obj, attrname)
+
 	def attr_ul4attrs(self, obj, attrname):
 		if attrname == "items":
 			def items():
@@ -2219,12 +4106,15 @@ class Attr(Code):
 		elif attrname == "clear":
 			result = obj.clear
 		else:
-			try:
-				result = obj[attrname]
-			except KeyError:
-				result = UndefinedKey(attrname)
+			result = self.attr_dictitem(obj, attrname)
 		return result
 
+	def attr_dictitem(self, obj, attrname):
+		try:
+			return obj[attrname]
+		except KeyError:
+			return UndefinedKey(attrname)
+
 	def attr_date(self, obj, attrname):
 		if attrname == "weekday":
 			def weekday():
@@ -2346,6 +4236,24 @@ class Attr(Code):
 		newvalue = operator.evalfoldaug(oldvalue, value)
 		_ul4setattr(obj, self.attrname, newvalue)
 
+	def _python(self, python):
+		obj = python.expr(self.obj)
+		result = python.temp()
+		with python.guard(self):
+			python.line("{} = {}.evalattr({})".format(result, python.ast(self), obj))
+		return result
+
+	def _pythonassign(self, python, value):
+		obj = python.expr(self.obj)
+		with python.guard(self):
+			python.line("_ul4setattr({}, {!r}, {})".format(obj, self.attrname, value))
+
+	def _pythonmodify(self, python, operator, value):
+		obj = python.expr(self.obj)
+		with python.guard(self):
+			newvalue = python.aug(operator, "_ul4getattr({}, {!r})".format(obj, self.attrname), value)
+			python.line("_ul4setattr({}, {!r}, {})".format(obj, self.attrname, newvalue))
+
 	def ul4ondump(self, encoder):
 		super().ul4ondump(encoder)
 		encoder.dump(self.obj)
@@ -2368,6 +4276,8 @@ class Slice(Code):
 	the length of the sequence for the end index).
 	"""
 
+	__slots__ = ("index1", "index2")
+
 	ul4attrs = Code.ul4attrs.union({"index1", "index2"})
 
 	def __init__(self, tag=None, pos=None, index1=None, index2=None):
@@ -2401,6 +4311,13 @@ class Slice(Code):
 			index2 = self.index2.eval(context)
 		return slice(index1, index2)
 
+	def _python(self, python):
+		index1 = python.expr(self.index1) if self.index1 is not None else "None"
+		index2 = python.expr(self.index2) if self.index2 is not None else "None"
+		result = python.temp()
+		python.line("{} = slice({}, {})".format(result, index1, index2))
+		return result
+
 	def ul4ondump(self, encoder):
 		super().ul4ondump(encoder)
 		encoder.dump(self.index1)
@@ -2417,6 +4334,8 @@ class Unary(Code):
 	Base class for all AST nodes implementing unary operators.
 	"""
 
+	__slots__ = ("obj",)
+
 	ul4attrs = Code.ul4attrs.union({"obj"})
 
 	def __init__(self, tag=None, pos=None, obj=None):
@@ -2438,11 +4357,25 @@ class Unary(Code):
 		super().ul4onload(decoder)
 		self.obj = decoder.load()
 
+	# Python operator used by the ``"compiled"`` backend (or :const:`None` for
+	# calling :meth:`evalfold`)
+	_pythonop = None
+
 	@_handleexpressioneval
 	def eval(self, context):
 		obj = self.obj.eval(context)
 		return self.evalfold(obj)
 
+	def _python(self, python):
+		obj = python.expr(self.obj)
+		result = python.temp()
+		with python.guard(self):
+			if self._pythonop is not None:
+				python.line("{} = {}{}".format(result, self._pythonop, obj))
+			else:
+				python.line("{} = {}.evalfold({})".format(result, python.ast(self), obj))
+		return result
+
 	@classmethod
 	def make(cls, tag, pos, obj):
 		if isinstance(obj, Const):
@@ -2461,6 +4394,10 @@ class Not(Unary):
 	AST node for the unary ``not`` operator.
 	"""
 
+	__slots__ = ()
+
+	_pythonop = "not "
+
 	@classmethod
 	def evalfold(cls, obj):
 		return not obj
@@ -2472,6 +4409,10 @@ class Neg(Unary):
 	AST node for the unary negation (i.e. "-") operator.
 	"""
 
+	__slots__ = ()
+
+	_pythonop = "-"
+
 	@classmethod
 	def evalfold(cls, obj):
 		return -obj
@@ -2483,6 +4424,10 @@ class BitNot(Unary):
 	AST node for the bitwise not operator.
 	"""
 
+	__slots__ = ()
+
+	_pythonop = "~"
+
 	@classmethod
 	def evalfold(cls, obj):
 		return ~obj
@@ -2494,6 +4439,8 @@ class Print(Unary):
 	AST node for a ``<?print?>`` tag.
 	"""
 
+	__slots__ = ()
+
 	output = True
 
 	def _str(self):
@@ -2504,6 +4451,13 @@ class Print(Unary):
 	def eval(self, context):
 		yield _str(self.obj.eval(context))
 
+	def _python(self, python):
+		obj = python.expr(self.obj)
+		result = python.temp()
+		with python.guard(self):
+			python.line("{} = _str({})".format(result, obj))
+		python.output(result)
+
 
 @register("printx")
 class PrintX(Unary):
@@ -2511,6 +4465,8 @@ class PrintX(Unary):
 	AST node for a ``<?printx?>`` tag.
 	"""
 
+	__slots__ = ()
+
 	output = True
 
 	def _str(self):
@@ -2521,6 +4477,13 @@ class PrintX(Unary):
 	def eval(self, context):
 		yield _xmlescape(self.obj.eval(context))
 
+	def _python(self, python):
+		obj = python.expr(self.obj)
+		result = python.temp()
+		with python.guard(self):
+			python.line("{} = _xmlescape({})".format(result, obj))
+		python.output(result)
+
 
 @register("return")
 class Return(Unary):
@@ -2528,6 +4491,8 @@ class Return(Unary):
 	AST node for a ``<?return?>`` tag.
 	"""
 
+	__slots__ = ()
+
 	def _str(self):
 		yield "return "
 		yield from super()._str()
@@ -2537,12 +4502,18 @@ class Return(Unary):
 		value = self.obj.eval(context)
 		raise ReturnException(value)
 
+	def _python(self, python):
+		value = python.expr(self.obj)
+		python.returnvalue(value)
+
 
 class Binary(Code):
 	"""
 	Base class for all AST nodes implementing binary operators.
 	"""
 
+	__slots__ = ("obj1", "obj2")
+
 	ul4attrs = Code.ul4attrs.union({"obj1", "obj2"})
 
 	def __init__(self, tag=None, pos=None, obj1=None, obj2=None):
@@ -2570,12 +4541,27 @@ class Binary(Code):
 		self.obj1 = decoder.load()
 		self.obj2 = decoder.load()
 
+	# Python operator used by the ``"compiled"`` backend (or :const:`None` for
+	# calling :meth:`evalfold`)
+	_pythonop = None
+
 	@_handleexpressioneval
 	def eval(self, context):
 		obj1 = self.obj1.eval(context)
 		obj2 = self.obj2.eval(context)
 		return self.evalfold(obj1, obj2)
 
+	def _python(self, python):
+		obj1 = python.expr(self.obj1)
+		obj2 = python.expr(self.obj2)
+		result = python.temp()
+		with python.guard(self):
+			if self._pythonop is not None:
+				python.line("{} = {} {} {}".format(result, obj1, self._pythonop, obj2))
+			else:
+				python.line("{} = {}.evalfold({}, {})".format(result, python.ast(self), obj1, obj2))
+		return result
+
 	@classmethod
 	def make(cls, tag, pos, obj1, obj2):
 		if isinstance(obj1, Const) and isinstance(obj2, Const):
@@ -2597,6 +4583,8 @@ class Item(Binary):
 	node :obj:`obj1` and the index/key is loaded from the AST node :obj:`obj2`.
 	"""
 
+	__slots__ = ()
+
 	@classmethod
 	def evalfold(cls, obj1, obj2):
 		try:
@@ -2623,6 +4611,27 @@ class Item(Binary):
 		else:
 			obj1[obj2] = newvalue
 
+	def _pythonassign(self, python, value):
+		obj1 = python.expr(self.obj1)
+		obj2 = python.expr(self.obj2)
+		with python.guard(self):
+			python.line("_ul4setattr({}, {}, {})".format(obj1, obj2, value))
+
+	def _pythonmodify(self, python, operator, value):
+		obj1 = python.expr(self.obj1)
+		obj2 = python.expr(self.obj2)
+		with python.guard(self):
+			python.line("if isinstance({}, str):".format(obj2))
+			python.level += 1
+			newvalue = python.aug(operator, "_ul4getattr({}, {})".format(obj1, obj2), value)
+			python.line("_ul4setattr({}, {}, {})".format(obj1, obj2, newvalue))
+			python.level -= 1
+			python.line("else:")
+			python.level += 1
+			newvalue = python.aug(operator, "{}[{}]".format(obj1, obj2), value)
+			python.line("{}[{}] = {}".format(obj1, obj2, newvalue))
+			python.level -= 1
+
 
 @register("is")
 class Is(Binary):
@@ -2630,6 +4639,10 @@ class Is(Binary):
 	AST node for the binary ``is`` comparison operator.
 	"""
 
+	__slots__ = ()
+
+	_pythonop = "is"
+
 	@classmethod
 	def evalfold(cls, obj1, obj2):
 		return obj1 is obj2
@@ -2641,6 +4654,10 @@ class IsNot(Binary):
 	AST node for the binary ``is not`` comparison operator.
 	"""
 
+	__slots__ = ()
+
+	_pythonop = "is not"
+
 	@classmethod
 	def evalfold(cls, obj1, obj2):
 		return obj1 is not obj2
@@ -2652,6 +4669,10 @@ class EQ(Binary):
 	AST node for the binary ``==`` comparison operator.
 	"""
 
+	__slots__ = ()
+
+	_pythonop = "=="
+
 	@classmethod
 	def evalfold(cls, obj1, obj2):
 		return obj1 == obj2
@@ -2663,6 +4684,10 @@ class NE(Binary):
 	AST node for the binary ``!=`` comparison operator.
 	"""
 
+	__slots__ = ()
+
+	_pythonop = "!="
+
 	@classmethod
 	def evalfold(cls, obj1, obj2):
 		return obj1 != obj2
@@ -2674,6 +4699,10 @@ class LT(Binary):
 	AST node for the binary ``<`` comparison operator.
 	"""
 
+	__slots__ = ()
+
+	_pythonop = "<"
+
 	@classmethod
 	def evalfold(cls, obj1, obj2):
 		return obj1 < obj2
@@ -2685,6 +4714,10 @@ class LE(Binary):
 	AST node for the binary ``<=`` comparison operator.
 	"""
 
+	__slots__ = ()
+
+	_pythonop = "<="
+
 	@classmethod
 	def evalfold(cls, obj1, obj2):
 		return obj1 <= obj2
@@ -2696,6 +4729,10 @@ class GT(Binary):
 	AST node for the binary ``>`` comparison operator.
 	"""
 
+	__slots__ = ()
+
+	_pythonop = ">"
+
 	@classmethod
 	def evalfold(cls, obj1, obj2):
 		return obj1 > obj2
@@ -2707,6 +4744,10 @@ class GE(Binary):
 	AST node for the binary ``>=`` comparison operator.
 	"""
 
+	__slots__ = ()
+
+	_pythonop = ">="
+
 	@classmethod
 	def evalfold(cls, obj1, obj2):
 		return obj1 >= obj2
@@ -2722,6 +4763,8 @@ class Contains(Binary):
 	attribute) is loaded from the AST node :obj:`obj2`.
 	"""
 
+	__slots__ = ()
+
 	@classmethod
 	def evalfold(cls, obj1, obj2):
 		if isinstance(obj1, str) and hasattr(obj2, "ul4attrs"):
@@ -2740,6 +4783,8 @@ class NotContains(Binary):
 	attribute) is loaded from the AST node :obj:`obj2`.
 	"""
 
+	__slots__ = ()
+
 	@classmethod
 	def evalfold(cls, obj1, obj2):
 		if isinstance(obj1, str) and hasattr(obj2, "ul4attrs"):
@@ -2754,6 +4799,10 @@ class Add(Binary):
 	AST node for the binary addition operator.
 	"""
 
+	__slots__ = ()
+
+	_pythonop = "+"
+
 	@classmethod
 	def evalfold(cls, obj1, obj2):
 		return obj1 + obj2
@@ -2770,6 +4819,10 @@ class Sub(Binary):
 	AST node for the binary substraction operator.
 	"""
 
+	__slots__ = ()
+
+	_pythonop = "-"
+
 	@classmethod
 	def evalfold(cls, obj1, obj2):
 		return obj1 - obj2
@@ -2786,6 +4839,10 @@ class Mul(Binary):
 	AST node for the binary multiplication operator.
 	"""
 
+	__slots__ = ()
+
+	_pythonop = "*"
+
 	@classmethod
 	def evalfold(cls, obj1, obj2):
 		return obj1 * obj2
@@ -2802,6 +4859,10 @@ class FloorDiv(Binary):
 	AST node for the binary truncating division operator.
 	"""
 
+	__slots__ = ()
+
+	_pythonop = "//"
+
 	@classmethod
 	def evalfold(cls, obj1, obj2):
 		return obj1 // obj2
@@ -2818,6 +4879,10 @@ class TrueDiv(Binary):
 	AST node for the binary true division operator.
 	"""
 
+	__slots__ = ()
+
+	_pythonop = "/"
+
 	@classmethod
 	def evalfold(cls, obj1, obj2):
 		return obj1 / obj2
@@ -2834,6 +4899,10 @@ class Mod(Binary):
 	AST node for the binary modulo operator.
 	"""
 
+	__slots__ = ()
+
+	_pythonop = "%"
+
 	@classmethod
 	def evalfold(cls, obj1, obj2):
 		return obj1 % obj2
@@ -2850,6 +4919,8 @@ class ShiftLeft(Binary):
 	AST node for the bitwise left shift operator.
 	"""
 
+	__slots__ = ()
+
 	@classmethod
 	def evalfold(cls, obj1, obj2):
 		return obj1 << obj2 if obj2 >= 0 else obj1 >> -obj2
@@ -2869,6 +4940,8 @@ class ShiftRight(Binary):
 	AST node for the bitwise right shift operator.
 	"""
 
+	__slots__ = ()
+
 	@classmethod
 	def evalfold(cls, obj1, obj2):
 		return obj1 >> obj2 if obj2 >= 0 else obj1 << -obj2
@@ -2888,6 +4961,8 @@ class BitAnd(Binary):
 	AST node for the binary bitwise and operator (``&``).
 	"""
 
+	__slots__ = ()
+
 	@classmethod
 	def evalfold(cls, obj1, obj2):
 		if isinstance(obj1, bool):
@@ -2912,6 +4987,8 @@ class BitXOr(Binary):
 	AST node for the binary bitwise exclusive or operator (``^``).
 	"""
 
+	__slots__ = ()
+
 	@classmethod
 	def evalfold(cls, obj1, obj2):
 		if isinstance(obj1, bool):
@@ -2936,6 +5013,8 @@ class BitOr(Binary):
 	AST node for the binary bitwise or operator (``|``).
 	"""
 
+	__slots__ = ()
+
 	@classmethod
 	def evalfold(cls, obj1, obj2):
 		if isinstance(obj1, bool):
@@ -2960,6 +5039,8 @@ class And(Binary):
 	AST node for the binary ``and`` operator.
 	"""
 
+	__slots__ = ()
+
 	@classmethod
 	def evalfold(cls, obj1, obj2):
 		# This is not called from ``eval``, as it doesn't short-circuit
@@ -2972,6 +5053,19 @@ class And(Binary):
 			return obj1
 		return self.obj2.eval(context)
 
+	def _python(self, python):
+		obj1 = python.expr(self.obj1)
+		condition = python.truth(obj1, self.obj1, self)
+		# :obj:`obj1` might be a literal or the slot of a variable, so don't assign to it
+		result = python.temp()
+		python.line("{} = {}".format(result, obj1))
+		python.line("if {}:".format(condition))
+		python.level += 1
+		obj2 = python.expr(self.obj2)
+		python.line("{} = {}".format(result, obj2))
+		python.level -= 1
+		return result
+
 
 @register("or")
 class Or(Binary):
@@ -2979,6 +5073,8 @@ class Or(Binary):
 	AST node for the binary ``or`` operator.
 	"""
 
+	__slots__ = ()
+
 	@classmethod
 	def evalfold(cls, obj1, obj2):
 		# This is not called from ``eval``, as it doesn't short-circuit
@@ -2991,6 +5087,19 @@ class Or(Binary):
 			return obj1
 		return self.obj2.eval(context)
 
+	def _python(self, python):
+		obj1 = python.expr(self.obj1)
+		condition = python.truth(obj1, self.obj1, self)
+		# :obj:`obj1` might be a literal or the slot of a variable, so don't assign to it
+		result = python.temp()
+		python.line("{} = {}".format(result, obj1))
+		python.line("if not {}:".format(condition))
+		python.level += 1
+		obj2 = python.expr(self.obj2)
+		python.line("{} = {}".format(result, obj2))
+		python.level -= 1
+		return result
+
 
 @register("if")
 class If(Code):
@@ -2998,6 +5107,8 @@ class If(Code):
 	AST node for the ternary inline ``if/else`` operator.
 	"""
 
+	__slots__ = ("objif", "objcond", "objelse")
+
 	ul4attrs = Code.ul4attrs.union({"objif", "objcond", "objelse"})
 
 	def __init__(self, tag=None, pos=None, objif=None, objcond=None, objelse=None):
@@ -3044,6 +5155,22 @@ class If(Code):
 		else:
 			return self.objelse.eval(context)
 
+	def _python(self, python):
+		objcond = python.expr(self.objcond)
+		condition = python.truth(objcond, self.objcond, self)
+		result = python.temp()
+		python.line("if {}:".format(condition))
+		python.level += 1
+		objif = python.expr(self.objif)
+		python.line("{} = {}".format(result, objif))
+		python.level -= 1
+		python.line("else:")
+		python.level += 1
+		objelse = python.expr(self.objelse)
+		python.line("{} = {}".format(result, objelse))
+		python.level -= 1
+		return result
+
 
 class ChangeVar(Code):
 	"""
@@ -3054,6 +5181,8 @@ class ChangeVar(Code):
 	AST node :obj:`value`.
 	"""
 
+	__slots__ = ("lvalue", "value")
+
 	ul4attrs = Code.ul4attrs.union({"lvalue", "value"})
 
 	def __init__(self, tag=None, pos=None, lvalue=None, value=None):
@@ -3073,6 +5202,10 @@ class ChangeVar(Code):
 		p.text("value=")
 		p.pretty(self.value)
 
+	def _python(self, python):
+		value = python.expr(self.value)
+		python.modify(self.lvalue, self._operator, value, self)
+
 	def ul4ondump(self, encoder):
 		super().ul4ondump(encoder)
 		encoder.dump(self.lvalue)
@@ -3090,12 +5223,18 @@ class SetVar(ChangeVar):
 	AST node that stores a value into a variable.
 	"""
 
+	__slots__ = ()
+
 	@_handleexpressioneval
 	def eval(self, context):
 		value = self.value.eval(context)
 		for (lvalue, value) in _unpackvar(self.lvalue, value):
 			lvalue.evalset(context, value)
 
+	def _python(self, python):
+		value = python.expr(self.value)
+		python.assign(self.lvalue, value, self)
+
 
 @register("addvar")
 class AddVar(ChangeVar):
@@ -3103,6 +5242,10 @@ class AddVar(ChangeVar):
 	AST node that adds a value to a variable (i.e. the ``+=`` operator).
 	"""
 
+	__slots__ = ()
+
+	_operator = Add
+
 	@_handleexpressioneval
 	def eval(self, context):
 		value = self.value.eval(context)
@@ -3116,6 +5259,10 @@ class SubVar(ChangeVar):
 	AST node that substracts a value from a variable (i.e. the ``-=`` operator).
 	"""
 
+	__slots__ = ()
+
+	_operator = Sub
+
 	@_handleexpressioneval
 	def eval(self, context):
 		value = self.value.eval(context)
@@ -3129,6 +5276,10 @@ class MulVar(ChangeVar):
 	AST node that multiplies a variable by a value (i.e. the ``*=`` operator).
 	"""
 
+	__slots__ = ()
+
+	_operator = Mul
+
 	@_handleexpressioneval
 	def eval(self, context):
 		value = self.value.eval(context)
@@ -3143,6 +5294,10 @@ class FloorDivVar(ChangeVar):
 	i.e. the ``//=`` operator).
 	"""
 
+	__slots__ = ()
+
+	_operator = FloorDiv
+
 	@_handleexpressioneval
 	def eval(self, context):
 		value = self.value.eval(context)
@@ -3156,6 +5311,10 @@ class TrueDivVar(ChangeVar):
 	AST node that divides a variable by a value (i.e. the ``/=`` operator).
 	"""
 
+	__slots__ = ()
+
+	_operator = TrueDiv
+
 	@_handleexpressioneval
 	def eval(self, context):
 		value = self.value.eval(context)
@@ -3169,6 +5328,10 @@ class ModVar(ChangeVar):
 	AST node for the ``%=`` operator.
 	"""
 
+	__slots__ = ()
+
+	_operator = Mod
+
 	@_handleexpressioneval
 	def eval(self, context):
 		value = self.value.eval(context)
@@ -3182,6 +5345,10 @@ class ShiftLeftVar(ChangeVar):
 	AST node for the ``<<=`` operator.
 	"""
 
+	__slots__ = ()
+
+	_operator = ShiftLeft
+
 	@_handleexpressioneval
 	def eval(self, context):
 		value = self.value.eval(context)
@@ -3195,6 +5362,10 @@ class ShiftRightVar(ChangeVar):
 	AST node for the ``>>=`` operator.
 	"""
 
+	__slots__ = ()
+
+	_operator = ShiftRight
+
 	@_handleexpressioneval
 	def eval(self, context):
 		value = self.value.eval(context)
@@ -3208,6 +5379,10 @@ class BitAndVar(ChangeVar):
 	AST node for the ``&=`` operator.
 	"""
 
+	__slots__ = ()
+
+	_operator = BitAnd
+
 	@_handleexpressioneval
 	def eval(self, context):
 		value = self.value.eval(context)
@@ -3221,6 +5396,10 @@ class BitXOrVar(ChangeVar):
 	AST node for the ``^=`` operator.
 	"""
 
+	__slots__ = ()
+
+	_operator = BitXOr
+
 	@_handleexpressioneval
 	def eval(self, context):
 		value = self.value.eval(context)
@@ -3234,6 +5413,10 @@ class BitOrVar(ChangeVar):
 	AST node for the ``|=`` operator.
 	"""
 
+	__slots__ = ()
+
+	_operator = BitOr
+
 	@_handleexpressioneval
 	def eval(self, context):
 		value = self.value.eval(context)
@@ -3250,12 +5433,18 @@ class Call(Code):
 	arguments is found in :obj:`args`.
 	"""
 
+	__slots__ = ("obj", "args", "_plan", "_cache")
+
 	ul4attrs = Code.ul4attrs.union({"obj", "args"})
 
 	def __init__(self, tag=None, pos=None, obj=None):
 		super().__init__(tag, pos)
 		self.obj = obj
 		self.args = []
+		# Plan for evaluating the arguments (see :meth:`_makeplan`), created on first use
+		self._plan = None
+		# Inline cache for the type of the last object called: A tuple containing the type and the handler
+		self._cache = None
 
 	def _repr(self):
 		yield "obj={!r}".format(self.obj)
@@ -3272,6 +5461,60 @@ class Call(Code):
 
 	def append(self, node):
 		self.args.append(node)
+		self._plan = None
+
+	def _makeplan(self):
+		# If there are only positional and keyword arguments (and no duplicate
+		# keyword arguments) return a tuple with the list of the positional
+		# arguments and the list of keyword arguments, else return ``False``
+		posargs = []
+		kwargs = []
+		names = set()
+		for arg in self.args:
+			if isinstance(arg, PosArg):
+				posargs.append(arg)
+			elif isinstance(arg, KeywordArg) and arg.name not in names:
+				kwargs.append(arg)
+				names.add(arg.name)
+			else:
+				return False
+		return (posargs, kwargs)
+
+	def _evalargs(self, context):
+		# Evaluate the arguments and return the list of positional arguments and the dictionary of keyword arguments
+		plan = self._plan
+		if plan is None:
+			plan = self._plan = self._makeplan()
+		if plan:
+			return ([arg.value.eval(context) for arg in plan[0]], {arg.name: arg.value.eval(context) for arg in plan[1]})
+		args = []
+		kwargs = {}
+		for arg in self.args:
+			arg.eval_call(context, args, kwargs)
+		return (args, kwargs)
+
+	# Maps types to the method handling calls of their instances
+	_typehandlers = {}
+
+	@classmethod
+	def _typehandler(cls, type):
+		# Return the method implementing calls of instances of :obj:`type`
+		try:
+			return cls._typehandlers[type]
+		except KeyError:
+			pass
+		if hasattr(type, "ul4call") or hasattr(type, "ul4context"):
+			handler = cls._call
+		elif type is types.FunctionType:
+			handler = cls.call_function
+		elif type is types.MethodType:
+			handler = cls.call_method
+		elif type is types.BuiltinFunctionType:
+			handler = cls.call_builtin
+		else:
+			handler = cls._call
+		cls._typehandlers[type] = handler
+		return handler
 
 	@staticmethod
 	def _call(context, obj, args, kwargs):
@@ -3286,15 +5529,43 @@ class Call(Code):
 		else:
 			return obj(*args, **kwargs)
 
+	@staticmethod
+	def call_function(context, obj, args, kwargs):
+		# ``ul4call`` and ``ul4context`` can only be found in the function's dictionary
+		attrs = obj.__dict__
+		if not attrs:
+			return obj(*args, **kwargs)
+		elif "ul4call" in attrs:
+			return Call._call(context, obj, args, kwargs)
+		elif attrs.get("ul4context", False):
+			return obj(context, *args, **kwargs)
+		else:
+			return obj(*args, **kwargs)
+
+	@staticmethod
+	def call_method(context, obj, args, kwargs):
+		# Bound methods get ``ul4call`` and ``ul4context`` from their function
+		if type(obj.__func__) is types.FunctionType and not obj.__func__.__dict__:
+			return obj(*args, **kwargs)
+		return Call._call(context, obj, args, kwargs)
+
+	@staticmethod
+	def call_builtin(context, obj, args, kwargs):
+		return obj(*args, **kwargs)
+
 	def eval(self, context):
 		obj = self.obj.eval(context)
-		args = []
-		kwargs = {}
-		for arg in self.args:
-			arg.eval_call(context, args, kwargs)
+		(args, kwargs) = self._evalargs(context)
+		return self.evalcall(context, obj, args, kwargs)
 
+	def evalcall(self, context, obj, args, kwargs):
 		try:
-			return self._call(context, obj, args, kwargs)
+			cache = self._cache
+			if cache is not None and cache[0] is type(obj):
+				return cache[1](context, obj, args, kwargs)
+			handler = self._typehandler(type(obj))
+			self._cache = (type(obj), handler)
+			return handler(context, obj, args, kwargs)
 		except LocationError as exc:
 			if isinstance(obj, (Template, TemplateClosure)):
 				raise LocationError(self) from exc
@@ -3304,7 +5575,15 @@ class Call(Code):
 				raise
 		except Exception as exc:
 			# Always wrap the original exception in another exception so that we see the location of the call
-			raise LocationError(self) from exc
+			raise LocationError(_innermost(exc, self)) from exc
+
+	def _python(self, python):
+		obj = python.expr(self.obj)
+		(args, kwargs) = python.args(self.args)
+		result = python.temp()
+		python.line("{} = {}.evalcall(context, {}, {}, {})".format(result, python.ast(self), obj, args, kwargs))
+		python.reloadslots(self)
+		return result
 
 	@_handleexpressioneval
 	def evalset(self, context, value):
@@ -3323,6 +5602,7 @@ class Call(Code):
 		super().ul4onload(decoder)
 		self.obj = decoder.load()
 		self.args = decoder.load()
+		self._plan = None
 
 
 @register("render")
@@ -3334,6 +5614,8 @@ class Render(Call):
 	of arguments is found in :obj:`args`.
 	"""
 
+	__slots__ = ("indent",)
+
 	def __init__(self, tag=None, pos=None, obj=None):
 		super().__init__(tag, pos, obj)
 		self.indent = None # The indentation before this ``<?render?>`` tag, i.e. the sibling AST node before ``self``
@@ -3359,11 +5641,10 @@ class Render(Call):
 
 	def eval(self, context):
 		obj = self.obj.eval(context)
-		args = []
-		kwargs = {}
-		for arg in self.args:
-			arg.eval_call(context, args, kwargs)
+		(args, kwargs) = self._evalargs(context)
+		yield from self.evalrender(context, obj, args, kwargs)
 
+	def evalrender(self, context, obj, args, kwargs):
 		try:
 			ul4render = getattr(obj, "ul4render", None)
 			if callable(ul4render):
@@ -3381,7 +5662,34 @@ class Render(Call):
 				raise TypeError("{} object can't be rendered".format(misc.format_class(obj)))
 		except Exception as exc:
 			# Wrap original exception in another exception that shows the location
-			raise LocationError(self) from exc
+			raise LocationError(_innermost(exc, self)) from exc
+
+	def evalrenderto(self, context, write, obj, args, kwargs):
+		# Like :meth:`evalrender`, but pass the output to the callable :obj:`write`
+		ul4renderto = getattr(obj, "ul4renderto", None)
+		if not callable(ul4renderto):
+			# Objects that only support :meth:`ul4render` are rendered iteratively
+			for output in self.evalrender(context, obj, args, kwargs):
+				write(output)
+			return
+		try:
+			if self.indent is not None:
+				context.indents.append(self.indent.text)
+			ul4renderto(context, write, *args, **kwargs)
+			if self.indent is not None:
+				context.indents.pop()
+		except Exception as exc:
+			# Wrap original exception in another exception that shows the location
+			raise LocationError(_innermost(exc, self)) from exc
+
+	def _python(self, python):
+		obj = python.expr(self.obj)
+		(args, kwargs) = python.args(self.args)
+		if python.mode == "write":
+			python.line("{}.evalrenderto(context, _write, {}, {}, {})".format(python.ast(self), obj, args, kwargs))
+		else:
+			python.outputfrom("{}.evalrender(context, {}, {}, {})".format(python.ast(self), obj, args, kwargs))
+		python.reloadslots(self)
 
 	def _str(self):
 		yield "render "
@@ -3423,9 +5731,13 @@ class Template(Block):
 
 	version = "41"
 
+	# The parser used for the code in tags: ``"native"`` uses :class:`Parser`,
+	# ``"antlr"`` uses the parser generated from ``UL4.g`` by ANTLR
+	parser = os.environ.get("LL_UL4_PARSER", "native")
+
 	output = False # Evaluation a template doesn't produce output, but simply stores it in a local variable
 
-	def __init__(self, source=None, name=None, whitespace="keep", startdelim="<?", enddelim="?>", signature=None):
+	def __init__(self, source=None, name=None, whitespace="keep", startdelim="<?", enddelim="?>", signature=None, backend="interpreted", optimize=False):
 		"""
 		Create a :class:`Template` object.
 
@@ -3497,6 +5809,28 @@ class Template(Block):
 		A :class:`Signature` object
 			This AST node will be evaluated at the point of definition of the
 			subtemplate to create the final signature of the subtemplate.
+
+		:obj:`backend` specifies how the template will be executed:
+
+		``"interpreted"``
+			The template is executed by evaluating the AST nodes.
+
+		``"compiled"``
+			On first use the template is compiled to Python source code (see
+			:meth:`pythonsource`) which will then be executed instead. This is
+			faster but requires some time for compiling the template.
+
+			Functions that need the context (see :func:`withcontext`) can read
+			and change the variables of the template via ``context.vars`` just
+			like with the ``"interpreted"`` backend. (However if a variable
+			passed to the template replaces a builtin function that doesn't need
+			the context, changes made by calling it won't be visible to the
+			template.)
+
+		Local templates always use the backend of their top level template.
+
+		If :obj:`optimize` is true, the AST will be optimized after compiling
+		(see :meth:`optimize`).
 		"""
 		# ``tag``/``endtag`` will remain ``None`` for a top level template
 		# For a subtemplate ``tag`` will be set to the ``<?def?>`` tag in :meth:`_compile`
@@ -3509,6 +5843,9 @@ class Template(Block):
 		self.source = None
 		self.docpos = None
 		self.parenttemplate = None
+		self.backend = backend
+		self._pythonfunctions = None
+		self._closureinfo = None
 		if isinstance(signature, str):
 			# The parser needs a tag, and each tag references its template which contains the source.
 			# So to make the source of the signature available in the source, we prepend an ``<?ul4?>`` tag
@@ -3521,6 +5858,8 @@ class Template(Block):
 		# If we have source code compile it
 		if source is not None:
 			self._compile(source, startdelim, enddelim)
+			if optimize:
+				self.optimize()
 
 	def _repr(self):
 		yield "name={!r}".format(self.name)
@@ -3713,12 +6052,38 @@ class Template(Block):
 		from ll import ul4on
 		return ul4on.dumps(self)
 
+	def _compiled(self):
+		# Return whether this template should be executed by the ``"compiled"`` backend
+		template = self
+		while template.parenttemplate is not None:
+			template = template.parenttemplate
+		if template.backend == "compiled":
+			return True
+		elif template.backend == "interpreted":
+			return False
+		else:
+			raise ValueError("unknown backend {!r}".format(template.backend))
+
+	def _pythonfunction(self, name):
+		# Return the compiled function :obj:`name` (compiling the template on first use)
+		if self._pythonfunctions is None:
+			self._pythonfunctions = PythonSource(self).functions()
+		return self._pythonfunctions[name]
+
 	def _renderbound(self, context):
 		# Helper method used by :meth:`render` and :meth:`TemplateClosure.render` where arguments have already been bound
-		try:
-			yield from super().eval(context) # Bypass ``self.eval()`` which simply stores the object as a local variable
-		except ReturnException:
-			pass
+		if self._compiled() and context.profiler is None:
+			yield from self._pythonfunction("render")(context)
+		else:
+			try:
+				yield from super().eval(context) # Bypass ``self.eval()`` which simply stores the object as a local variable
+			except ReturnException:
+				pass
+			except LocationError:
+				raise
+			except Exception as exc:
+				# Only reached in ``"lazy"`` location tracking mode
+				raise LocationError(_innermost(exc, self)) from exc
 
 	@withcontext
 	def ul4render(*args, **kwargs):
@@ -3740,8 +6105,128 @@ class Template(Block):
 		context = Context()
 		yield from args[0].ul4render(context, *args[1:], **kwargs)
 
+	def _rendertobound(self, context, write):
+		# Helper method used by :meth:`renderto` and :meth:`TemplateClosure.ul4renderto` where arguments have already been bound
+		if self._compiled() and context.profiler is None:
+			self._pythonfunction("write")(context, write)
+		else:
+			for output in self._renderbound(context):
+				write(output)
+
+	def ul4renderto(*args, **kwargs):
+		self = args[0]
+		context = args[1]
+		write = args[2]
+		args = args[3:]
+		vars = _makevars(self.signature, args, kwargs)
+		with context.replacevars(vars):
+			self._rendertobound(context, write)
+
+	def renderto(*args, **kwargs):
+		"""
+		Render the template and write the output into :obj:`args[1]`, which can
+		either be a stream (i.e. an object with a :meth:`write` method, like an
+		:class:`io.StringIO` object or a file) or a callable (e.g. the
+		:meth:`append` method of a list). :obj:`args[2:]` and :obj:`kwargs`
+		contain the top level variables available to the template code.
+		(:obj:`args[0]` is the ``self`` parameter, but :meth:`renderto` is defined
+		in this way, to allow keyword arguments named ``self`` and ``stream``).
+
+		With the ``"compiled"`` backend the output is passed to the stream
+		directly instead of being yielded through a chain of generators.
+
+		If :obj:`args[1]` is a :class:`ChunkWriter` it will be flushed after the
+		template has been rendered.
+		"""
+		self = args[0]
+		stream = args[1]
+		write = getattr(stream, "write", stream)
+		context = Context()
+		self.ul4renderto(context, write, *args[2:], **kwargs)
+		if isinstance(stream, ChunkWriter):
+			stream.flush()
+
+	def render_async(*args, **kwargs):
+		"""
+		Render the template asynchronously, i.e. this returns an asynchronous
+		iterator that produces the output of the template in chunks.
+		:obj:`args[1:]` and :obj:`kwargs` contain the top level variables
+		available to the template code.
+
+		Variables whose values are awaitables will be replaced by their result
+		and asynchronous iterators will be iterated asynchronously (e.g. in a
+		``<?for?>`` loop). Coroutine functions (and asynchronous generator
+		functions) passed as variables can be called as normal functions; their
+		results will be awaited (or iterated asynchronously).
+
+		The template itself is rendered in a separate thread (one for each call),
+		so waiting for data doesn't block the event loop.
+		"""
+		return _AsyncRender(args[0], args[1:], kwargs)
+
+	async def renders_async(*args, **kwargs):
+		"""
+		Render the template asynchronously (like :meth:`render_async`) and
+		return the output as a string.
+		"""
+		output = []
+		async for chunk in args[0].render_async(*args[1:], **kwargs):
+			output.append(chunk)
+		return "".join(output)
+
+	def renderbytes(*args, **kwargs):
+		"""
+		Render the template and return the output as a :class:`bytes` object
+		encoded with the encoding :obj:`args[1]` (e.g. ``"utf-8"``).
+		:obj:`args[2:]` and :obj:`kwargs` contain the top level variables
+		available to the template code. (:obj:`args[0]` is the ``self``
+		parameter, but :meth:`renderbytes` is defined in this way, to allow
+		keyword arguments named ``self`` and ``encoding``).
+
+		The output is encoded incrementally, so no string containing the
+		complete output will be created. If the encoding is ``"xml"`` the
+		codec from :mod:`ll.xml_codec` will be used, i.e. the encoding is taken
+		from the XML declaration in the output.
+		"""
+		self = args[0]
+		output = []
+		writer = _BytesWriter(output.append, args[1], 8192)
+		context = Context()
+		self.ul4renderto(context, writer.write, *args[2:], **kwargs)
+		writer.close()
+		return b"".join(output)
+
+	def iterbytes(*args, **kwargs):
+		"""
+		Render the template iteratively and produce the output as :class:`bytes`
+		objects encoded with the encoding :obj:`args[1]` in chunks of (at least)
+		:obj:`args[2]` characters (except for the last chunk). This is suitable
+		for streaming the output, e.g. as the body of a WSGI response.
+		:obj:`args[3:]` and :obj:`kwargs` contain the top level variables
+		available to the template code. (:obj:`args[0]` is the ``self``
+		parameter, but :meth:`iterbytes` is defined in this way, to allow
+		keyword arguments named ``self``, ``encoding`` and ``chunksize``).
+
+		As for :meth:`renderbytes` the encoding ``"xml"`` uses the codec from
+		:mod:`ll.xml_codec`.
+		"""
+		self = args[0]
+		chunks = []
+		writer = _BytesWriter(chunks.append, args[1], args[2])
+		for output in self.render(*args[3:], **kwargs):
+			writer.write(output)
+			if chunks:
+				yield from chunks
+				chunks.clear()
+		writer.close()
+		yield from chunks
+
 	def _rendersbound(self, context):
 		# Helper method used by :meth:`renders` and :meth:`TemplateClosure.renders` where arguments have already been bound
+		if self._compiled() and context.profiler is None:
+			output = []
+			self._pythonfunction("write")(context, output.append)
+			return "".join(output)
 		return "".join(self._renderbound(context))
 
 	@withcontext
@@ -3765,11 +6250,19 @@ class Template(Block):
 
 	def _callbound(self, context):
 		# Helper method used by :meth:`__call__` and :meth:`TemplateClosure.__call__` where arguments have already been bound
-		try:
-			for output in super().eval(context): # Bypass ``self.eval()`` which simply stores the object as a local variable
-				pass # Ignore all output
-		except ReturnException as exc:
-			return exc.value
+		if self._compiled() and context.profiler is None:
+			return self._pythonfunction("call")(context)
+		else:
+			try:
+				for output in super().eval(context): # Bypass ``self.eval()`` which simply stores the object as a local variable
+					pass # Ignore all output
+			except ReturnException as exc:
+				return exc.value
+			except LocationError:
+				raise
+			except Exception as exc:
+				# Only reached in ``"lazy"`` location tracking mode
+				raise LocationError(_innermost(exc, self)) from exc
 
 	@withcontext
 	def ul4call(*args, **kwargs):
@@ -3798,6 +6291,27 @@ class Template(Block):
 		context = Context()
 		return args[0].ul4call(context, *args[1:], **kwargs)
 
+	def optimize(self):
+		"""
+		Optimize the AST of the template in place (see :class:`Optimizer` for
+		the optimizations done) and return the number of AST nodes that have
+		been removed.
+
+		The optimized AST will be preserved when the template is serialized via
+		UL4ON.
+		"""
+		removed = Optimizer(self).optimize()
+		self._pythonfunctions = None
+		self._closureinfo = None
+		return removed
+
+	def pythonsource(self):
+		"""
+		Return the Python source code that the ``"compiled"`` backend uses for
+		executing the template.
+		"""
+		return str(PythonSource(self))
+
 	def jssource(self):
 		"""
 		Return the template as the source code of a Javascript function.
@@ -4002,17 +6516,23 @@ class Template(Block):
 			yield from line
 
 	def _parser(self, tag, error):
-		from ll import UL4Lexer, UL4Parser
 		source = tag.code
 		if not source:
 			raise ValueError(error)
-		stream = antlr3.ANTLRStringStream(source)
-		lexer = UL4Lexer.UL4Lexer(stream)
-		lexer.tag = tag
-		tokens = antlr3.CommonTokenStream(lexer)
-		parser = UL4Parser.UL4Parser(tokens)
-		parser.tag = tag
-		return parser
+		if self.parser == "native":
+			return Parser(tag)
+		elif self.parser == "antlr":
+			import antlr3
+			from ll import UL4Lexer, UL4Parser
+			stream = antlr3.ANTLRStringStream(source)
+			lexer = UL4Lexer.UL4Lexer(stream)
+			lexer.tag = tag
+			tokens = antlr3.CommonTokenStream(lexer)
+			parser = UL4Parser.UL4Parser(tokens)
+			parser.tag = tag
+			return parser
+		else:
+			raise ValueError("parser {!r} unknown".format(self.parser))
 
 	def _compile(self, source, startdelim, enddelim):
 		"""
@@ -4209,13 +6729,56 @@ class Template(Block):
 		if len(blockstack) > 1:
 			raise LocationError(blockstack[-1]) from BlockError("block unclosed")
 
-	@_handleexpressioneval
-	def eval(self, context):
+	def _analyzeclosure(self, context):
+		# Return a tuple ``(freevars, signature, bind)`` for creating closures
+		# of this local template: ``freevars`` is the set of the names of the
+		# variables that the template (or any local template nested in it)
+		# might get from the enclosing scope. If the signature doesn't depend on
+		# the point of definition (i.e. all default values are constants)
+		# ``signature`` is the evaluated signature and ``bind`` the function
+		# that binds the arguments to it, else both are ``None``.
+		freevars = set()
+		nodes = list(self.content)
+		while nodes:
+			node = nodes.pop()
+			if isinstance(node, Var):
+				freevars.add(node.name)
+			nodes.extend(node._subnodes())
 		signature = self.signature
-		# If our signature is an AST, we have to evaluate it to get the final :class:`inspect.Signature` object
 		if isinstance(signature, Signature):
+			# Parameters will always be set by the call
+			freevars.difference_update(name.lstrip("*") for (name, default) in signature.params)
+			if not all(default is None or isinstance(default, Const) for (name, default) in signature.params):
+				return (frozenset(freevars), None, None)
 			signature = signature.eval(context)
-		context.vars[self.name] = TemplateClosure(self, context, signature)
+		elif signature is not None:
+			freevars.difference_update(signature.parameters)
+		return (frozenset(freevars), signature, _signatureplan(signature))
+
+	@_handleexpressioneval
+	def eval(self, context):
+		if self._closureinfo is None:
+			self._closureinfo = self._analyzeclosure(context)
+		(freevars, signature, bind) = self._closureinfo
+		vars = context.vars
+		if bind is None:
+			# Our signature is an AST that has to be evaluated to get the final :class:`inspect.Signature` object
+			signature = self.signature.eval(context)
+			bind = _signatureplan(signature)
+		else:
+			# If the closure for this template has already been created in the
+			# same scope (e.g. by a previous loop iteration) it can be reused
+			closure = vars.get(self.name)
+			if isinstance(closure, TemplateClosure) and closure.template is self and closure.vars is vars:
+				return
+		vars[self.name] = TemplateClosure(self, context, signature, bind, freevars)
+
+	def _python(self, python):
+		# A local template is compiled separately, here we only have to create the closure
+		AST._python(self, python)
+		if python.slot(self.name) is not None:
+			python.line("{} = vars[{!r}]".format(python.slot(self.name), self.name))
+			python._defined.add(self.name)
 
 
 @register("signature")
@@ -4226,6 +6789,8 @@ class Signature(Code):
 	The list of arguments is found in :obj:`params`.
 	"""
 
+	__slots__ = ("params",)
+
 	ul4attrs = Code.ul4attrs.union({"params"})
 
 	def __init__(self, tag=None, pos=None):
@@ -4303,6 +6868,482 @@ class Signature(Code):
 				self.params.append(param)
 
 
+###
+### Parser for the code in template tags
+###
+
+class Parser:
+	"""
+	A recursive descent parser for the code in the template tag :obj:`tag`.
+
+	The methods :meth:`expression`, :meth:`statement`, :meth:`for_` and
+	:meth:`definition` parse the code of the various tag types. They produce
+	the same AST as the ANTLR based parser generated from ``UL4.g``.
+	"""
+
+	_esc = r"""\\(?:[abtnfr"'\\]|x[0-9a-fA-F]{2}|u[0-9a-fA-F]{4}|U[0-9a-fA-F]{8})"""
+
+	_tokenizer = re.compile(r"""
+		(?P<ws>[ \t\r\n]+)
+		|(?P<string3>"{{3}}(?:[^\\"]|{esc}|"(?!""))*"{{3}}|'{{3}}(?:[^\\']|{esc}|'(?!''))*'{{3}})
+		|(?P<string>"(?:[^\\"\r\n]|{esc})*"|'(?:[^\\'\r\n]|{esc})*')
+		|(?P<date>@\(\d{{4}}-\d{{2}}-\d{{2}}(?:T(?:\d{{2}}:\d{{2}}(?::\d{{2}}(?:\.\d{{6}})?)?)?)?\))
+		|(?P<color>\#(?:[0-9a-fA-F]{{8}}|[0-9a-fA-F]{{6}}|[0-9a-fA-F]{{4}}|[0-9a-fA-F]{{3}}))
+		|(?P<float>\d+\.\d*(?:[eE][+-]?\d+)?|\.\d+(?:[eE][+-]?\d+)?|\d+[eE][+-]?\d+)
+		|(?P<int>0[bB][01]+|0[oO][0-7]+|0[xX][0-9a-fA-F]+|\d+)
+		|(?P<name>[a-zA-Z_][a-zA-Z0-9_]*)
+		|(?P<op>//=|<<=|>>=|\*\*|//|<<|>>|==|!=|<=|>=|\+=|-=|\*=|/=|%=|&=|\^=|\|=|[-+*/%&^|~<>=()\[\]{{}}.,:])
+	""".format(esc=_esc), re.VERBOSE)
+
+	_keywords = {"None", "True", "False", "for", "in", "if", "else", "not", "is", "and", "or"}
+
+	def __init__(self, tag):
+		self.tag = tag
+		self.tokens = self._tokenize(tag.code, tag.codepos.start)
+		self.index = 0
+
+	def _tokenize(self, code, offset):
+		# Return a list of ``(type, text, start, stop)`` tuples
+		tokens = []
+		pos = 0
+		match = self._tokenizer.match
+		while pos < len(code):
+			m = match(code, pos)
+			if m is None:
+				if code[pos] in "\"'":
+					raise SyntaxError("Unterminated string or invalid escape sequence")
+				raise SyntaxError("invalid character {!r}".format(code[pos]))
+			type = m.lastgroup
+			text = m.group()
+			if type == "name":
+				if text in self._keywords:
+					type = text
+			elif type == "op":
+				type = text
+			if type != "ws":
+				tokens.append((type, text, offset+pos, offset+m.end()))
+			pos = m.end()
+		tokens.append(("eof", "", offset+pos, offset+pos))
+		return tokens
+
+	def _type(self):
+		return self.tokens[self.index][0]
+
+	def _accept(self, type):
+		token = self.tokens[self.index]
+		if token[0] == type:
+			self.index += 1
+			return token
+		return None
+
+	def _expect(self, type):
+		token = self.tokens[self.index]
+		if token[0] == type:
+			self.index += 1
+			return token
+		raise self._error(repr(type) if type != "eof" else "end of code")
+
+	def _error(self, expected):
+		(type, text, start, stop) = self.tokens[self.index]
+		found = "end of code" if type == "eof" else repr(text)
+		return SyntaxError("{} expected, found {} at offset {}".format(expected, found, _offset(slice(start, stop))))
+
+	def _atom(self):
+		(type, text, start, stop) = self.tokens[self.index]
+		if type == "[":
+			return self._list()
+		elif type == "{":
+			return self._setordict()
+		elif type == "(":
+			self.index += 1
+			node = self._exprarg()
+			close = self._expect(")")
+			node.pos = slice(start, close[3])
+			return node
+
+		pos = slice(start, stop)
+		if type == "name":
+			node = Var(self.tag, pos, text)
+		elif type == "None":
+			node = Const(self.tag, pos, None)
+		elif type == "True":
+			node = Const(self.tag, pos, True)
+		elif type == "False":
+			node = Const(self.tag, pos, False)
+		elif type == "int":
+			node = Const(self.tag, pos, int(text, 0))
+		elif type == "float":
+			node = Const(self.tag, pos, float(text))
+		elif type == "string":
+			node = Const(self.tag, pos, ast.literal_eval(text))
+		elif type == "string3":
+			node = Const(self.tag, pos, ast.literal_eval(text.replace("\r", "\\r")))
+		elif type == "date":
+			node = Const(self.tag, pos, datetime.datetime(*map(int, [f for f in _datesplitter.split(text[2:-1]) if f])))
+		elif type == "color":
+			from ll import color
+			node = Const(self.tag, pos, color.Color.fromrepr(text))
+		else:
+			raise self._error("expression")
+		self.index += 1
+		return node
+
+	def _comprehension(self):
+		# Parse the part of a comprehension after the ``for`` and return ``(varname, container, condition)``
+		varname = self._nestedlvalue()
+		self._expect("in")
+		container = self._expr_if()
+		condition = self._expr_if() if self._accept("if") else None
+		return (varname, container, condition)
+
+	def _items(self, node, item, parseitem, close):
+		# Parse the remaining items of a list/set/dict "literal" into :obj:`node`
+		node.items.append(item)
+		while self._accept(","):
+			if self._type() == close:
+				break
+			node.items.append(parseitem())
+		node.pos = slice(node.pos.start, self._expect(close)[3])
+		return node
+
+	def _seqitem(self):
+		star = self._accept("*")
+		if star is not None:
+			value = self._expr_if()
+			return UnpackSeqItem(self.tag, slice(star[2], value.pos.stop), value)
+		value = self._expr_if()
+		return SeqItem(self.tag, slice(value.pos.start, value.pos.stop), value)
+
+	def _dictitem(self):
+		star = self._accept("**")
+		if star is not None:
+			item = self._expr_if()
+			return UnpackDictItem(self.tag, slice(star[2], item.pos.stop), item)
+		key = self._expr_if()
+		self._expect(":")
+		value = self._expr_if()
+		return DictItem(self.tag, slice(key.pos.start, value.pos.start), key, value)
+
+	def _list(self):
+		start = self._expect("[")[2]
+		close = self._accept("]")
+		if close is not None:
+			return List(self.tag, slice(start, close[3]))
+		if self._type() != "*":
+			item = self._expr_if()
+			if self._accept("for"):
+				(varname, container, condition) = self._comprehension()
+				return ListComp(self.tag, slice(start, self._expect("]")[3]), item, varname, container, condition)
+			item = SeqItem(self.tag, slice(item.pos.start, item.pos.stop), item)
+		else:
+			item = self._seqitem()
+		return self._items(List(self.tag, slice(start, None)), item, self._seqitem, "]")
+
+	def _setordict(self):
+		start = self._expect("{")[2]
+		if self._accept("/"):
+			return Set(self.tag, slice(start, self._expect("}")[3]))
+		close = self._accept("}")
+		if close is not None:
+			return Dict(self.tag, slice(start, close[3]))
+		type = self._type()
+		if type == "**":
+			return self._items(Dict(self.tag, slice(start, None)), self._dictitem(), self._dictitem, "}")
+		elif type == "*":
+			return self._items(Set(self.tag, slice(start, None)), self._seqitem(), self._seqitem, "}")
+		item = self._expr_if()
+		if self._accept(":"):
+			value = self._expr_if()
+			if self._accept("for"):
+				(varname, container, condition) = self._comprehension()
+				return DictComp(self.tag, slice(start, self._expect("}")[3]), item, value, varname, container, condition)
+			item = DictItem(self.tag, slice(item.pos.start, value.pos.start), item, value)
+			return self._items(Dict(self.tag, slice(start, None)), item, self._dictitem, "}")
+		elif self._accept("for"):
+			(varname, container, condition) = self._comprehension()
+			return SetComp(self.tag, slice(start, self._expect("}")[3]), item, varname, container, condition)
+		item = SeqItem(self.tag, slice(item.pos.start, item.pos.stop), item)
+		return self._items(Set(self.tag, slice(start, None)), item, self._seqitem, "}")
+
+	def _nestedlvalue(self):
+		if self._type() == "(":
+			# This might be a parenthesized expression or a tuple of lvalues
+			index = self.index
+			try:
+				return self._expr_subscript()
+			except SyntaxError:
+				self.index = index
+			self.index += 1
+			lvalue = (self._nestedlvalue(),)
+			self._expect(",")
+			while self._type() != ")":
+				lvalue += (self._nestedlvalue(),)
+				if not self._accept(","):
+					break
+			self._expect(")")
+			return lvalue
+		return self._expr_subscript()
+
+	def _argument(self):
+		(type, text, start, stop) = self.tokens[self.index]
+		if type == "name" and self.tokens[self.index+1][0] == "=":
+			self.index += 2
+			value = self._exprarg()
+			return KeywordArg(self.tag, slice(start, value.pos.stop), text, value)
+		elif type == "*":
+			self.index += 1
+			value = self._exprarg()
+			return UnpackListArg(self.tag, slice(start, value.pos.stop), value)
+		elif type == "**":
+			self.index += 1
+			value = self._exprarg()
+			return UnpackDictArg(self.tag, slice(start, value.pos.stop), value)
+		value = self._exprarg()
+		return PosArg(self.tag, value.pos, value)
+
+	def _index(self):
+		# Parse an index or a slice in ``obj[...]``
+		colon = self._accept(":")
+		if colon is not None:
+			(index1, start) = (None, colon[2])
+		else:
+			index1 = self._expr_if()
+			colon = self._accept(":")
+			if colon is None:
+				return index1
+			start = index1.pos.start
+		(index2, stop) = (None, colon[3])
+		if self._type() != "]":
+			index2 = self._expr_if()
+			stop = index2.pos.stop
+		return Slice(self.tag, slice(start, stop), index1, index2)
+
+	def _expr_subscript(self):
+		node = self._atom()
+		start = node.pos.start
+		while True:
+			type = self._type()
+			if type == ".":
+				self.index += 1
+				name = self._expect("name")
+				node = Attr(self.tag, slice(node.pos.start, name[3]), node, name[1])
+			elif type == "(":
+				self.index += 1
+				node = Call(self.tag, slice(node.pos.start, None), node)
+				# Like ``UL4.g`` this accepts arguments that are not separated by commas
+				while self._type() != ")":
+					self._argument().append(node)
+					self._accept(",")
+				node.pos = slice(node.pos.start, self._expect(")")[3])
+			elif type == "[":
+				self.index += 1
+				index = self._index()
+				node = Item(self.tag, slice(start, self._expect("]")[3]), node, index)
+			else:
+				return node
+
+	def _expr_unary(self):
+		(type, text, start, stop) = self.tokens[self.index]
+		if type == "-":
+			self.index += 1
+			obj = self._expr_unary()
+			return Neg.make(self.tag, slice(start, obj.pos.stop), obj)
+		elif type == "~":
+			self.index += 1
+			obj = self._expr_unary()
+			return BitNot.make(self.tag, slice(start, obj.pos.stop), obj)
+		return self._expr_subscript()
+
+	def _binary(self, operand, operators):
+		node = operand()
+		while True:
+			cls = operators.get(self._type())
+			if cls is None:
+				return node
+			self.index += 1
+			obj2 = operand()
+			node = cls.make(self.tag, slice(node.pos.start, obj2.pos.stop), node, obj2)
+
+	def _expr_mul(self):
+		return self._binary(self._expr_unary, self._mulops)
+
+	def _expr_add(self):
+		return self._binary(self._expr_mul, self._addops)
+
+	def _expr_bitshift(self):
+		return self._binary(self._expr_add, self._shiftops)
+
+	def _expr_bitand(self):
+		return self._binary(self._expr_bitshift, self._bitandops)
+
+	def _expr_bitxor(self):
+		return self._binary(self._expr_bitand, self._bitxorops)
+
+	def _expr_bitor(self):
+		return self._binary(self._expr_bitxor, self._bitorops)
+
+	def _expr_cmp(self):
+		node = self._expr_bitor()
+		while True:
+			type = self._type()
+			if type == "not" and self.tokens[self.index+1][0] == "in":
+				self.index += 2
+				cls = NotContains
+			elif type == "is":
+				self.index += 1
+				cls = IsNot if self._accept("not") else Is
+			else:
+				cls = self._cmpops.get(type)
+				if cls is None:
+					return node
+				self.index += 1
+			obj2 = self._expr_bitor()
+			node = cls.make(self.tag, slice(node.pos.start, obj2.pos.stop), node, obj2)
+
+	def _expr_not(self):
+		token = self._accept("not")
+		if token is not None:
+			obj = self._expr_not()
+			return Not.make(self.tag, slice(token[2], obj.pos.stop), obj)
+		return self._expr_cmp()
+
+	def _expr_and(self):
+		node = self._expr_not()
+		while self._accept("and"):
+			obj2 = self._expr_not()
+			node = And(self.tag, slice(node.pos.start, obj2.pos.stop), node, obj2)
+		return node
+
+	def _expr_or(self):
+		node = self._expr_and()
+		while self._accept("or"):
+			obj2 = self._expr_and()
+			node = Or(self.tag, slice(node.pos.start, obj2.pos.stop), node, obj2)
+		return node
+
+	def _expr_if(self):
+		node = self._expr_or()
+		if self._type() == "if":
+			# Without an ``else`` this ``if`` belongs to a surrounding comprehension
+			index = self.index
+			self.index += 1
+			try:
+				objcond = self._expr_or()
+			except SyntaxError:
+				objcond = None
+			if objcond is not None and self._accept("else"):
+				objelse = self._expr_or()
+				return If.make(self.tag, slice(node.pos.start, objelse.pos.stop), node, objcond, objelse)
+			self.index = index
+		return node
+
+	def _exprarg(self):
+		node = self._expr_if()
+		if self._accept("for"):
+			(varname, container, condition) = self._comprehension()
+			stop = (condition if condition is not None else container).pos.stop
+			node = GenExpr(self.tag, slice(node.pos.start, stop), node, varname, container, condition)
+		return node
+
+	def _signature(self):
+		start = self._expect("(")[2]
+		node = Signature(self.tag, slice(start, None))
+		params = node.params
+		default = False
+		while self._type() != ")":
+			if self._accept("**"):
+				params.append(("**" + self._expect("name")[1], None))
+				self._accept(",")
+				break
+			elif self._accept("*"):
+				params.append(("*" + self._expect("name")[1], None))
+				if self._accept(",") and self._accept("**"):
+					params.append(("**" + self._expect("name")[1], None))
+					self._accept(",")
+				break
+			name = self._expect("name")[1]
+			if self._accept("="):
+				params.append((name, self._exprarg()))
+				default = True
+			elif default:
+				raise SyntaxError("parameter {!r} without default follows parameter with default".format(name))
+			else:
+				params.append((name, None))
+			if not self._accept(","):
+				break
+		node.pos = slice(start, self._expect(")")[3])
+		return node
+
+	def expression(self):
+		"""
+		Parse the code of a ``<?print?>``, ``<?printx?>``, ``<?if?>``,
+		``<?elif?>`` or ``<?render?>`` tag and return the expression.
+		"""
+		node = self._exprarg()
+		self._expect("eof")
+		return node
+
+	def statement(self):
+		"""
+		Parse the code of a ``<?code?>`` tag and return the statement.
+		"""
+		index = self.index
+		try:
+			lvalue = self._nestedlvalue()
+		except SyntaxError:
+			lvalue = None
+		if lvalue is not None and self._accept("="):
+			value = self._expr_if()
+			self._expect("eof")
+			return SetVar(self.tag, self.tag.codepos, lvalue, value)
+		self.index = index
+		try:
+			lvalue = self._expr_subscript()
+		except SyntaxError:
+			lvalue = None
+		if lvalue is not None:
+			cls = self._augops.get(self._type())
+			if cls is not None:
+				self.index += 1
+				value = self._expr_if()
+				self._expect("eof")
+				return cls(self.tag, self.tag.codepos, lvalue, value)
+		self.index = index
+		return self.expression()
+
+	def for_(self):
+		"""
+		Parse the code of a ``<?for?>`` tag and return the :class:`ForBlock`.
+		"""
+		start = self.tokens[self.index][2]
+		varname = self._nestedlvalue()
+		self._expect("in")
+		container = self._expr_if()
+		self._expect("eof")
+		return ForBlock(self.tag, slice(start, container.pos.stop), varname, container)
+
+	def definition(self):
+		"""
+		Parse the code of a ``<?def?>`` or ``<?ul4?>`` tag and return a tuple
+		with the name and the signature (either of which might be :const:`None`).
+		"""
+		name = self._accept("name")
+		if name is not None:
+			name = name[1]
+		signature = self._signature() if self._type() == "(" else None
+		self._expect("eof")
+		return (name, signature)
+
+	_mulops = {"*": Mul, "/": TrueDiv, "//": FloorDiv, "%": Mod}
+	_addops = {"+": Add, "-": Sub}
+	_shiftops = {"<<": ShiftLeft, ">>": ShiftRight}
+	_bitandops = {"&": BitAnd}
+	_bitxorops = {"^": BitXOr}
+	_bitorops = {"|": BitOr}
+	_cmpops = {"==": EQ, "!=": NE, "<": LT, "<=": LE, ">": GT, ">=": GE, "in": Contains}
+	_augops = {"+=": AddVar, "-=": SubVar, "*=": MulVar, "/=": TrueDivVar, "//=": FloorDivVar, "%=": ModVar, "<<=": ShiftLeftVar, ">>=": ShiftRightVar, "&=": BitAndVar, "^=": BitXOrVar, "|=": BitOrVar}
+
+
 ###
 ### Functions
 ###
@@ -4841,32 +7882,52 @@ def function_pow(x, y):
 
 
 class TemplateClosure(Block):
+	__slots__ = ("template", "vars", "signature", "_bind", "_freevars")
+
 	ul4attrs = Template.ul4attrs
 
-	def __init__(self, template, context, signature):
+	def __init__(self, template, context, signature, bind=None, freevars=None):
 		self.template = template
 		self.vars = context.vars
 		self.signature = signature
+		self._bind = bind if bind is not None else _signatureplan(signature)
+		self._freevars = freevars if freevars is not None else template._analyzeclosure(context)[0]
+
+	def _bindvars(self, args, kwargs):
+		# Return the variables for executing the template: The variables from
+		# the enclosing scope that the template references and the arguments
+		outer = self.vars
+		vars = {name: outer[name] for name in self._freevars if name in outer}
+		vars.update(self._bind(args, kwargs))
+		return vars
 
 	@withcontext
 	def ul4render(*args, **kwargs):
 		self = args[0]
 		context = args[1]
 		args = args[2:]
-		vars = _makevars(self.signature, args, kwargs)
-		vars = collections.ChainMap(vars, self.vars)
+		vars = self._bindvars(args, kwargs)
 		with context.replacevars(vars):
 			# Call :meth:`_renderbound` to bypass binding the arguments again
 			# (which wouldn't work anyway as ``self.template.signature`` is an :class:`AST` object)
 			yield from self.template._renderbound(context)
 
+	def ul4renderto(*args, **kwargs):
+		self = args[0]
+		context = args[1]
+		write = args[2]
+		args = args[3:]
+		vars = self._bindvars(args, kwargs)
+		with context.replacevars(vars):
+			# Call :meth:`_rendertobound` to bypass binding the arguments again
+			self.template._rendertobound(context, write)
+
 	@withcontext
 	def ul4renders(*args, **kwargs): # This will be exposed to UL4 as ``renders``
 		self = args[0]
 		context = args[1]
 		args = args[2:]
-		vars = _makevars(self.signature, args, kwargs)
-		vars = collections.ChainMap(vars, self.vars)
+		vars = self._bindvars(args, kwargs)
 		with context.replacevars(vars):
 			# Call :meth:`_renderbound` to bypass binding the arguments again
 			# (which wouldn't work anyway as ``self.template.signature`` is an :class:`AST` object)
@@ -4877,8 +7938,7 @@ class TemplateClosure(Block):
 		self = args[0]
 		context = args[1]
 		args = args[2:]
-		vars = _makevars(self.signature, args, kwargs)
-		vars = collections.ChainMap(vars, self.vars)
+		vars = self._bindvars(args, kwargs)
 		with context.replacevars(vars):
 			# Call :meth:`_renderbound` to bypass binding the arguments again
 			# (which wouldn't work anyway as ``self.template.signature`` is an :class:`AST` object)
@@ -4927,3 +7987,511 @@ class TemplateClosure(Block):
 		for node in self.content:
 			p.breakable()
 			p.pretty(node)
+
+
+###
+### Persistent cache for compiled templates
+###
+
+class TemplateCache:
+	"""
+	A :class:`TemplateCache` stores compiled templates in the directory
+	:obj:`directory`, so that templates don't have to be recompiled from
+	source each time a process starts.
+
+	The templates are stored as UL4ON dumps. The filename is the SHA-256 hash of
+	the template source, all other arguments that influence the compilation and
+	the version of :mod:`ll.ul4c`. Files are written atomically, so the cache
+	can be shared by multiple processes.
+
+	If :obj:`maxsize` is not :const:`None` it specifies the maximum total size
+	of the cache files in bytes. When this size is exceeded, the least recently
+	used files will be removed.
+	"""
+
+	suffix = ".ul4c"
+
+	def __init__(self, directory, maxsize=None):
+		self.directory = directory
+		self.maxsize = maxsize
+		self.hits = 0
+		self.misses = 0
+		# Changes to this module invalidate all cached templates
+		stat = os.stat(__file__)
+		self._moduleversion = (Template.version, stat.st_size, stat.st_mtime)
+
+	def __repr__(self):
+		return "<{}.{} directory={!r} maxsize={!r} hits={!r} misses={!r} at {:#x}>".format(self.__class__.__module__, self.__class__.__qualname__, self.directory, self.maxsize, self.hits, self.misses, id(self))
+
+	def key(self, source, name=None, whitespace="keep", startdelim="<?", enddelim="?>", signature=None, optimize=False):
+		"""
+		Return the cache key (a hex string) for the template with the source
+		:obj:`source`. The remaining arguments have the same meaning as for the
+		:class:`Template` constructor.
+		"""
+		data = (self._moduleversion, source, name, whitespace, startdelim, enddelim, signature, bool(optimize))
+		return hashlib.sha256(repr(data).encode("utf-8")).hexdigest()
+
+	def template(self, source, name=None, whitespace="keep", startdelim="<?", enddelim="?>", signature=None, backend="interpreted", optimize=False):
+		"""
+		Return a :class:`Template` object for the template source :obj:`source`.
+		The arguments have the same meaning as for the :class:`Template`
+		constructor.
+
+		If the template is in the cache it will be loaded from there, otherwise
+		it will be compiled and stored in the cache.
+
+		If :obj:`signature` is neither :const:`None` nor a string, the cache is
+		bypassed (as such a signature can't be part of the cache key).
+		"""
+		if signature is not None and not isinstance(signature, str):
+			return Template(source, name=name, whitespace=whitespace, startdelim=startdelim, enddelim=enddelim, signature=signature, backend=backend, optimize=optimize)
+		filename = os.path.join(self.directory, self.key(source, name, whitespace, startdelim, enddelim, signature, optimize) + self.suffix)
+		template = self._load(filename)
+		if template is None:
+			self.misses += 1
+			template = Template(source, name=name, whitespace=whitespace, startdelim=startdelim, enddelim=enddelim, signature=signature, optimize=optimize)
+			self._store(filename, template)
+		else:
+			self.hits += 1
+		template.backend = backend
+		return template
+
+	def clear(self):
+		"""
+		Remove all templates from the cache.
+		"""
+		for path in self._files():
+			try:
+				os.remove(path)
+			except FileNotFoundError:
+				pass # Removed by another process
+
+	def _files(self):
+		try:
+			entries = list(os.scandir(self.directory))
+		except FileNotFoundError:
+			return []
+		return [entry.path for entry in entries if entry.name.endswith(self.suffix)]
+
+	def _load(self, filename):
+		from ll import ul4on
+		try:
+			with open(filename, "r", encoding="utf-8") as f:
+				dump = f.read()
+		except FileNotFoundError:
+			return None
+		try:
+			template = ul4on.loads(dump)
+		except Exception:
+			return None # A broken file will be replaced by a fresh one
+		if not isinstance(template, Template):
+			return None
+		try:
+			os.utime(filename) # Record the access for the LRU eviction
+		except OSError:
+			pass
+		return template
+
+	def _store(self, filename, template):
+		os.makedirs(self.directory, exist_ok=True)
+		# Write to a temporary file first and rename it afterwards, so that
+		# other processes never see a partially written file
+		(fd, tempname) = tempfile.mkstemp(suffix=".tmp", dir=self.directory)
+		try:
+			with open(fd, "w", encoding="utf-8") as f:
+				f.write(template.dumps())
+			os.replace(tempname, filename)
+		except BaseException:
+			try:
+				os.remove(tempname)
+			except OSError:
+				pass
+			raise
+		if self.maxsize is not None:
+			self._evict()
+
+	def _evict(self):
+		files = []
+		size = 0
+		for path in self._files():
+			try:
+				stat = os.stat(path)
+			except FileNotFoundError:
+				continue # Removed by another process
+			files.append((stat.st_mtime, stat.st_size, path))
+			size += stat.st_size
+		files.sort()
+		for (mtime, filesize, path) in files:
+			if size <= self.maxsize:
+				break
+			try:
+				os.remove(path)
+			except FileNotFoundError:
+				pass
+			size -= filesize
+
+
+class TemplateLoader(collections.abc.Mapping):
+	"""
+	A :class:`TemplateLoader` loads templates from the files in a directory.
+	:obj:`base` can be a directory name or an :class:`ll.url.URL` object (which
+	makes it possible to load templates from remote locations).
+
+	A :class:`TemplateLoader` is a mapping that maps template names to
+	:class:`Template` objects. The template named ``foo`` is loaded from the file
+	``foo.ul4`` (if :obj:`suffix` is ``".ul4"``). Templates are loaded and
+	compiled lazily on first access. When a template is accessed again, the
+	modification date of its file is checked (at most every
+	:obj:`checkinterval` seconds) and the template is recompiled if the file
+	has changed.
+
+	The :class:`TemplateLoader` can be passed to other templates, so that
+	those can render the templates (e.g. ``<?render templates.foo()?>``).
+	Which templates render (or call) which other templates is tracked (see
+	:meth:`dependencies` and :meth:`dependents`).
+
+	:obj:`encoding` is the encoding of the template files. :obj:`whitespace`,
+	:obj:`startdelim`, :obj:`enddelim`, :obj:`backend` and :obj:`optimize` are
+	passed to the :class:`Template` constructor. If :obj:`cache` is not
+	:const:`None`, it must be a :class:`TemplateCache` that will be used for
+	compiling the templates.
+
+	:class:`TemplateLoader` objects are thread safe, so they can be used to
+	share compiled templates between threads.
+	"""
+
+	def __init__(self, base, suffix=".ul4", encoding="utf-8", whitespace="keep", startdelim="<?", enddelim="?>", backend="interpreted", optimize=False, checkinterval=0., cache=None):
+		import threading
+		from ll import url
+		if not isinstance(base, url.URL):
+			base = url.Dir(base)
+		self.base = base
+		self.suffix = suffix
+		self.encoding = encoding
+		self.whitespace = whitespace
+		self.startdelim = startdelim
+		self.enddelim = enddelim
+		self.backend = backend
+		self.optimize = optimize
+		self.checkinterval = checkinterval
+		self.cache = cache
+		self._lock = threading.RLock()
+		self._entries = {} # Maps template names to ``(template, mdate, time of last check, dependencies)``
+
+	def __repr__(self):
+		return "<{}.{} base={!r} suffix={!r} loaded={!r} at {:#x}>".format(self.__class__.__module__, self.__class__.__qualname__, str(self.base), self.suffix, len(self._entries), id(self))
+
+	def url(self, name):
+		"""
+		Return the URL of the file for the template named :obj:`name`.
+		"""
+		return self.base/(name + self.suffix)
+
+	def __getitem__(self, name):
+		with self._lock:
+			entry = self._entries.get(name)
+			if entry is not None:
+				(template, mdate, checked, dependencies) = entry
+				now = time.monotonic()
+				if now - checked < self.checkinterval:
+					return template
+				try:
+					newmdate = self.url(name).mdate()
+				except OSError:
+					del self._entries[name] # File has been removed
+					raise KeyError(name)
+				if newmdate == mdate:
+					self._entries[name] = (template, mdate, now, dependencies)
+					return template
+			return self._load(name)
+
+	def _load(self, name):
+		u = self.url(name)
+		try:
+			mdate = u.mdate()
+			with u.openread() as f:
+				source = f.read()
+		except OSError:
+			self._entries.pop(name, None)
+			raise KeyError(name)
+		if isinstance(source, bytes):
+			source = source.decode(self.encoding)
+		if self.cache is not None:
+			template = self.cache.template(source, name=name, whitespace=self.whitespace, startdelim=self.startdelim, enddelim=self.enddelim, backend=self.backend, optimize=self.optimize)
+		else:
+			template = Template(source, name=name, whitespace=self.whitespace, startdelim=self.startdelim, enddelim=self.enddelim, backend=self.backend, optimize=self.optimize)
+		self._entries[name] = (template, mdate, time.monotonic(), self._references(template))
+		return template
+
+	def __contains__(self, name):
+		try:
+			self[name]
+		except KeyError:
+			return False
+		return True
+
+	def __iter__(self):
+		"""
+		Iterate through the names of all templates in the directory (this requires
+		that the directory can be listed, which is not the case for ``http``
+		URLs).
+		"""
+		for u in self.base.files(include="*" + self.suffix):
+			yield str(u)[:-len(self.suffix)]
+
+	def __len__(self):
+		return sum(1 for name in self)
+
+	@staticmethod
+	def _references(template):
+		# Return the names of the templates that :obj:`template` renders or calls
+		# (i.e. the ``foo`` in ``<?render foo()?>``, ``<?render templates.foo()?>``,
+		# ``<?code x = templates["foo"]()?>`` or ``<?print templates.foo.renders()?>``)
+		names = set()
+		nodes = [template]
+		while nodes:
+			node = nodes.pop()
+			if isinstance(node, Call):
+				obj = node.obj
+				if isinstance(obj, Attr) and obj.attrname == "renders":
+					obj = obj.obj
+				if isinstance(obj, Var):
+					names.add(obj.name)
+				elif isinstance(obj, Attr):
+					names.add(obj.attrname)
+				elif isinstance(obj, Item) and isinstance(obj.obj2, Const) and isinstance(obj.obj2.value, str):
+					names.add(obj.obj2.value)
+			nodes.extend(node._subnodes())
+		return names
+
+	def loaded(self):
+		"""
+		Return the names of the templates that have been loaded so far.
+		"""
+		with self._lock:
+			return set(self._entries)
+
+	def _exists(self, name):
+		# Return whether the file for the template named :obj:`name` exists (without loading the template)
+		try:
+			return self.url(name).isfile()
+		except OSError:
+			return False
+
+	def dependencies(self, name):
+		"""
+		Return the names of the templates that the template named :obj:`name`
+		renders or calls (directly). Only the template :obj:`name` itself will be
+		loaded for this.
+		"""
+		self[name] # Make sure the template is loaded and up to date
+		with self._lock:
+			references = self._entries[name][3]
+		return {reference for reference in references if reference != name and self._exists(reference)}
+
+	def dependents(self, name):
+		"""
+		Return the names of the loaded templates that render or call the template
+		named :obj:`name` (directly or indirectly).
+		"""
+		with self._lock:
+			references = {othername: entry[3] for (othername, entry) in self._entries.items()}
+		result = set()
+		todo = {name}
+		while todo:
+			current = todo.pop()
+			for (othername, names) in references.items():
+				if current in names and othername != name and othername not in result:
+					result.add(othername)
+					todo.add(othername)
+		return result
+
+	def check(self):
+		"""
+		Check the loaded templates for changes. Changed templates will be
+		reloaded on their next access. Returns the names of the templates whose
+		output might have changed, i.e. the changed templates and all templates
+		that depend on them.
+		"""
+		with self._lock:
+			changed = set()
+			for (name, (template, mdate, checked, dependencies)) in self._entries.items():
+				try:
+					newmdate = self.url(name).mdate()
+				except OSError:
+					newmdate = None
+				if newmdate != mdate:
+					changed.add(name)
+			result = set(changed)
+			for name in changed:
+				result.update(self.dependents(name))
+			for name in changed:
+				del self._entries[name]
+			return result
+
+	def clear(self):
+		"""
+		Forget all loaded templates.
+		"""
+		with self._lock:
+			self._entries.clear()
+
+
+class RenderCache:
+	"""
+	A :class:`RenderCache` stores the output of rendering templates in memory,
+	so that templates that are rendered with the same arguments over and over
+	again (like navigation bars or footers) only have to be rendered once.
+
+	Calling the :class:`RenderCache` object with a template (or a local
+	template) returns a :class:`CachedTemplate` object that can be rendered in
+	place of the template. This can be done in Python code or inside a template
+	(when the :class:`RenderCache` object is passed to the template)::
+
+		<?def nav(page)?>
+			...
+		<?end def?>
+		<?code nav = cache(nav)?>
+		<?render nav(page="home")?>
+
+	The cache key consists of the template, the arguments of the call (which
+	must be hashable, otherwise the output isn't cached), the current indentation
+	and the optional explicit key passed when creating the
+	:class:`CachedTemplate` object. A local template will be cached
+	independently of the variables it sees from its parent template, so if its
+	output depends on those, they must be part of the explicit key.
+
+	At most :obj:`maxsize` outputs are stored, when this size is exceeded the
+	least recently used output is removed. The attributes :attr:`hits` and
+	:attr:`misses` count cache hits and misses.
+	"""
+
+	def __init__(self, maxsize=1000):
+		import threading
+		self.maxsize = maxsize
+		self.hits = 0
+		self.misses = 0
+		self._outputs = collections.OrderedDict()
+		self._lock = threading.Lock()
+
+	def __repr__(self):
+		return "<{}.{} maxsize={!r} size={!r} hits={!r} misses={!r} at {:#x}>".format(self.__class__.__module__, self.__class__.__qualname__, self.maxsize, len(self), self.hits, self.misses, id(self))
+
+	def __call__(self, template, key=None):
+		"""
+		Return a :class:`CachedTemplate` object for :obj:`template` (a
+		:class:`Template` or a local template) with the explicit cache key
+		:obj:`key`.
+		"""
+		return CachedTemplate(self, template, key)
+
+	def __len__(self):
+		return len(self._outputs)
+
+	def clear(self):
+		"""
+		Remove all outputs from the cache (and reset the statistics).
+		"""
+		with self._lock:
+			self._outputs.clear()
+			self.hits = 0
+			self.misses = 0
+
+	def _get(self, key):
+		# Return the cached output for :obj:`key` or :const:`None` if it's not in the cache (or :obj:`key` is :const:`None`)
+		with self._lock:
+			try:
+				if key is None:
+					raise KeyError(key)
+				output = self._outputs[key]
+			except KeyError:
+				self.misses += 1
+				return None
+			self._outputs.move_to_end(key)
+			self.hits += 1
+			return output
+
+	def _set(self, key, output):
+		with self._lock:
+			self._outputs[key] = output
+			self._outputs.move_to_end(key)
+			while len(self._outputs) > self.maxsize:
+				self._outputs.popitem(last=False)
+
+
+class CachedTemplate:
+	"""
+	A :class:`CachedTemplate` object wraps a template, so that rendering it
+	uses the :class:`RenderCache` :obj:`cache`. It is created by calling the
+	:class:`RenderCache` object.
+	"""
+	ul4attrs = {"template", "key"}
+
+	def __init__(self, cache, template, key=None):
+		self.cache = cache
+		self.template = template
+		self.key = key
+
+	def __repr__(self):
+		return "<{}.{} template={!r} key={!r} at {:#x}>".format(self.__class__.__module__, self.__class__.__qualname__, self.template, self.key, id(self))
+
+	def _cachekey(self, context, args, kwargs):
+		# Return the key for the output or :const:`None` if the arguments aren't hashable
+		template = self.template
+		if isinstance(template, TemplateClosure):
+			template = template.template
+		try:
+			key = (template, self.key, tuple(args), frozenset(kwargs.items()), tuple(context.indents))
+			hash(key)
+		except TypeError:
+			return None
+		return key
+
+	@withcontext
+	def ul4render(*args, **kwargs):
+		self = args[0]
+		context = args[1]
+		args = args[2:]
+		key = self._cachekey(context, args, kwargs)
+		output = self.cache._get(key)
+		if output is not None:
+			yield output
+		else:
+			parts = []
+			for part in self.template.ul4render(context, *args, **kwargs):
+				parts.append(part)
+				yield part
+			if key is not None:
+				self.cache._set(key, "".join(parts))
+
+	def ul4renderto(*args, **kwargs):
+		self = args[0]
+		context = args[1]
+		write = args[2]
+		args = args[3:]
+		key = self._cachekey(context, args, kwargs)
+		output = self.cache._get(key)
+		if output is not None:
+			write(output)
+		else:
+			parts = []
+			def collect(part):
+				parts.append(part)
+				write(part)
+			self.template.ul4renderto(context, collect, *args, **kwargs)
+			if key is not None:
+				self.cache._set(key, "".join(parts))
+
+	def render(*args, **kwargs):
+		"""
+		Render the template iteratively (using the cache).
+		"""
+		context = Context()
+		yield from args[0].ul4render(context, *args[1:], **kwargs)
+
+	def renders(*args, **kwargs):
+		"""
+		Render the template as a string (using the cache).
+		"""
+		return "".join(args[0].render(*args[1:], **kwargs))
@@ -176,9 +176,19 @@ global registry.
 .. note::
 	If a class isn't registered with the UL4ON serialization machinery, you have
 	to set the class attribute ``ul4onname`` yourself for serialization to work.
+
+There's also a more compact binary variant of the format that is faster to
+encode and decode (but is only supported by this module)::
+
+	>>> ul4on.dumps([1, "foo"], binary=True)
+	b'UL4ON\x01Li\x02S\x03foo]'
+	>>> ul4on.loads(b'UL4ON\x01Li\x02S\x03foo]')
+	[1, 'foo']
+
+:func:`load` and :func:`loads` detect binary dumps automatically.
 """
 
-import sys, datetime, collections, io, ast
+import sys, re, datetime, collections, io, ast, struct, codecs
 
 
 __docformat__ = "reStructuredText"
@@ -186,6 +196,31 @@ __docformat__ = "reStructuredText"
 
 _registry = {}
 
+# Maps :class:`Encoder` classes to dictionaries that map types to the method
+# of the encoder class that dumps objects of this type (filled on first use of
+# each type, see :meth:`Encoder._dump`)
+_handlers = {}
+
+
+# Regular expressions used by the :class:`Decoder`
+# Tokenizes the next object: Either a typecode with a value that doesn't require
+# further parsing (group 1 and 2 for ints, floats and backreferences, 3 and 4
+# for bools and 5 and 6 or 7 for strings) or only the typecode (group 8)
+_objectre = re.compile(r"""\s*(?:([iIfF^])(\S*)|([bB])(.)|([sS])(?:'([^'\\]*(?:\\.[^'\\]*)*)'|"([^"\\]*(?:\\.[^"\\]*)*)")|(\S))""", re.DOTALL)
+_nextcharre = re.compile(r"\s*(\S)") # Skips whitespace and returns the next character (i.e. the typecode)
+
+# Returned by :meth:`Decoder._load` for the terminator of a list, dict or set
+_end = object()
+_tokenre = re.compile(r"\S*") # Everything up to the next whitespace (the value of ints, floats and backreferences)
+_strres = {
+	"'": re.compile(r"'([^'\\]*(?:\\.[^'\\]*)*)'", re.DOTALL),
+	'"': re.compile(r'"([^"\\]*(?:\\.[^"\\]*)*)"', re.DOTALL),
+}
+
+# Used for floats in binary UL4ON dumps
+_packfloat = struct.Struct("<d").pack
+_unpackfloat = struct.Struct("<d").unpack_from
+
 
 if sys.version_info >= (3, 6):
 	ordereddict = dict
@@ -217,7 +252,15 @@ class Encoder:
 
 	It manages the internal state required for handling backreferences and other
 	stuff.
+
+	Iterables that aren't sequences, mappings or sets (e.g. generators or database
+	cursors) are dumped as lists. Their items are written to the stream as soon
+	as they have been dumped and are not kept alive by the encoder afterwards, so
+	they can be dumped in constant memory. (This means that an object that is
+	part of such an item can't be the target of a backreference from outside of
+	this item: It will be dumped again if it turns up later.)
 	"""
+
 	def __init__(self, stream, indent=None):
 		"""
 		Create an encoder for serializing objects to  :obj:`self.stream`.
@@ -231,104 +274,370 @@ class Encoder:
 		self._first = True # Remember whether we have dumped something into the stream (so we have to write separator whitespace/indentation) or not
 		self._objects = []
 		self._id2index = {}
+		self._forgotten = 0 # Number of recorded objects that have been removed from :obj:`_objects` by :meth:`_forget`
+		self._output = None # Collects the output of the current top level :meth:`dump` call
+		# Maps types to the method that dumps objects of this type (shared by all encoders of the same class)
+		self._handlers = _handlers.setdefault(self.__class__, {})
 
 	def _record(self, obj):
 		# Record that we've written this object and in which position
-		self._id2index[id(obj)] = len(self._objects)
+		self._id2index[id(obj)] = self._forgotten + len(self._objects)
 		self._objects.append(obj)
 
+	def _forget(self, count):
+		# Forget all objects recorded after the first :obj:`count` ones, so they
+		# are no longer kept alive (and will be dumped again if they turn up later)
+		objects = self._objects
+		for obj in objects[count:]:
+			del self._id2index[id(obj)]
+		self._forgotten += len(objects) - count
+		del objects[count:]
+
+	def _flush(self):
+		# Write the output collected so far to the stream
+		self.stream.write("".join(self._output))
+		del self._output[:]
+
+	def _dump_items(self, iterable):
+		# Dump the items of an iterable that isn't a sequence (e.g. a generator or a database cursor).
+		# As there might be lots of them, each item is written to the stream and forgotten as soon as
+		# it has been dumped, so they don't have to be kept in memory.
+		output = self._output
+		objects = self._objects
+		for item in iterable:
+			count = len(objects)
+			self._dump(item)
+			self._forget(count)
+			if len(output) >= 1000:
+				self._flush()
+
 	def _line(self, line, *items):
+		output = self._output
 		if self.indent:
-			self.stream.write(self.indent*self._level)
+			output.append(self.indent*self._level)
 		else:
 			if not self._first:
-				self.stream.write(" ")
+				output.append(" ")
 		self._first = False
-		self.stream.write(line)
+		output.append(line)
 		if items:
 			oldindent = self.indent
 			try:
 				self.indent = ""
 				for item in items:
-					self.dump(item)
+					self._dump(item)
 			finally:
 				self.indent = oldindent
 		if self.indent:
-			self.stream.write("\n")
+			output.append("\n")
 
 	def dump(self, obj):
 		"""
 		Serialize :obj:`obj` into the tream as an UL4ON formatted dump.
 		"""
+		if self._output is not None:
+			# We're called from an ``ul4ondump()`` method during a dump
+			self._dump(obj)
+		else:
+			# Collect the output and write it to the stream in one go
+			self._output = []
+			try:
+				self._dump(obj)
+			finally:
+				output = self._output
+				self._output = None
+				self.stream.write("".join(output))
+
+	def _dump(self, obj):
 		# Have we written this object already?
-		if id(obj) in self._id2index:
+		index = self._id2index.get(id(obj))
+		if index is not None:
 			# Yes: Store a backreference to the object
-			self._line("^{}".format(self._id2index[id(obj)]))
+			self._dump_backref(index)
 		else:
-			from ll import ul4c, color, misc
 			# No: Write the object itself
-			# We're not using backreferences if the object itself has a shorter dump
-			if obj is None:
-				self._line("n")
-			elif isinstance(obj, bool):
-				self._line("bT" if obj else "bF")
-			elif isinstance(obj, int):
-				self._line("i{}".format(obj))
-			elif isinstance(obj, float):
-				self._line("f{!r}".format(obj))
-			elif isinstance(obj, str):
-				self._record(obj)
-				self._line("S{!r}".format(obj))
-			elif isinstance(obj, slice):
-				self._record(obj)
-				self._line("R", obj.start, obj.stop)
-			elif isinstance(obj, color.Color):
-				self._record(obj)
-				self._line("C", obj.r(), obj.g(), obj.b(), obj.a())
-			elif isinstance(obj, datetime.datetime):
-				self._record(obj)
-				self._line("Z", obj.year, obj.month, obj.day, obj.hour, obj.minute, obj.second, obj.microsecond)
-			elif isinstance(obj, datetime.date):
-				self._record(obj)
-				self._line("Z", obj.year, obj.month, obj.day, 0, 0, 0, 0)
-			elif isinstance(obj, datetime.timedelta):
-				self._record(obj)
-				self._line("T", obj.days, obj.seconds, obj.microseconds)
-			elif isinstance(obj, misc.monthdelta):
-				self._record(obj)
-				self._line("M", obj.months())
-			elif isinstance(obj, collections.Sequence):
-				self._record(obj)
-				self._line("L")
-				self._level += 1
-				for item in obj:
-					self.dump(item)
-				self._level -= 1
-				self._line("]")
-			elif isinstance(obj, collections.Mapping):
-				self._record(obj)
-				self._line("E" if isinstance(obj, ordereddict) else "D")
-				self._level += 1
-				for (key, item) in list(obj.items()):
-					self.dump(key)
-					self.dump(item)
-				self._level -= 1
-				self._line("}")
-			elif isinstance(obj, collections.Set):
-				self._record(obj)
-				self._line("Y")
-				self._level += 1
-				for item in obj:
-					self.dump(item)
-				self._level -= 1
-				self._line("}")
-			else:
-				self._record(obj)
-				self._line("O", obj.ul4onname)
-				self._level += 1
-				obj.ul4ondump(self)
-				self._level -= 1
-				self._line(")")
+			cls = type(obj)
+			try:
+				handler = self._handlers[cls]
+			except KeyError:
+				handler = self._handlers[cls] = getattr(self.__class__, _encoder(cls))
+			handler(self, obj)
+
+	def _dump_backref(self, index):
+		self._line("^{}".format(index))
+
+	def _dump_none(self, obj):
+		self._line("n")
+
+	def _dump_bool(self, obj):
+		self._line("bT" if obj else "bF")
+
+	def _dump_int(self, obj):
+		self._line("i{}".format(obj))
+
+	def _dump_float(self, obj):
+		self._line("f{!r}".format(obj))
+
+	def _dump_str(self, obj):
+		self._record(obj)
+		self._line("S{!r}".format(obj))
+
+	def _dump_slice(self, obj):
+		self._record(obj)
+		self._line("R", obj.start, obj.stop)
+
+	def _dump_color(self, obj):
+		self._record(obj)
+		self._line("C", obj.r(), obj.g(), obj.b(), obj.a())
+
+	def _dump_datetime(self, obj):
+		self._record(obj)
+		self._line("Z", obj.year, obj.month, obj.day, obj.hour, obj.minute, obj.second, obj.microsecond)
+
+	def _dump_date(self, obj):
+		self._record(obj)
+		self._line("Z", obj.year, obj.month, obj.day, 0, 0, 0, 0)
+
+	def _dump_timedelta(self, obj):
+		self._record(obj)
+		self._line("T", obj.days, obj.seconds, obj.microseconds)
+
+	def _dump_monthdelta(self, obj):
+		self._record(obj)
+		self._line("M", obj.months())
+
+	def _dump_list(self, obj):
+		self._record(obj)
+		self._line("L")
+		self._level += 1
+		for item in obj:
+			self._dump(item)
+		self._level -= 1
+		self._line("]")
+
+	def _dump_dict(self, obj):
+		self._record(obj)
+		self._line("E" if isinstance(obj, ordereddict) else "D")
+		self._level += 1
+		for (key, item) in list(obj.items()):
+			self._dump(key)
+			self._dump(item)
+		self._level -= 1
+		self._line("}")
+
+	def _dump_set(self, obj):
+		self._record(obj)
+		self._line("Y")
+		self._level += 1
+		for item in obj:
+			self._dump(item)
+		self._level -= 1
+		self._line("}")
+
+	def _dump_iter(self, obj):
+		self._record(obj)
+		self._line("L")
+		self._level += 1
+		self._dump_items(obj)
+		self._level -= 1
+		self._line("]")
+
+	def _dump_object(self, obj):
+		self._record(obj)
+		self._line("O", obj.ul4onname)
+		self._level += 1
+		obj.ul4ondump(self)
+		self._level -= 1
+		self._line(")")
+
+
+def _encoder(cls):
+	# Return the name of the :class:`Encoder` method for dumping objects of type :obj:`cls`
+	from ll import color, misc
+	if cls is type(None):
+		return "_dump_none"
+	elif issubclass(cls, bool):
+		return "_dump_bool"
+	elif issubclass(cls, int):
+		return "_dump_int"
+	elif issubclass(cls, float):
+		return "_dump_float"
+	elif issubclass(cls, str):
+		return "_dump_str"
+	elif issubclass(cls, slice):
+		return "_dump_slice"
+	elif issubclass(cls, color.Color):
+		return "_dump_color"
+	elif issubclass(cls, datetime.datetime):
+		return "_dump_datetime"
+	elif issubclass(cls, datetime.date):
+		return "_dump_date"
+	elif issubclass(cls, datetime.timedelta):
+		return "_dump_timedelta"
+	elif issubclass(cls, misc.monthdelta):
+		return "_dump_monthdelta"
+	elif issubclass(cls, collections.Sequence):
+		return "_dump_list"
+	elif issubclass(cls, collections.Mapping):
+		return "_dump_dict"
+	elif issubclass(cls, collections.Set):
+		return "_dump_set"
+	elif issubclass(cls, collections.Iterable) and not hasattr(cls, "ul4ondump"):
+		return "_dump_iter"
+	else:
+		return "_dump_object"
+
+
+# Binary UL4ON dumps start with this prefix
+_binarymagic = b"UL4ON\x01"
+
+
+def _varint(value):
+	# Encode the non-negative integer :obj:`value` as a varint (7 bits per byte, least significant group first)
+	if value < 0x80:
+		return _bytes[value]
+	output = bytearray()
+	while value >= 0x80:
+		output.append((value & 0x7f) | 0x80)
+		value >>= 7
+	output.append(value)
+	return bytes(output)
+
+
+# ``bytes`` objects for one byte varints
+_bytes = [bytes((i,)) for i in range(0x80)]
+
+# Dumps of backreferences and ints that fit into one byte varints
+# (negative ints use negative indexes into the list)
+_backrefs = [b"^" + _bytes[i] for i in range(0x80)]
+_smallints = [b"i" + _bytes[i << 1] for i in range(0x40)] + [b"i" + _bytes[((-i) << 1) - 1] for i in range(-0x40, 0)]
+
+
+class BinaryEncoder(Encoder):
+	"""
+	A :class:`BinaryEncoder` serializes objects into binary UL4ON dumps.
+
+	The binary format uses the same object model as the text format (i.e. the
+	same type codes, backreferences and ``ul4ondump`` methods), but integers
+	are stored as varints (in zigzag encoding), floats as eight byte IEEE
+	values and strings as UTF-8 prefixed with their length. There's no
+	whitespace between objects and the dump starts with a short magic header.
+
+	:obj:`stream` must provide a :meth:`write` method that accepts
+	:class:`bytes` objects.
+	"""
+
+	def __init__(self, stream):
+		super().__init__(stream)
+		self._first = True # Write the magic header before the first object
+
+	def dump(self, obj):
+		"""
+		Serialize :obj:`obj` into the stream as a binary UL4ON formatted dump.
+		"""
+		if self._output is not None:
+			self._dump(obj)
+		else:
+			self._output = []
+			if self._first:
+				self._output.append(_binarymagic)
+				self._first = False
+			try:
+				self._dump(obj)
+			finally:
+				output = self._output
+				self._output = None
+				self.stream.write(b"".join(output))
+
+	def _flush(self):
+		self.stream.write(b"".join(self._output))
+		del self._output[:]
+
+	def _items(self, code, *items):
+		self._output.append(code)
+		for item in items:
+			self._dump(item)
+
+	def _dump_backref(self, index):
+		self._output.append(_backrefs[index] if index < 0x80 else b"^" + _varint(index))
+
+	def _dump_none(self, obj):
+		self._output.append(b"n")
+
+	def _dump_bool(self, obj):
+		self._output.append(b"bT" if obj else b"bF")
+
+	def _dump_int(self, obj):
+		if -0x40 <= obj < 0x40:
+			self._output.append(_smallints[obj])
+		else:
+			self._output.append(b"i" + _varint(obj << 1 if obj >= 0 else ((-obj) << 1) - 1))
+
+	def _dump_float(self, obj):
+		self._output.append(b"f" + _packfloat(obj))
+
+	def _dump_str(self, obj):
+		self._record(obj)
+		data = obj.encode("utf-8", "surrogatepass")
+		self._output.append(b"S" + _varint(len(data)) + data)
+
+	def _dump_slice(self, obj):
+		self._record(obj)
+		self._items(b"R", obj.start, obj.stop)
+
+	def _dump_color(self, obj):
+		self._record(obj)
+		self._items(b"C", obj.r(), obj.g(), obj.b(), obj.a())
+
+	def _dump_datetime(self, obj):
+		self._record(obj)
+		self._items(b"Z", obj.year, obj.month, obj.day, obj.hour, obj.minute, obj.second, obj.microsecond)
+
+	def _dump_date(self, obj):
+		self._record(obj)
+		self._items(b"Z", obj.year, obj.month, obj.day, 0, 0, 0, 0)
+
+	def _dump_timedelta(self, obj):
+		self._record(obj)
+		self._items(b"T", obj.days, obj.seconds, obj.microseconds)
+
+	def _dump_monthdelta(self, obj):
+		self._record(obj)
+		self._items(b"M", obj.months())
+
+	def _dump_list(self, obj):
+		self._record(obj)
+		self._output.append(b"L")
+		for item in obj:
+			self._dump(item)
+		self._output.append(b"]")
+
+	def _dump_dict(self, obj):
+		self._record(obj)
+		self._output.append(b"E" if isinstance(obj, ordereddict) else b"D")
+		for (key, item) in list(obj.items()):
+			self._dump(key)
+			self._dump(item)
+		self._output.append(b"}")
+
+	def _dump_set(self, obj):
+		self._record(obj)
+		self._output.append(b"Y")
+		for item in obj:
+			self._dump(item)
+		self._output.append(b"}")
+
+	def _dump_iter(self, obj):
+		self._record(obj)
+		self._output.append(b"L")
+		self._dump_items(obj)
+		self._output.append(b"]")
+
+	def _dump_object(self, obj):
+		self._record(obj)
+		self._items(b"O", obj.ul4onname)
+		obj.ul4ondump(self)
+		self._output.append(b")")
 
 
 class Decoder:
@@ -338,11 +647,21 @@ class Decoder:
 	It manages the internal state required for handling backreferences and other
 	stuff.
 	"""
-	def __init__(self, stream, registry=None):
+	def __init__(self, stream, registry=None, bufsize=None):
 		"""
 		Create a decoder for deserializing objects from  :obj:`self.stream`.
 
-		:obj:`stream` must provide a :meth:`read` method.
+		:obj:`stream` must provide a :meth:`read` method. If :obj:`bufsize` is
+		:const:`None` (the default) the decoder reads only what it needs for the
+		objects returned by :meth:`load` (plus the whitespace character
+		terminating a top level int or float in the text format). So the decoder
+		doesn't block waiting for data that isn't part of the object (e.g. when
+		reading from a pipe or socket) and the stream is positioned after the
+		object when :meth:`load` returns.
+
+		Otherwise the decoder reads the stream in chunks of (at least)
+		:obj:`bufsize` characters. This is faster, but the decoder might read
+		beyond the end of the object returned by :meth:`load`.
 
 		:obj:`registry` is used as a "custom type registry". It must map UL4ON
 		type names to callables that create new empty instances of those types.
@@ -350,6 +669,10 @@ class Decoder:
 		registry (see :func:`register`).
 		"""
 		self.stream = stream
+		self.bufsize = bufsize
+		self._buffer = "" # The part of the stream we've read so far (or the complete dump for :func:`loads`)
+		self._pos = 0 # The position of the next unprocessed character in :obj:`_buffer`
+		self._offset = 0 # The position of :obj:`_buffer` in the stream (for error messages)
 		self._objects = []
 		self._keycache = {} # Used for "interning" dictionary keys
 		self.registry = registry
@@ -358,27 +681,207 @@ class Decoder:
 		"""
 		Deserialize the next object in the stream and return it.
 		"""
+		self._begin()
 		return self._load(None)
 
-	def _readint(self):
-		buffer = []
+	def iterload(self, items=False):
+		"""
+		Deserialize all remaining objects in the stream and return an iterator
+		over them.
+
+		If :obj:`items` is true, top level lists will not be returned, instead
+		their items will be returned one by one, as soon as they have been
+		deserialized (i.e. the list itself will never be created). This makes it
+		possible to process huge lists piece by piece.
+
+		Note that all objects that can be the target of backreferences will still
+		be kept alive by the decoder (for dumps created by :class:`Encoder` this
+		means all objects except :const:`None`, bools, ints and floats).
+		"""
 		while True:
-			c = self.stream.read(1)
-			if c and not c.isspace():
-				buffer.append(c)
+			try:
+				self._begin()
+				typecode = self._nextchar()
+			except EOFError:
+				return
+			if items and typecode in "lL":
+				value = []
+				if typecode == "L":
+					self._loading(value)
+				while True:
+					item = self._load(None, "]")
+					if item is _end:
+						break
+					yield item
 			else:
-				return int("".join(buffer))
+				yield self._load(typecode)
+
+	def events(self):
+		"""
+		Deserialize the next object in the stream and return an iterator of
+		``(event, value)`` tuples describing it (without creating lists,
+		dictionaries and sets). The following events are produced:
+
+		``"enterlist"``, ``"enterdict"``, ``"enterset"``
+			The start of a list, dictionary or set. :obj:`value` is an empty
+			list, dictionary or set that will be used for backreferences to this
+			object (it won't be filled by the decoder).
+
+		``"leavelist"``, ``"leavedict"``, ``"leaveset"``
+			The end of a list, dictionary or set. :obj:`value` is the same object
+			as for the corresponding ``"enter..."`` event.
+
+		``"value"``
+			Any other object (or a backreference). Objects with a custom
+			``ul4onload`` method (e.g. templates) are reported as one ``"value"``
+			event, as the order of their content is defined by this method.
+
+		Inside a dictionary keys and values are reported alternately.
+		"""
+		self._begin()
+		stack = [] # ``(terminator, kind, value, count)`` for each list, dictionary and set we're in
+		while True:
+			typecode = self._nextchar()
+			if stack and typecode == stack[-1][0]:
+				(terminator, kind, value, count) = stack.pop()
+				if kind == "dict" and count % 2:
+					raise ValueError("broken UL4ON stream at position {}: dict value expected, got {!r}".format(self._position(), typecode))
+				yield ("leave" + kind, value)
+			elif typecode in "lL":
+				value = []
+				if typecode == "L":
+					self._loading(value)
+				yield ("enterlist", value)
+				stack.append(("]", "list", value, 0))
+				continue
+			elif typecode in "dDeE":
+				value = {} if typecode in "dD" else ordereddict()
+				if typecode in "DE":
+					self._loading(value)
+				yield ("enterdict", value)
+				stack.append(("}", "dict", value, 0))
+				continue
+			elif typecode in "yY":
+				value = set()
+				if typecode == "Y":
+					self._loading(value)
+				yield ("enterset", value)
+				stack.append(("}", "set", value, 0))
+				continue
+			else:
+				yield ("value", self._load(typecode))
+			if not stack:
+				return
+			(terminator, kind, value, count) = stack[-1]
+			stack[-1] = (terminator, kind, value, count + 1)
+
+	def _begin(self):
+		# Called before reading a top level object (:class:`BinaryDecoder` checks the header here)
+		pass
+
+	def _fill(self, size=1, until=None):
+		# Read the next chunk from the stream and append it to the unprocessed
+		# rest of the buffer. As this copies the rest, the chunk is at least as
+		# large as the rest (so tokens spanning many chunks still take linear time).
+		# If :obj:`bufsize` is :const:`None`, only :obj:`size` characters will be
+		# read instead (or if :obj:`until` is given, the characters up to and
+		# including the next :obj:`until` character).
+		# Returns whether there was more data.
+		if self.stream is None:
+			return False
+		rest = self._buffer[self._pos:]
+		if self.bufsize is not None:
+			data = self.stream.read(max(self.bufsize, len(rest)))
+		elif until is None:
+			data = self.stream.read(size)
+		else:
+			chunks = []
+			while True:
+				c = self.stream.read(1)
+				if not c:
+					break
+				chunks.append(c)
+				if c == until:
+					break
+			data = rest[:0].join(chunks)
+		if not data:
+			return False
+		self._offset += self._pos
+		self._buffer = rest + data
+		self._pos = 0
+		return True
+
+	def _position(self):
+		# Return the position in the stream (for error messages)
+		return self._offset + self._pos
+
+	def _readtoken(self):
+		# Return the characters up to the next whitespace (or the end of the stream)
+		while True:
+			buffer = self._buffer
+			end = _tokenre.match(buffer, self._pos).end()
+			if end < len(buffer) or not self._fill():
+				token = buffer[self._pos:end]
+				self._pos = end
+				return token
+
+	def _readint(self):
+		return int(self._readtoken())
+
+	def _readchar(self):
+		# Return the next character (or ``""`` at the end of the stream)
+		if self._pos >= len(self._buffer) and not self._fill():
+			return ""
+		c = self._buffer[self._pos]
+		self._pos += 1
+		return c
+
+	def _readstr(self):
+		# Read a string literal (starting at the current position)
+		delimiter = self._readchar()
+		if not delimiter:
+			raise EOFError()
+		self._pos -= 1
+		regex = _strres.get(delimiter)
+		if regex is None:
+			raise ValueError("broken UL4ON stream at position {}: expected string delimiter; got {!r}".format(self._position(), delimiter))
+		while True:
+			match = regex.match(self._buffer, self._pos)
+			if match is not None:
+				break
+			if not self._fill(until=delimiter):
+				raise EOFError()
+		self._pos = match.end()
+		value = match.group(1)
+		if "\\" in value:
+			value = ast.literal_eval(match.group())
+		return value
 
 	def _loading(self, obj):
 		self._objects.append(obj)
 
+	def _nextobject(self):
+		# Return the match of :obj:`_objectre` for the next object
+		while True:
+			buffer = self._buffer
+			match = _objectre.match(buffer, self._pos)
+			# If the value of an int/float/backreference ends at the end of the buffer, it might continue in the next chunk
+			if match is not None and (match.lastindex != 2 or match.end() < len(buffer) or self.stream is None):
+				self._pos = match.end()
+				return match
+			if not self._fill():
+				if match is None:
+					raise EOFError()
+				self._pos = match.end()
+				return match
+
 	def _nextchar(self, nextchar=None):
 		while True:
-			nextchar = self.stream.read(1)
-			if nextchar:
-				if not nextchar.isspace():
-					return nextchar
-			else:
+			match = _nextcharre.match(self._buffer, self._pos)
+			if match is not None:
+				self._pos = match.end()
+				return match.group(1)
+			if not self._fill():
 				raise EOFError()
 
 	def _beginfakeloading(self):
@@ -399,10 +902,50 @@ class Decoder:
 		# Fix backreference in object list
 		self._objects[oldpos] = value
 
-	def _load(self, typecode):
-		from ll import misc
+	def _load(self, typecode, terminator=None):
+		# Load the next object. If :obj:`typecode` is not :const:`None`, it has already been read.
+		# If the next object is the terminator :obj:`terminator` (of the list, dict or set
+		# currently being loaded) return :obj:`_end` instead.
 		if typecode is None:
-			typecode = self._nextchar()
+			buffer = self._buffer
+			match = _objectre.match(buffer, self._pos)
+			if match is None or (match.lastindex == 2 and match.end() >= len(buffer) and self.stream is not None):
+				match = self._nextobject() # Read more data (or raise :exc:`EOFError`)
+			else:
+				self._pos = match.end()
+			index = match.lastindex
+			if index == 2:
+				(typecode, value) = match.group(1, 2)
+				if typecode == "^":
+					return self._objects[int(value)]
+				elif typecode in "iI":
+					value = int(value)
+				else:
+					value = float(value)
+				if typecode in "IF":
+					self._loading(value)
+				return value
+			elif index == 4:
+				(typecode, value) = match.group(3, 4)
+				if value == "T":
+					value = True
+				elif value == "F":
+					value = False
+				else:
+					raise ValueError("broken UL4ON stream at position {}: expected 'T' or 'F' for bool; got {!r}".format(self._position(), value))
+				if typecode == "B":
+					self._loading(value)
+				return value
+			elif index == 6 or index == 7:
+				value = match.group(index)
+				if "\\" in value:
+					value = ast.literal_eval(match.string[match.start(5)+1:match.end()])
+				if match.group(5) == "S":
+					self._loading(value)
+				return value
+			typecode = match.group(8)
+			if typecode == terminator:
+				return _end
 		if typecode == "^":
 			position = self._readint()
 			return self._objects[position]
@@ -411,13 +954,13 @@ class Decoder:
 				self._loading(None)
 			return None
 		elif typecode in "bB":
-			value = self.stream.read(1)
+			value = self._readchar()
 			if value == "T":
 				value = True
 			elif value == "F":
 				value = False
 			else:
-				raise ValueError("broken UL4ON stream at position {}: expected 'T' or 'F' for bool; got {!r}".format(self.stream.tell(), value))
+				raise ValueError("broken UL4ON stream at position {}: expected 'T' or 'F' for bool; got {!r}".format(self._position(), value))
 			if typecode == "B":
 				self._loading(value)
 			return value
@@ -427,35 +970,12 @@ class Decoder:
 				self._loading(value)
 			return value
 		elif typecode in "fF":
-			chars = []
-			while True:
-				c = self.stream.read(1)
-				if c and not c.isspace():
-					chars.append(c)
-				else:
-					value = float("".join(chars))
-					break
+			value = float(self._readtoken())
 			if typecode == "F":
 				self._loading(value)
 			return value
 		elif typecode in "sS":
-			delimiter = self.stream.read(1)
-			if not delimiter:
-				raise EOFError()
-			buffer = [delimiter]
-			while True:
-				c = self.stream.read(1)
-				if not c:
-					raise EOFError()
-				buffer.append(c)
-				if c == delimiter:
-					value = ast.literal_eval("".join(buffer))
-					break
-				elif c == "\\":
-					c2 = self.stream.read(1)
-					if not c2:
-						raise EOFError()
-					buffer.append(c2)
+			value = self._readstr()
 			if typecode == "S":
 				self._loading(value)
 			return value
@@ -518,40 +1038,34 @@ class Decoder:
 			if typecode == "L":
 				self._loading(value)
 			while True:
-				typecode = self._nextchar()
-				if typecode == "]":
+				item = self._load(None, "]")
+				if item is _end:
 					return value
-				else:
-					item = self._load(typecode)
-					value.append(item)
+				value.append(item)
 		elif typecode in "dDeE":
 			value = {} if typecode in "dD" else ordereddict()
 			if typecode in "DE":
 				self._loading(value)
 			while True:
-				typecode = self._nextchar()
-				if typecode == "}":
+				key = self._load(None, "}")
+				if key is _end:
 					return value
-				else:
-					key = self._load(typecode)
-					if isinstance(key, str):
-						if key in self._keycache:
-							key = self._keycache[key]
-						else:
-							self._keycache[key] = key
-					item = self._load(None)
-					value[key] = item
+				if isinstance(key, str):
+					if key in self._keycache:
+						key = self._keycache[key]
+					else:
+						self._keycache[key] = key
+				item = self._load(None)
+				value[key] = item
 		elif typecode in "yY":
 			value = set()
 			if typecode == "Y":
 				self._loading(value)
 			while True:
-				typecode = self._nextchar()
-				if typecode == "}":
+				item = self._load(None, "}")
+				if item is _end:
 					return value
-				else:
-					item = self._load(typecode)
-					value.add(item)
+				value.add(item)
 		elif typecode in "oO":
 			if typecode == "O":
 				oldpos = self._beginfakeloading()
@@ -569,10 +1083,131 @@ class Decoder:
 			value.ul4onload(self)
 			typecode = self._nextchar()
 			if typecode != ")":
-				raise ValueError("broken UL4ON stream at position {}: object terminator ')' expected, got {!r}".format(self.stream.tell(), typecode))
+				raise ValueError("broken UL4ON stream at position {}: object terminator ')' expected, got {!r}".format(self._position(), typecode))
 			return value
 		else:
-			raise ValueError("broken UL4ON stream at position {}: unknown typecode {!r}".format(self.stream.tell(), typecode))
+			raise ValueError("broken UL4ON stream at position {}: unknown typecode {!r}".format(self._position(), typecode))
+
+
+class BinaryDecoder(Decoder):
+	"""
+	A :class:`BinaryDecoder` is used for deserializing a binary UL4ON dump
+	(as created by :class:`BinaryEncoder`).
+
+	:obj:`stream` must provide a :meth:`read` method that returns
+	:class:`bytes` objects. For the other arguments see :meth:`Decoder.__init__`.
+
+	The stream must start with the binary UL4ON header. Further headers before
+	later top level objects (as written by repeated calls to :func:`dump`) are
+	skipped.
+	"""
+	def __init__(self, stream, registry=None, bufsize=None):
+		super().__init__(stream, registry, bufsize)
+		self._buffer = b""
+		self._first = True # Check the magic header before loading the first object
+
+	def _begin(self):
+		# The header is required before the first object. Streams written by
+		# repeated calls to :func:`dump` have a header before each object, so a
+		# header before later objects is skipped (``U`` isn't a typecode).
+		if self._first or ((self._pos < len(self._buffer) or self._fill()) and self._buffer[self._pos] == _binarymagic[0]):
+			pos = self._position()
+			if self._readbytes(len(_binarymagic)) != _binarymagic:
+				raise ValueError("broken UL4ON stream at position {}: binary UL4ON header expected".format(pos))
+			# A new header starts the output of a new encoder, so backreferences start from scratch
+			if not self._first:
+				self._objects = []
+			self._first = False
+
+	def _readbytes(self, size):
+		while len(self._buffer) - self._pos < size:
+			if not self._fill(size - (len(self._buffer) - self._pos)):
+				raise EOFError()
+		pos = self._pos
+		self._pos = pos + size
+		return self._buffer[pos:pos+size]
+
+	def _readchar(self):
+		# Return the next byte as a character
+		if self._pos >= len(self._buffer) and not self._fill():
+			raise EOFError()
+		c = chr(self._buffer[self._pos])
+		self._pos += 1
+		return c
+
+	def _nextchar(self, nextchar=None):
+		return self._readchar()
+
+	def _readvarint(self):
+		# Read a non-negative varint
+		buffer = self._buffer
+		pos = self._pos
+		if pos < len(buffer) and buffer[pos] < 0x80:
+			self._pos = pos + 1
+			return buffer[pos]
+		value = 0
+		shift = 0
+		while True:
+			if self._pos >= len(self._buffer) and not self._fill():
+				raise EOFError()
+			byte = self._buffer[self._pos]
+			self._pos += 1
+			value |= (byte & 0x7f) << shift
+			if byte < 0x80:
+				return value
+			shift += 7
+
+	def _readint(self):
+		# Read a varint in zigzag encoding
+		value = self._readvarint()
+		return -((value + 1) >> 1) if value & 1 else value >> 1
+
+	def _load(self, typecode, terminator=None):
+		# Ints, floats, strings and backreferences are stored differently from the text format,
+		# everything else is built from these and is handled by :meth:`Decoder._load`.
+		if typecode is None:
+			buffer = self._buffer
+			pos = self._pos
+			if pos + 1 < len(buffer):
+				typecode = chr(buffer[pos])
+				if typecode == terminator:
+					self._pos = pos + 1
+					return _end
+				# Fast path for values that are stored in a one byte varint
+				byte = buffer[pos+1]
+				if byte < 0x80:
+					if typecode == "^":
+						self._pos = pos + 2
+						return self._objects[byte]
+					elif typecode == "i":
+						self._pos = pos + 2
+						return -((byte + 1) >> 1) if byte & 1 else byte >> 1
+					elif typecode == "S" or typecode == "s":
+						end = pos + 2 + byte
+						if end <= len(buffer):
+							self._pos = end
+							value = buffer[pos+2:end].decode("utf-8", "surrogatepass")
+							if typecode == "S":
+								self._objects.append(value)
+							return value
+				self._pos = pos + 1
+			else:
+				typecode = self._nextchar()
+				if typecode == terminator:
+					return _end
+		if typecode == "^":
+			return self._objects[self._readvarint()]
+		elif typecode == "i" or typecode == "I":
+			value = self._readint()
+		elif typecode == "f" or typecode == "F":
+			value = _unpackfloat(self._readbytes(8))[0]
+		elif typecode == "s" or typecode == "S":
+			value = self._readbytes(self._readvarint()).decode("utf-8", "surrogatepass")
+		else:
+			return super()._load(typecode)
+		if typecode in "IFS":
+			self._loading(value)
+		return value
 
 
 class StreamBuffer:
@@ -596,22 +1231,47 @@ class StreamBuffer:
 			return result
 
 
-def dumps(obj, indent=None):
+def _makeencoder(stream, indent, binary):
+	if binary:
+		if indent is not None:
+			raise ValueError("binary UL4ON dumps can't be indented")
+		return BinaryEncoder(stream)
+	return Encoder(stream, indent=indent)
+
+
+def dumps(obj, indent=None, binary=False):
 	"""
 	Serialize :obj:`obj` as an UL4ON formatted string.
+
+	If :obj:`binary` is true, a binary UL4ON dump will be returned as a
+	:class:`bytes` object instead (see :class:`BinaryEncoder`).
 	"""
-	stream = io.StringIO()
-	Encoder(stream, indent=indent).dump(obj)
+	stream = io.BytesIO() if binary else io.StringIO()
+	_makeencoder(stream, indent, binary).dump(obj)
 	return stream.getvalue()
 
 
-def dump(obj, stream, indent=None):
+def dump(obj, stream, indent=None, binary=False):
 	"""
 	Serialize :obj:`obj` as an UL4ON formatted stream to :obj:`stream`.
 
-	:obj:`stream` must provide a :meth:`write` method.
+	:obj:`stream` must provide a :meth:`write` method. If :obj:`binary` is true
+	a binary UL4ON dump will be written, so :meth:`write` must accept
+	:class:`bytes` objects.
+	"""
+	_makeencoder(stream, indent, binary).dump(obj)
+
+
+def dumpiter(iterable, stream, indent=None, binary=False):
 	"""
-	Encoder(stream, indent=indent).dump(obj)
+	Serialize the items of :obj:`iterable` as an UL4ON formatted list to
+	:obj:`stream`. The items are written incrementally (see :class:`Encoder`),
+	so this can be used for exporting huge amounts of data (e.g. from a
+	database cursor).
+
+	For the meaning of the other arguments see :func:`dump`.
+	"""
+	_makeencoder(stream, indent, binary).dump(iter(iterable))
 
 
 def loadclob(clob, bufsize=1024*1024, registry=None):
@@ -624,7 +1284,72 @@ def loadclob(clob, bufsize=1024*1024, registry=None):
 
 	For the meaning of :obj:`registry` see :meth:`Decoder.__init__`.
 	"""
-	return Decoder(StreamBuffer(clob, bufsize), registry).load()
+	return Decoder(StreamBuffer(clob, bufsize), registry, bufsize).load()
+
+
+def _makedecoder(stream, data, registry, bufsize=64*1024):
+	# Return a decoder for :obj:`stream` of which :obj:`data` has already been read.
+	# The format is detected from the type of :obj:`data` and the magic header.
+	if isinstance(data, str):
+		decoder = Decoder(stream, registry, bufsize)
+	elif _binarymagic.startswith(data[:len(_binarymagic)]):
+		# Starts with the magic header (or is a truncated header)
+		decoder = BinaryDecoder(stream, registry, bufsize)
+	else:
+		# A text dump as UTF-8 encoded bytes
+		if stream is None:
+			data = data.decode("utf-8")
+		else:
+			stream = _UTF8Reader(stream, data)
+			data = ""
+		decoder = Decoder(stream, registry, bufsize)
+	decoder._buffer = data
+	return decoder
+
+
+class _UTF8Reader:
+	# Wraps a binary stream containing UTF-8 and returns characters from :meth:`read`.
+	# As :obj:`size` characters require at least :obj:`size` bytes, this never reads
+	# more bytes from the stream than required.
+	def __init__(self, stream, data):
+		self.stream = stream
+		self.decoder = codecs.getincrementaldecoder("utf-8")()
+		self.data = self.decoder.decode(data)
+
+	def read(self, size):
+		data = self.data
+		while len(data) < size:
+			chunk = self.stream.read(size - len(data))
+			if not chunk:
+				data += self.decoder.decode(b"", True)
+				break
+			data += self.decoder.decode(chunk)
+		self.data = data[size:]
+		return data[:size]
+
+
+# Streams where :func:`load` can read ahead and seek back to the end of the object afterwards
+_seekablestreams = (io.StringIO, io.BytesIO, io.BufferedReader, io.BufferedRandom, io.FileIO)
+
+
+def _makestreamdecoder(stream, registry):
+	# Return a tuple ``(decoder, start)`` with a decoder for reading objects from
+	# :obj:`stream`, that doesn't consume more from the stream than required for
+	# those objects: Either the decoder reads only what it needs (then :obj:`start`
+	# is :const:`None`) or it reads in chunks and the stream must be positioned
+	# via :func:`_seekback` when the decoder isn't used any longer.
+	if isinstance(stream, _seekablestreams) and stream.seekable():
+		start = stream.tell()
+		data = stream.read(64*1024)
+		if isinstance(data, str) or _binarymagic.startswith(data[:len(_binarymagic)]):
+			return (_makedecoder(stream, data, registry), start)
+		stream.seek(start)
+	return (_makedecoder(stream, stream.read(1), registry, None), None)
+
+
+def _seekback(stream, decoder, start):
+	if start is not None:
+		stream.seek(start + decoder._offset + decoder._pos)
 
 
 def loads(string, registry=None):
@@ -632,9 +1357,16 @@ def loads(string, registry=None):
 	Deserialize :obj:`string` (which must be a string containing an UL4ON
 	formatted object) to a Python object.
 
+	:obj:`string` may also be a :class:`bytes` object containing a binary UL4ON
+	dump (as created by ``dumps(obj, binary=True)``) or an UTF-8 encoded text
+	dump.
+
 	For the meaning of :obj:`registry` see :meth:`Decoder.__init__`.
 	"""
-	return Decoder(io.StringIO(string), registry).load()
+	if isinstance(string, bytearray):
+		string = bytes(string)
+	# Decode the string directly instead of reading it from a stream
+	return _makedecoder(None, string, registry).load()
 
 
 def load(stream, registry=None):
@@ -642,6 +1374,37 @@ def load(stream, registry=None):
 	Deserialize :obj:`stream` (which must be file-like object with a :meth:`read`
 	method containing an UL4ON formatted object) to a Python object.
 
+	If :meth:`read` returns :class:`bytes` objects, the stream may contain a
+	binary UL4ON dump or an UTF-8 encoded text dump.
+
+	Only the object itself is read from the stream (see the :obj:`bufsize`
+	argument of :meth:`Decoder.__init__`), so :func:`load` can be called
+	repeatedly to read several objects from the same stream. For
+	:class:`io.StringIO`, :class:`io.BytesIO` and binary files the stream is
+	read in chunks and is positioned after the object afterwards.
+
 	For the meaning of :obj:`registry` see :meth:`Decoder.__init__`.
 	"""
-	return Decoder(stream, registry).load()
+	(decoder, start) = _makestreamdecoder(stream, registry)
+	value = decoder.load()
+	_seekback(stream, decoder, start)
+	return value
+
+
+def iterload(stream, registry=None, items=False):
+	"""
+	Deserialize all objects in :obj:`stream` (which must be file-like object
+	with a :meth:`read` method containing a sequence of UL4ON formatted
+	objects) and return an iterator over them.
+
+	Like :func:`load` this doesn't read more from :obj:`stream` than required
+	for the objects returned.
+
+	For the meaning of :obj:`items` see :meth:`Decoder.iterload`, for the
+	meaning of :obj:`registry` see :meth:`Decoder.__init__`.
+	"""
+	(decoder, start) = _makestreamdecoder(stream, registry)
+	try:
+		yield from decoder.iterload(items)
+	finally:
+		_seekback(stream, decoder, start)
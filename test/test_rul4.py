@@ -109,3 +109,143 @@ def test_oracle_execute_procedure_out(globals):
 			whitespace="strip"
 		)
 		assert template.renders(globals=globals) == "42|42.5|foo|{}|2014-10-05 16:17:18".format(100000*"foo")
+
+
+@pytest.mark.parametrize("jobs", [1, 2])
+def test_batch(tmpdir, capsys, jobs):
+	template = tmpdir.join("t.ul4")
+	template.write("<?print globals.vars.x?>/<?print 12//globals.vars.y?>;")
+	data = tmpdir.join("data.json")
+	data.write('{"x": "a", "y": 1}\n{"x": "b", "y": 0}\n\n{"x": "c", "y": 3}\n')
+
+	# Errors are reported but don't stop the batch
+	assert rul4.main([str(template), "-b", str(data), "-j{}".format(jobs)]) == 1
+	(out, err) = capsys.readouterr()
+	assert out == "a/12;c/4;"
+	assert "Error in batch record 1" in err
+	assert "ZeroDivisionError" in err
+
+	# Output into one file per record
+	pattern = str(tmpdir.join("out", "{index}-{x}.txt"))
+	assert rul4.main([str(template), "-b", str(data), "-j{}".format(jobs), "--batchoutput", pattern, "--onerror", "continue"]) == 1
+	capsys.readouterr()
+	assert tmpdir.join("out", "0-a.txt").read() == "a/12;"
+	assert tmpdir.join("out", "2-c.txt").read() == "c/4;"
+	assert not tmpdir.join("out", "1-b.txt").check()
+
+
+def test_batch_ul4on(tmpdir, capsys):
+	from ll import ul4on
+
+	template = tmpdir.join("t.ul4")
+	template.write("<?print globals.vars.x?>+<?print globals.vars.z?>;")
+	data = tmpdir.join("data.ul4on")
+	with data.open("w", encoding="utf-8") as f:
+		encoder = ul4on.Encoder(f)
+		encoder.dump({"x": 1})
+		encoder.dump({"x": 2, "z": "z2"})
+
+	assert rul4.main([str(template), "-b", str(data), "--batchformat", "ul4on", "-j1", "-Dz=z"]) == 0
+	(out, err) = capsys.readouterr()
+	assert out == "1+z;2+z2;"
+
+
+def test_profile(tmpdir, capsys):
+	template = tmpdir.join("t.ul4")
+	template.write("<?print 1//globals.vars.x?>")
+
+	assert rul4.main([str(template), "-Dx:int=1", "--profile"]) == 0
+	(out, err) = capsys.readouterr()
+	assert out == "1"
+	assert "Hot spots:" in err
+
+	# The profile is written even if rendering fails
+	assert rul4.main([str(template), "-Dx:int=0", "--profile", "--stacktrace", "short"]) == 1
+	(out, err) = capsys.readouterr()
+	assert "ZeroDivisionError" in err
+	assert "Hot spots:" in err
+
+	with pytest.raises(ul4c.LocationError):
+		rul4.main([str(template), "-Dx:int=0", "--profile", "--stacktrace", "full"])
+	(out, err) = capsys.readouterr()
+	assert "Hot spots:" in err
+
+
+def test_read_batch_pipe():
+	import threading
+	from ll import ul4on
+
+	# Records from a pipe are available before the producer closes it
+	(readfd, writefd) = os.pipe()
+	with open(readfd, "r", encoding="utf-8") as reader, open(writefd, "w", encoding="utf-8") as writer:
+		ul4on.dump({"x": 1}, writer)
+		writer.flush()
+		result = []
+		thread = threading.Thread(target=lambda: result.append(next(rul4.read_batch(reader, "ul4on"))), daemon=True)
+		thread.start()
+		thread.join(10)
+		assert result == [{"x": 1}]
+
+
+@pytest.mark.parametrize("jobs", [1, 2])
+def test_batch_vars(tmpdir, capsys, jobs):
+	template = tmpdir.join("t.ul4")
+	template.write("<?print globals.vars.x?>+<?print globals.vars.z?>;")
+	data = tmpdir.join("data.json")
+	data.write('{"x": 1}\n{"x": 2, "z": "z3"}\n')
+
+	# The variables passed to :func:`run` are used in batch mode too
+	assert rul4.run([str(template), "-b", str(data), "-j{}".format(jobs), "-Dz=z1"], rul4.Globals(), {"z": "z2"}) == 0
+	(out, err) = capsys.readouterr()
+	assert out == "1+z2;2+z3;"
+
+
+def test_system_env(tmpdir):
+	server = rul4.Server(str(tmpdir.join("rul4.sock")))
+	globals = rul4.ServerGlobals(server, env=dict(os.environ, RUL4_TEST="client"))
+	assert globals.system("echo $RUL4_TEST") == "client\n"
+
+
+def test_serve(tmpdir, capsys):
+	import threading
+
+	path = str(tmpdir.join("rul4.sock"))
+	server = rul4.Server(path)
+	thread = threading.Thread(target=server.serve_forever)
+	thread.start()
+	try:
+		while not os.path.exists(path):
+			thread.join(0.01)
+
+		template = tmpdir.join("t.ul4")
+		template.write("<?code db = globals.sqlite('test.db')?><?code db.execute('create table if not exists t (x integer)')?><?print globals.vars.x?>;")
+		with tmpdir.as_cwd():
+			assert rul4.main(["--connect", path, str(template), "-Dx=1"]) == 0
+			(out, err) = capsys.readouterr()
+			assert out == "1;"
+
+			# Templates and database connections are reused
+			assert rul4.client(path, [str(template), "-Dx=2"], vars={"x": 3}) == 0
+			(out, err) = capsys.readouterr()
+			assert out == "3;"
+			assert len(server.templates) == 1
+			assert len(server.connections) == 1
+			assert tmpdir.join("test.db").check()
+
+			# Changed templates are recompiled
+			template.write("<?print 1/globals.vars.x?>")
+			assert rul4.main(["--connect", path, "t.ul4", "-Dx:int=0"]) == 1
+			(out, err) = capsys.readouterr()
+			assert "ZeroDivisionError" in err
+
+			# Errors in the command line
+			assert rul4.main(["--connect", path, "--whitespace=foo", "t.ul4"]) == 2
+			(out, err) = capsys.readouterr()
+			assert "invalid choice" in err
+	finally:
+		server.shutdown()
+		thread.join()
+	assert not os.path.exists(path)
+	assert rul4.main(["--connect", path, str(template)]) == 1
+	(out, err) = capsys.readouterr()
+	assert "can't connect" in err
@@ -10,7 +10,7 @@
 ## See ll/xist/__init__.py for the license
 
 
-import sys, os, re, datetime, io, json, tempfile, collections, shutil, subprocess, inspect, datetime, codecs
+import sys, os, re, datetime, io, json, tempfile, collections, shutil, subprocess, inspect, datetime, codecs, threading
 
 import pytest
 
@@ -91,6 +91,11 @@ class TemplatePythonDump(TemplatePython):
 		return template
 
 
+class TemplatePythonCompiled(TemplatePython):
+	def maketemplate(self):
+		return ul4c.Template(self.source, name=self.name, whitespace=self.whitespace, signature=self.signature, backend="compiled")
+
+
 class TemplateJava:
 	def __init__(self, source, name=None, whitespace="keep", signature=None):
 		self.source = source
@@ -426,6 +431,7 @@ all_templates = dict(
 	python=TemplatePython,
 	python_dumps=TemplatePythonDumpS,
 	python_dump=TemplatePythonDump,
+	python_compiled=TemplatePythonCompiled,
 	java_compiled_by_python=TemplateJavaCompiledByPython,
 	java_compiled_by_java=TemplateJavaCompiledByJava,
 	js_v8=TemplateJavascriptV8,
@@ -938,6 +944,14 @@ def test_for_leak(T):
 	assert '4;4' == T('<?code x = 17?><?code y = 23?><?for x in range(5)?><?code y = x?><?end for?><?print x?>;<?print y?>').renders()
 
 
+@pytest.mark.ul4
+def test_for_constant(T):
+	# Constant containers must be reported as not iterable
+	with raises("is not iterable|iter\\(.*\\) not supported"):
+		T("<?for x in 42?><?end for?>").renders()
+	assert "1;2;" == T("<?for x in [1, 2]?><?print x?>;<?end for?>").renders()
+
+
 @pytest.mark.ul4
 def test_for_unpacking(T):
 	data = [
@@ -977,6 +991,20 @@ def test_for_break(T):
 	assert '1, 2, ' == T('<?for i in [1,2,3]?><?print i?>, <?if i==2?><?break?><?end if?><?end for?>').renders()
 
 
+@pytest.mark.ul4
+def test_for_specialized(T):
+	assert "0a;1b;" == T("<?for (i, x) in enumerate(data)?><?if i == 2?><?break?><?end if?><?print i?><?print x?>;<?end for?>").renders(data="abcd")
+	assert "1a;3c;" == T("<?for (i, x) in enumerate(data, 1)?><?if i == 2?><?continue?><?end if?><?print i?><?print x?>;<?end for?>").renders(data="abc")
+	assert "[0a;1b;2c]" == T("<?for (i, f, l, x) in enumfl(data)?><?if f?>[<?end if?><?print i?><?print x?><?if l?>]<?else?>;<?end if?><?end for?>").renders(data="abc")
+	assert "[a;b;" == T("<?for (f, l, x) in isfirstlast(data)?><?if x == 'c'?><?break?><?end if?><?if f?>[<?end if?><?print x?><?if not l?>;<?end if?><?end for?>").renders(data="abcd")
+	assert "[x]" == T("<?for (f, l, x) in isfirstlast(data)?><?if f?>[<?end if?><?print x?><?if l?>]<?end if?><?end for?>").renders(data="x")
+	assert "" == T("<?for (i, f, l, x) in enumfl(data)?><?print x?><?end for?>").renders(data="")
+	# A variable shadowing the builtin function must be used instead
+	assert "x;y;" == T("<?for (a, b) in enumerate(data)?><?print b?>;<?end for?>").renders(data="ab", enumerate=lambda data: [(0, "x"), (1, "y")])
+	# The loop variables must be visible after the loop
+	assert "2c" == T("<?for (i, x) in enumerate(data)?><?end for?><?print i?><?print x?>").renders(data="abc")
+
+
 @pytest.mark.ul4
 def test_break_nested(T):
 	assert '1, 1, 2, 1, 2, 3, ' == T('<?for i in [1,2,3,4]?><?for j in [1,2,3,4]?><?print j?>, <?if j>=i?><?break?><?end if?><?end for?><?if i>=3?><?break?><?end if?><?end for?>').renders()
@@ -1693,6 +1721,14 @@ def test_and(T):
 	assert "False" == t.renders(x=False, y=True)
 	assert "0" == t.renders(x=0, y=True)
 
+	# Constant left operands
+	assert "0" == T('<?print 0 and x?>').renders(x=42)
+	assert "42" == T('<?print "a" and x?>').renders(x=42)
+	assert "no" == T('<?if None and x?>yes<?else?>no<?end if?>').renders(x=42)
+
+	# The left operand must not be modified
+	assert "2,1" == T('<?code x = 1?><?print x and 2?>,<?print x?>').renders()
+
 
 @pytest.mark.ul4
 def test_or(T):
@@ -1702,6 +1738,14 @@ def test_or(T):
 	assert "True" == t.renders(x=False, y=True)
 	assert "42" == t.renders(x=42, y=True)
 
+	# Constant left operands
+	assert "a" == T('<?print "a" or x?>').renders(x=42)
+	assert "42" == T('<?print 0 or x?>').renders(x=42)
+	assert "yes" == T('<?if None or x?>yes<?else?>no<?end if?>').renders(x=42)
+
+	# The left operand must not be modified
+	assert "5,0" == T('<?code x = 0?><?print x or 5?>,<?print x?>').renders()
+
 
 @pytest.mark.ul4
 def test_not(T):
@@ -4043,6 +4087,42 @@ def test_nested_exceptions(T):
 		T("<?render tmpl3(tmpl1=tmpl1, tmpl2=tmpl2, x=x)?>").renders(tmpl1=tmpl1, tmpl2=tmpl2, tmpl3=tmpl3, x=None)
 
 
+def test_locationtracking():
+	def f():
+		raise ValueError("broken")
+
+	tmpl1 = ul4c.Template("<?print 2*x?>", "tmpl1")
+	tmpl2 = ul4c.Template("<?render tmpl1(x=x)?>", "tmpl2")
+	sources = [
+		"<?print x*None?>",
+		"<?render tmpl2(tmpl1=tmpl1, x=None)?>",
+		"<?print tmpl2.renders(tmpl1=tmpl1, x=None)?>",
+		"<?def g?><?return 1/y?><?end def?><?print g(y=0)?>",
+		"<?print list(1/y for y in [1, 0])?>",
+		"<?print [1/y for y in [1, 0]]?>",
+		"<?for (a, b) in [1]?><?end for?>",
+		"<?if 1/x?><?end if?>",
+		"<?print len(1/x)?>",
+		"<?print f()?>",
+		"<?code x.foo = 42?>",
+	]
+
+	def chain(source, **kwargs):
+		try:
+			ul4c.Template(source).renders(tmpl1=tmpl1, tmpl2=tmpl2, f=f, x=0, **kwargs)
+		except Exception as exc:
+			return [misc.format_exception(exc) for exc in misc.exception_chain(exc)]
+		pytest.fail("failed to raise exception")
+
+	for source in sources:
+		oldmode = ul4c.locationtracking("lazy")
+		try:
+			lazy = chain(source)
+		finally:
+			ul4c.locationtracking(oldmode)
+		assert chain(source) == lazy
+
+
 @pytest.mark.ul4
 def test_note(T):
 	assert "foo" == T("f<?note This is?>o<?note a comment?>o").renders()
@@ -4061,7 +4141,7 @@ def test_doc(T):
 
 @pytest.mark.ul4
 def test_exception(T):
-	if T in (TemplatePython, TemplatePythonDumpS, TemplatePythonDump):
+	if T in (TemplatePython, TemplatePythonDumpS, TemplatePythonDump, TemplatePythonCompiled):
 		assert "None" == T("<?print repr(exc.cause)?>").renders(exc=ValueError("broken"))
 		exc = ValueError("broken")
 		exc.__cause__ = ValueError("because")
@@ -4365,11 +4445,104 @@ def test_renders_closure(T):
 	assert "42" == T("<?def inner?><?print x?><?end def?><?print inner.renders()?>").render(x=42)
 
 
+def test_closure_reuse():
+	for backend in ("interpreted", "compiled"):
+		# Closures with constant defaults are reused in the same scope
+		t = ul4c.Template("<?for i in range(3)?><?def f(x=1)?><?print x+i?><?end def?><?code l.append(f)?><?end for?><?for f in l?><?render f()?><?end for?>", backend=backend)
+		l = []
+		assert t.renders(l=l) == "333"
+		assert l[0] is l[1] is l[2]
+		assert t.renders(l=[]) == "333"
+
+		# Defaults depending on variables are evaluated for each definition
+		t = ul4c.Template("<?for i in range(3)?><?def f(x=i)?><?print x?><?end def?><?code l.append(f)?><?end for?><?for f in l?><?render f()?><?end for?>", backend=backend)
+		l = []
+		assert t.renders(l=l) == "012"
+		assert len(set(map(id, l))) == 3
+
+		# Only the referenced variables are passed from the enclosing scope, assignments stay local
+		t = ul4c.Template("<?code x = 1?><?code y = 2?><?def f(y)?><?code x += y?><?print x?><?end def?><?render f(y=10)?><?print x?>", backend=backend)
+		assert t.renders() == "111"
+
+
+def test_signatureplan():
+	def f1(x, y=42, *args, **kwargs): pass
+	def f2(x, y=42): pass
+	def f3(*args): pass
+	def f4(x, *, y): pass
+
+	calls = [
+		((), {}),
+		((1,), {}),
+		((1, 2), {}),
+		((1, 2, 3), {}),
+		((), {"x": 1}),
+		((1,), {"x": 1}),
+		((1,), {"y": 2, "z": 3}),
+		((), {"args": 1}),
+	]
+	for function in (f1, f2, f3, f4):
+		signature = inspect.signature(function)
+		bind = ul4c._signatureplan(signature)
+		for (args, kwargs) in calls:
+			try:
+				expected = dict(ul4c._makevars(signature, args, kwargs))
+			except TypeError as exc:
+				with raises(re.escape(str(exc))):
+					bind(args, kwargs)
+			else:
+				assert bind(args, kwargs) == expected
+
+
 @pytest.mark.ul4
 def test_return_in_template(T):
 	assert "gurk" == T("gurk<?return 42?>hurz").renders()
 
 
+@pytest.mark.ul4
+def test_attr_polymorphic():
+	# The same ``Attr`` node is used for objects of different types
+	class InstanceAttributes:
+		def __init__(self, x):
+			self.x = x
+			self.ul4attrs = {"x"}
+
+	data = [{"x": 1}, PseudoDict({"x": 2}), {"x": 3}, "x", {"y": 4}, InstanceAttributes(5), {"x": 6}]
+	for T in (TemplatePython, TemplatePythonCompiled):
+		assert "1,2,3,,,5,6," == T("<?for o in data?><?print o.x?>,<?end for?>").renders(data=data)
+		assert "True,False," == T("<?for o in data?><?print o.get('x') == 3?>,<?end for?>").renders(data=[{"x": 3}, {"x": 4}])
+
+
+def test_call_polymorphic():
+	# The same ``Call`` node is used for objects with different calling conventions
+	def plain(x):
+		return x
+
+	@ul4c.withcontext
+	def withcontext(context, x):
+		return "{}{}".format(type(context).__name__, x)
+
+	class Method:
+		def method(self, x):
+			return x + 1
+
+		@ul4c.withcontext
+		def contextmethod(self, context, x):
+			return x + 2
+
+	class Callable:
+		def ul4call(self, x):
+			return x + 3
+
+	functions = [plain, withcontext, len, Method().method, Method().contextmethod, Callable(), plain, ul4c.Template("<?return x * 10?>", signature="x"), withcontext]
+	data = [4, 5, [1, 2], 6, 7, 8, 9, 1, 2]
+	for T in (TemplatePython, TemplatePythonCompiled):
+		assert "4,Context5,2,7,9,11,9,10,Context2," == T("<?for (f, x) in zip(functions, data)?><?print f(x)?>,<?end for?>").renders(functions=functions, data=data)
+		assert "6,Context6," == T("<?for f in functions?><?print f(x=6)?>,<?end for?>").renders(functions=[plain, withcontext])
+		with raises("duplicate keyword argument"):
+			T("<?print f(x=1, x=2)?>").renders(f=plain)
+
+
 @pytest.mark.ul4
 def test_customattributes():
 	class CustomAttributes:
@@ -4723,7 +4896,7 @@ def test_function_signature_default(T):
 @pytest.mark.ul4
 def test_function_signature_args(T):
 	# Calling a template with position arguments only works in Python (of course, inside a template this works in all implementations)
-	if T in (TemplatePython, TemplatePythonDumpS, TemplatePythonDump):
+	if T in (TemplatePython, TemplatePythonDumpS, TemplatePythonDump, TemplatePythonCompiled):
 		assert 40 == T("<?return sum(args)?>", signature="*args")(17, 23)
 
 
@@ -4844,6 +5017,444 @@ def test_javasource():
 	t.javasource()
 
 
+@pytest.mark.ul4
+def test_templatecache(tmpdir):
+	cache = ul4c.TemplateCache(str(tmpdir))
+
+	t1 = cache.template("<?print x?>", name="t", signature="x")
+	assert (cache.hits, cache.misses) == (0, 1)
+	t2 = cache.template("<?print x?>", name="t", signature="x")
+	assert (cache.hits, cache.misses) == (1, 1)
+	assert t1 is not t2
+	assert "42" == t2.renders(x=42)
+	assert "t" == t2.name
+
+	# Different compilation options result in different cache entries
+	cache.template("<?print x?>", name="t", signature="x", whitespace="strip")
+	assert (cache.hits, cache.misses) == (1, 2)
+	assert 2 == len(tmpdir.listdir())
+
+	t3 = cache.template("<?print x?>", name="t", signature="x", backend="compiled")
+	assert "compiled" == t3.backend
+	assert "42" == t3.renders(x=42)
+
+	cache.clear()
+	assert not tmpdir.listdir()
+
+
+@pytest.mark.ul4
+def test_templatecache_broken(tmpdir):
+	cache = ul4c.TemplateCache(str(tmpdir))
+	cache.template("<?print 42?>")
+	(path,) = tmpdir.listdir()
+	path.write("garbage")
+
+	assert "42" == cache.template("<?print 42?>").renders()
+	assert (cache.hits, cache.misses) == (0, 2)
+	assert "42" == cache.template("<?print 42?>").renders()
+	assert (cache.hits, cache.misses) == (1, 2)
+
+
+@pytest.mark.ul4
+def test_templatecache_maxsize(tmpdir):
+	cache = ul4c.TemplateCache(str(tmpdir))
+	cache.template("<?print 1?>")
+	size = tmpdir.listdir()[0].size()
+	cache.clear()
+
+	cache = ul4c.TemplateCache(str(tmpdir), maxsize=2*size)
+	for i in range(1, 6):
+		cache.template("<?print {}?>".format(i))
+	assert 2 == len(tmpdir.listdir())
+	# The last templates are the ones that are still cached
+	cache.template("<?print 5?>")
+	assert 1 == cache.hits
+
+
+@pytest.mark.ul4
+def test_templateloader(tmpdir):
+	tmpdir.join("main.ul4").write("<?for i in range(2)?><?render templates.row(i=i, templates=templates)?><?end for?>")
+	tmpdir.join("row.ul4").write("[<?print templates.cell.renders(i=i)?>]")
+	tmpdir.join("cell.ul4").write("<?print i?>")
+	tmpdir.join("other.ul4").write("other")
+
+	loader = ul4c.TemplateLoader(str(tmpdir))
+	assert not loader.loaded()
+	assert "[0][1]" == loader["main"].renders(templates=loader)
+	# Templates are loaded on demand
+	assert {"main", "row", "cell"} == loader.loaded()
+	assert {"main", "row", "cell", "other"} == set(loader)
+	assert "nothere" not in loader
+	assert loader.get("nothere") is None
+
+	assert {"row"} == loader.dependencies("main")
+	assert {"cell"} == loader.dependencies("row")
+	assert {"main", "row"} == loader.dependents("cell")
+
+	# Determining the dependencies doesn't load the referenced templates
+	loader2 = ul4c.TemplateLoader(str(tmpdir))
+	assert {"row"} == loader2.dependencies("main")
+	assert {"main"} == loader2.loaded()
+
+	# Unchanged templates are not recompiled
+	row = loader["row"]
+	assert loader["row"] is row
+	assert not loader.check()
+
+	# Changed templates are
+	path = tmpdir.join("cell.ul4")
+	path.write("<<?print i?>>")
+	path.setmtime(path.mtime() + 10)
+	assert {"main", "row", "cell"} == loader.check()
+	assert "[<0>][<1>]" == loader["main"].renders(templates=loader)
+	assert loader["row"] is row
+
+	path.write("(<?print i?>)")
+	path.setmtime(path.mtime() + 10)
+	assert "[(0)][(1)]" == loader["main"].renders(templates=loader)
+
+	# Removed templates are gone
+	path.remove()
+	assert "cell" not in loader
+	with pytest.raises(KeyError):
+		loader["cell"]
+
+
+@pytest.mark.ul4
+def test_pythonsource():
+	t = universaltemplate()
+	compile(t.pythonsource(), "<ul4>", "exec")
+
+
+def test_pythonsource_slots():
+	# Local templates and comprehensions see the current values of variables
+	t = ul4c.Template("<?code x = 1?><?def f?><?print x?><?end def?><?render f()?><?code x += 1?><?render f()?><?print [x for x in range(2)]?><?print x?>", backend="compiled")
+	assert t.renders() == "12[0, 1]2"
+	assert "vars['x'] = " in t.pythonsource()
+
+	# Without them variables are only stored in local variables
+	t = ul4c.Template("<?code s = 0?><?for i in range(n)?><?code s += i?><?end for?><?print s?>", backend="compiled")
+	assert t.renders(n=5) == "10"
+	assert "vars['s']" not in t.pythonsource()
+	assert "vars['i']" not in t.pythonsource()
+
+	t = ul4c.Template("<?if x?><?code y = 1?><?end if?><?print y?>", backend="compiled")
+	assert t.renders(x=True) == "1"
+	assert t.renders(x=False) == ""
+
+
+def test_pythonsource_withcontext():
+	# Functions that get the context passed in see and change the variables of the template
+	@ul4c.withcontext
+	def getx(context):
+		return context.vars.get("x")
+
+	@ul4c.withcontext
+	def setx(context, value):
+		context.vars["x"] = value
+
+	source = "<?code x = 1?><?print getx()?>|<?code setx(5)?><?print x?>|<?code x += 1?><?print getx()?>|<?for x in [7]?><?end for?><?print getx()?>|<?print [x, setx(8), x]?>|<?print setx(9)?><?print x?>"
+	for backend in ("interpreted", "compiled"):
+		t = ul4c.Template(source, backend=backend)
+		assert t.renders(getx=getx, setx=setx) == "1|5|6|7|[7, None, 8]|9"
+
+	# Calls of builtin functions don't require ``vars`` to be kept up to date
+	t = ul4c.Template("<?code s = 0?><?for i in range(n)?><?code s += len(str(i))?><?end for?><?print s?>", backend="compiled")
+	assert t.renders(n=12) == "14"
+	assert "vars['s']" not in t.pythonsource()
+
+
+def test_renderto():
+	class Renderable:
+		def ul4render(self, x):
+			yield "<"
+			yield str(x)
+			yield ">"
+
+	source = "<?def inner(x)?>[<?print x?>]<?end def?><?for i in range(3)?><?render inner(i)?><?render t(y=i)?><?render r(i)?><?end for?>"
+	for backend in ("interpreted", "compiled"):
+		t = ul4c.Template(source, whitespace="strip", backend=backend)
+		t2 = ul4c.Template("(<?print y?>)", "t", whitespace="strip", signature="y", backend=backend)
+		expected = "[0](0)<0>[1](1)<1>[2](2)<2>"
+		assert t.renders(t=t2, r=Renderable()) == expected
+
+		# Callable
+		output = []
+		t.renderto(output.append, t=t2, r=Renderable())
+		assert "".join(output) == expected
+
+		# Stream
+		stream = io.StringIO()
+		t.renderto(stream, t=t2, r=Renderable())
+		assert stream.getvalue() == expected
+
+		# Chunked
+		output = []
+		t.renderto(ul4c.ChunkWriter(output.append, 5), t=t2, r=Renderable())
+		assert "".join(output) == expected
+		assert all(len(chunk) >= 5 for chunk in output[:-1])
+
+		# Indentation and ``<?return?>``
+		t = ul4c.Template("<?def inner?>\na\nb\n<?end def?>\n\t<?render inner()?>\n<?return None?>c", whitespace="smart", backend=backend)
+		output = []
+		t.renderto(output.append)
+		assert "".join(output) == "\ta\n\tb\n"
+
+		# Errors are reported in the same way as for :meth:`renders`
+		t = ul4c.Template("<?render t(y=1/0)?>", backend=backend)
+		chains = []
+		for render in (lambda: t.renders(t=t2), lambda: t.renderto([].append, t=t2)):
+			with pytest.raises(ul4c.LocationError) as excinfo:
+				render()
+			chains.append([misc.format_exception(exc) for exc in misc.exception_chain(excinfo.value)])
+		assert chains[0] == chains[1]
+		assert "ZeroDivisionError" in chains[1][-1]
+
+
+def test_renderbytes():
+	source = "<?for i in range(count)?><?print i?>\u20ac<?end for?>"
+	for backend in ("interpreted", "compiled"):
+		t = ul4c.Template(source, signature="count", backend=backend)
+		expected = t.renders(count=100)
+
+		assert t.renderbytes("utf-8", 100) == expected.encode("utf-8")
+		assert t.renderbytes("utf-16", count=100) == expected.encode("utf-16")
+		assert t.renderbytes("ascii", count=0) == b""
+
+		output = list(t.iterbytes("utf-8", 10, count=100))
+		assert b"".join(output) == expected.encode("utf-8")
+		assert all(len(chunk.decode("utf-8")) >= 10 for chunk in output[:-1])
+		assert list(t.iterbytes("utf-8", 10, count=0)) == []
+
+		# The BOM must only be output once
+		assert b"".join(t.iterbytes("utf-16", 10, count=100)) == expected.encode("utf-16")
+
+		# Variables named like the parameters
+		t2 = ul4c.Template("<?print encoding?>/<?print chunksize?>", signature="encoding, chunksize", backend=backend)
+		assert t2.renderbytes("utf-8", "latin-1", 1) == b"latin-1/1"
+		assert b"".join(t2.iterbytes("utf-8", 1, encoding="latin-1", chunksize=1)) == b"latin-1/1"
+
+		with pytest.raises(UnicodeEncodeError):
+			t.renderbytes("ascii", count=1)
+
+
+def test_renderbytes_xml():
+	pytest.importorskip("ll._xml_codec")
+	t = ul4c.Template("<?xml version='1.0' encoding='<?print encoding?>'?><a>\u20ac</a>", signature="encoding")
+	assert t.renderbytes("xml", "iso-8859-15") == "<?xml version='1.0' encoding='iso-8859-15'?><a>\u20ac</a>".encode("iso-8859-15")
+	assert b"".join(t.iterbytes("xml", 5, "utf-8")) == "<?xml version='1.0' encoding='utf-8'?><a>\u20ac</a>".encode("utf-8")
+
+
+def test_render_async():
+	import asyncio, concurrent.futures
+
+	class Rows:
+		# Asynchronous iterator
+		def __init__(self, count):
+			self.count = count
+			self.index = 0
+
+		def __aiter__(self):
+			return self
+
+		async def __anext__(self):
+			if self.index >= self.count:
+				raise StopAsyncIteration
+			await asyncio.sleep(0.001)
+			self.index += 1
+			return self.index
+
+	async def title():
+		await asyncio.sleep(0.001)
+		return "rows"
+
+	async def double(x):
+		await asyncio.sleep(0.001)
+		return 2*x
+
+	async def check(backend):
+		t = ul4c.Template("<?print title?>:<?for r in rows?><?print double(r)?>;<?end for?>", backend=backend)
+
+		# Several templates can be rendered concurrently
+		results = await asyncio.gather(*[t.renders_async(title=title(), rows=Rows(i), double=double) for i in range(4)])
+		assert results == ["rows:", "rows:2;", "rows:2;4;", "rows:2;4;6;"]
+
+		output = []
+		async for chunk in t.render_async(title="sync", rows=[1, 2], double=lambda x: 2*x):
+			output.append(chunk)
+		assert "".join(output) == "sync:2;4;"
+
+		# Errors are propagated
+		with raises("ZeroDivisionError"):
+			await ul4c.Template("<?print 1/x?>", backend=backend).renders_async(x=double(0))
+
+		# Rendering can be stopped
+		iterator = ul4c.Template("<?for i in range(100000)?><?print i?><?end for?>", backend=backend).render_async()
+		assert (await iterator.__anext__()).startswith("0123")
+		await iterator.aclose()
+
+		# Awaits that need the default executor work even if there are more concurrent renders than executor threads
+		async def lookup(x):
+			return await asyncio.get_event_loop().run_in_executor(None, str, x)
+
+		t = ul4c.Template("<?for i in range(3)?><?print lookup(i)?><?end for?>", backend=backend)
+		results = await asyncio.wait_for(asyncio.gather(*[t.renders_async(lookup=lookup) for i in range(8)]), 10)
+		assert results == ["012"] * 8
+
+	loop = asyncio.new_event_loop()
+	loop.set_default_executor(concurrent.futures.ThreadPoolExecutor(max_workers=2))
+	try:
+		for backend in ("interpreted", "compiled"):
+			loop.run_until_complete(check(backend))
+	finally:
+		loop.close()
+
+
+def test_profiler():
+	source = "<?def row(r)?>\n<?print r?>\n<?end def?>\n<?for r in range(5)?>\n<?render row(r)?>\n<?end for?>\n"
+	for backend in ("interpreted", "compiled"):
+		t = ul4c.Template(source, "main", whitespace="smart", backend=backend)
+		with ul4c.Profiler() as profiler:
+			assert t.renders() == "0\n1\n2\n3\n4\n"
+		records = {(record.template.name, record.node.type, record.pos.start): record for record in profiler.stats()}
+		forrecord = records[("main", "forblock", source.index("<?for"))]
+		assert forrecord.calls == 1
+		assert records[("main", "render", source.index("<?render"))].calls == 5
+		assert records[("row", "print", source.index("<?print"))].calls == 5
+		assert forrecord.cumtime >= forrecord.owntime >= 0
+		assert all(record.owntime <= record.cumtime for record in profiler.stats())
+
+		report = profiler.report()
+		assert "Template 'main'" in report
+		assert "| <?render row(r)?>" in report
+
+		# Profiling is only active inside the ``with`` block
+		assert not hasattr(ul4c.Print.eval, "_unprofiled")
+		assert ul4c.Context().profiler is None
+
+		# ... and only in the same thread
+		other = ul4c.Template("<?print 42?>", "other", backend=backend)
+		results = []
+		def render():
+			context = ul4c.Context()
+			results.append((context.profiler, other.renders()))
+		with ul4c.Profiler() as profiler:
+			thread = threading.Thread(target=render)
+			thread.start()
+			thread.join()
+			assert t.renders() == "0\n1\n2\n3\n4\n"
+		assert results == [(None, "42")]
+		assert all(record.template.name != "other" for record in profiler.stats())
+
+
+def test_rendercache():
+	source = "<?def nav(page)?>\n<nav><?print page?>/<?print lang?></nav>\n<?end def?>\n<?code nav = cache(nav, key=lang)?>\n<?for i in range(3)?>\n\t<?render nav(page='home')?>\n<?end for?>\n<?render nav(page=[1])?>\n"
+	for backend in ("interpreted", "compiled"):
+		cache = ul4c.RenderCache()
+		t = ul4c.Template(source, whitespace="smart", backend=backend)
+		expected = "<nav>home/de</nav>\n"*3 + "<nav>[1]/de</nav>\n"
+		assert t.renders(cache=cache, lang="de") == expected
+		# The first render of ``nav(page='home')`` is a miss, unhashable arguments are never cached
+		assert (cache.hits, cache.misses, len(cache)) == (2, 2, 1)
+
+		output = []
+		t.renderto(output.append, cache=cache, lang="de")
+		assert "".join(output) == expected
+		assert (cache.hits, cache.misses, len(cache)) == (5, 3, 1)
+
+		# The explicit key is part of the cache key
+		assert t.renders(cache=cache, lang="en") == expected.replace("de", "en")
+		assert len(cache) == 2
+
+		# Indentation is part of the cache key
+		nav = cache(ul4c.Template("<nav>\n</nav>\n", whitespace="smart", backend=backend))
+		t = ul4c.Template("<?render nav()?>\n\t<?render nav()?>\n<?render nav()?>\n", whitespace="smart", backend=backend)
+		assert t.renders(nav=nav) == "<nav>\n</nav>\n\t<nav>\n\t</nav>\n<nav>\n</nav>\n"
+
+	# LRU eviction
+	cache = ul4c.RenderCache(maxsize=2)
+	t = cache(ul4c.Template("<?print x?>", signature="x"))
+	for x in (1, 2, 1, 3, 1):
+		assert t.renders(x) == str(x)
+	assert (cache.hits, cache.misses, len(cache)) == (2, 3, 2)
+	cache.clear()
+	assert (cache.hits, cache.misses, len(cache)) == (0, 0, 0)
+
+
+def test_optimize():
+	source = "<?if True?>a<?print 1+2?>b<?elif x?>c<?end if?><?if False?>d<?elif x?>e<?else?>f<?end if?><?while False?>g<?end while?><?code 42?><?printx '<'?>"
+	t1 = ul4c.Template(source)
+	t2 = ul4c.Template(source, optimize=True)
+	assert t1.renders(x=True) == t2.renders(x=True) == "a3be&lt;"
+	assert t1.renders(x=False) == t2.renders(x=False) == "a3bf&lt;"
+
+	removed = t1.optimize()
+	assert removed > 0
+	assert t1.dumps() == t2.dumps()
+	assert [node.type for node in t1.content] == ["indent", "condblock", "print"]
+	assert [node.type for node in t1.content[1].content] == ["ifblock", "elseblock"]
+
+	# The optimized AST survives a UL4ON roundtrip
+	t3 = ul4on.loads(t1.dumps())
+	assert t3.dumps() == t1.dumps()
+	assert t3.renders(x=True) == "a3be&lt;"
+
+	# Optimizing an optimized template is a no-op
+	assert t1.optimize() == 0
+
+
+def test_optimize_text():
+	t = ul4c.Template("<?note?>a\nb<?note?>c<?print None?>d")
+	assert t.optimize() == 7
+	assert [node.type for node in t.content] == ["indent", "indent"]
+	assert t.renders() == "a\nbcd"
+
+	t = ul4c.Template("<?if x?>\n\t<?print 'a'?>\n<?end if?>", whitespace="smart")
+	t.optimize()
+	assert t.renders(x=True) == "a\n"
+
+
+def test_parser(monkeypatch):
+	source = universaltemplate().source
+	monkeypatch.setattr(ul4c.Template, "parser", "antlr")
+	t1 = ul4c.Template(source, "universal", signature="x, y=42, *args, **kwargs")
+	monkeypatch.setattr(ul4c.Template, "parser", "native")
+	t2 = ul4c.Template(source, "universal", signature="x, y=42, *args, **kwargs")
+	assert t1.dumps() == t2.dumps()
+
+
+def test_parser_errors(monkeypatch):
+	monkeypatch.setattr(ul4c.Template, "parser", "native")
+	for source in ("<?print 1+?>", "<?print (1?>", "<?print [1 for?>", "<?print x y?>", "<?print 'gurk?>", "<?print $?>", "<?code x = ?>", "<?for (x) in ?>", "<?def f(x=1, y)?><?end def?>"):
+		with raises("SyntaxError|Unterminated string|invalid character"):
+			ul4c.Template(source)
+
+
+def test_ast_slots():
+	t = universaltemplate()
+
+	# Templates keep their instance dictionary, all other nodes use slots
+	nodes = [node for node in t._subnodes() if not isinstance(node, ul4c.Template)]
+	assert nodes
+	for node in nodes:
+		assert not hasattr(node, "__dict__")
+		assert isinstance(node.pos, slice)
+		if isinstance(node, ul4c.Code):
+			assert node.text == t.source[node.pos]
+			assert node.tag.code == t.source[node.tag.codepos]
+
+	node = ul4c.Var(None, slice(1, 2), "x")
+	node.pos = slice(3, 5)
+	assert (node.pos.start, node.pos.stop) == (3, 5)
+	node.pos = None
+	assert node.pos is None
+
+	# Positions survive a UL4ON roundtrip
+	t2 = ul4c.Template.loads(t.dumps())
+	assert [node.pos for node in t2._subnodes()] == [node.pos for node in t._subnodes()]
+	assert t2.dumps() == t.dumps()
+
+
 @pytest.mark.ul4
 def test_attr_if(T):
 	cond = ul4.attr_if(html.a("gu'\"rk"), cond="cond")
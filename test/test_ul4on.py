@@ -10,7 +10,7 @@
 ## See ll/xist/__init__.py for the license
 
 
-import sys, io, os, json, datetime, math, tempfile, shutil, subprocess, collections
+import sys, io, os, json, datetime, math, tempfile, shutil, subprocess, collections, threading
 
 import pytest
 
@@ -65,6 +65,10 @@ def transport_python_pretty(obj, registry=None):
 	return _transport_python(obj, indent="\t", registry=registry)
 
 
+def transport_python_binary(obj, registry=None):
+	return ul4on.loads(ul4on.dumps(obj, binary=True), registry=registry)
+
+
 def _transport_js_v8(obj, indent):
 	"""
 	Generate Javascript source that loads the dump done by Python, dumps it
@@ -250,6 +254,7 @@ def transport_java_pretty(obj):
 all_transports = [
 	("python", transport_python),
 	("python_pretty", transport_python_pretty),
+	("python_binary", transport_python_binary),
 	("js_v8", transport_js_v8),
 	("js_v8_pretty", transport_js_v8_pretty),
 	("js_spidermonkey", transport_js_spidermonkey),
@@ -404,7 +409,7 @@ def test_recursion(t):
 
 
 def test_custom_class(t):
-	if t in (transport_python, transport_python_pretty):
+	if t in (transport_python, transport_python_pretty, transport_python_binary):
 		@ul4on.register("de.livinglogic.ul4.test.point")
 		class Point:
 			def __init__(self, x=None, y=None):
@@ -434,6 +439,302 @@ def test_custom_class(t):
 		assert isinstance(p, Point2)
 
 
+def test_encoder():
+	class MyInt(int):
+		pass
+
+	class MyList(list):
+		pass
+
+	class MyDict(dict):
+		pass
+
+	# Subclasses are dumped like their base classes
+	assert ul4on.dumps(MyInt(42)) == ul4on.dumps(42)
+	assert ul4on.dumps(MyList([1, "a"])) == ul4on.dumps([1, "a"])
+	assert ul4on.dumps((1, "a")) == ul4on.dumps([1, "a"])
+	assert ul4on.dumps(MyDict(a=1)) == ul4on.dumps(dict(a=1))
+	assert ul4on.dumps(frozenset([1])) == ul4on.dumps({1})
+	assert ul4on.dumps(datetime.date(2012, 10, 29)) == ul4on.dumps(datetime.datetime(2012, 10, 29))
+
+	# Methods overwritten in an encoder subclass don't affect other encoders
+	class UpperEncoder(ul4on.Encoder):
+		def _dump_str(self, obj):
+			super()._dump_str(obj.upper())
+
+	stream = io.StringIO()
+	UpperEncoder(stream).dump(["abc"])
+	assert stream.getvalue() == "L S'ABC' ]"
+	assert ul4on.dumps(["abc"]) == "L S'abc' ]"
+	assert ul4on.dumps(["abc"], binary=True) == b"UL4ON\x01LS\x03abc]"
+
+	# Each top level object is written to the stream with one call
+	writes = []
+	class Stream:
+		def write(self, s):
+			writes.append(s)
+
+	encoder = ul4on.Encoder(Stream(), indent="\t")
+	s = "gurk"
+	encoder.dump([s, ul4c.Template("<?print x?>", "t")])
+	encoder.dump(s)
+	assert len(writes) == 2
+	assert writes[1] == "^1\n"
+	decoder = ul4on.Decoder(io.StringIO("".join(writes)))
+	assert decoder.load()[0] == "gurk"
+	assert decoder.load() == "gurk"
+
+
+def test_decoder_chunks():
+	d = datetime.datetime(2012, 10, 29, 16, 44, 55, 987000)
+	data = [None, True, False, 42, -42.5, "gurk", "'\"\\\n\u20ac", d, d, [1, [2, 3]], {"foo": {1, 2}, "bar": ordereddict(a=1)}, color.Color(1, 2, 3, 4), slice(1, None), datetime.timedelta(1, 2, 3), misc.monthdelta(3)]
+	for indent in (None, "\t"):
+		dump = ul4on.dumps(data, indent=indent)
+		dump2 = ul4on.dumps(42, indent=indent)
+		# Decode with every possible chunk boundary
+		for bufsize in (1, 2, 3, 5, 8, 1024):
+			decoder = ul4on.Decoder(io.StringIO(dump + " " + dump2), bufsize=bufsize)
+			result = decoder.load()
+			assert result == data
+			assert result[7] is result[8]
+			assert decoder.load() == 42
+			with pytest.raises(EOFError):
+				decoder.load()
+		assert ul4on.loads(dump) == data
+		assert ul4on.load(io.StringIO(dump)) == data
+		assert ul4on.Decoder(ul4on.StreamBuffer(io.StringIO(dump), 7)).load() == data
+
+	# Incomplete and broken dumps
+	for dump in ("", "  ", "L i1", "S'foo", "D S'foo' i1"):
+		with pytest.raises(EOFError):
+			ul4on.loads(dump)
+	with pytest.raises(ValueError):
+		ul4on.loads("bX")
+	with pytest.raises(ValueError):
+		ul4on.loads("]")
+	with pytest.raises(ValueError):
+		ul4on.loads("L i1 }")
+	with pytest.raises(ValueError):
+		ul4on.loads("D S'foo' }")
+
+
+def test_load_stream():
+	# :func:`ul4on.load` doesn't read beyond the end of the object
+	stream = io.StringIO("i1 i2")
+	assert ul4on.load(stream) == 1
+	assert ul4on.load(stream) == 2
+
+	class Stream:
+		# Stream without seek support
+		def __init__(self, data):
+			self.stream = io.BytesIO(data) if isinstance(data, bytes) else io.StringIO(data)
+
+		def read(self, size):
+			return self.stream.read(size)
+
+	for data in ("S'a\\'b' L S'\u20ac' ] i42 ", "S'a\\'b' L S'\u20ac' ] i42 ".encode("utf-8")):
+		stream = Stream(data)
+		assert ul4on.load(stream) == "a'b"
+		assert ul4on.load(stream) == ["\u20ac"]
+		assert list(ul4on.iterload(stream)) == [42]
+
+	for binary in (False, True):
+		stream = io.BytesIO() if binary else io.StringIO()
+		ul4on.dump([1, "foo"], stream, binary=binary)
+		ul4on.dump("bar", stream, binary=binary)
+		stream.seek(0)
+		assert ul4on.load(stream) == [1, "foo"]
+		assert ul4on.load(stream) == "bar"
+
+		# Reading from a pipe doesn't wait for more data than the object needs
+		(readfd, writefd) = os.pipe()
+		with open(readfd, "rb" if binary else "r") as reader, open(writefd, "wb" if binary else "w") as writer:
+			writer.write(ul4on.dumps([1, "foo", {"bar": None}], binary=binary))
+			writer.flush()
+			result = []
+			thread = threading.Thread(target=lambda: result.append(ul4on.load(reader)), daemon=True)
+			thread.start()
+			thread.join(10)
+			assert result == [[1, "foo", {"bar": None}]]
+
+	# A decoder created directly doesn't read ahead either
+	stream = io.StringIO("i1 i2 S'x' ")
+	assert [ul4on.Decoder(stream).load() for i in range(3)] == [1, 2, "x"]
+
+	stream = io.BytesIO(ul4on.dumps(1, binary=True) + ul4on.dumps("x", binary=True))
+	assert [ul4on.BinaryDecoder(stream).load() for i in range(2)] == [1, "x"]
+
+	# Unless a buffer size is specified
+	stream = io.StringIO("i1 i2 S'x' ")
+	assert ul4on.Decoder(stream, bufsize=1024).load() == 1
+	assert stream.read() == ""
+
+
+def test_binary():
+	d = datetime.datetime(2012, 10, 29, 16, 44, 55, 987000)
+	data = [None, True, False, 0, 63, 64, -64, -65, 2**100, -2**100, -42.5, "", "gurk", "'\"\\\n\u20ac\ud800" * 100, d, d, [1, [2, 3]], {"foo": {1, 2}, "bar": ordereddict(a=1)}, color.Color(1, 2, 3, 4), slice(1, None), datetime.timedelta(1, 2, 3), misc.monthdelta(3)]
+	dump = ul4on.dumps(data, binary=True)
+	assert isinstance(dump, bytes)
+	assert len(dump) < len(ul4on.dumps(data))
+	stream = io.BytesIO()
+	encoder = ul4on.BinaryEncoder(stream)
+	encoder.dump(data)
+	encoder.dump(42)
+	assert stream.getvalue().startswith(dump)
+
+	# Decode with every possible chunk boundary
+	for bufsize in (1, 2, 3, 5, 8, 1024):
+		decoder = ul4on.BinaryDecoder(io.BytesIO(stream.getvalue()), bufsize=bufsize)
+		result = decoder.load()
+		assert result == data
+		assert result[14] is result[15]
+		assert decoder.load() == 42
+		with pytest.raises(EOFError):
+			decoder.load()
+
+	# The format is detected automatically
+	assert ul4on.loads(dump) == data
+	assert ul4on.loads(bytearray(dump)) == data
+	assert ul4on.load(io.BytesIO(dump)) == data
+	assert ul4on.loads(ul4on.dumps(data).encode("utf-8")) == data
+	assert ul4on.load(io.BytesIO(ul4on.dumps(data).encode("utf-8"))) == data
+
+	# Incomplete and broken dumps
+	for i in range(len(dump) // 10):
+		with pytest.raises(EOFError):
+			ul4on.loads(dump[:i])
+	with pytest.raises(ValueError):
+		ul4on.BinaryDecoder(io.BytesIO(b"L i1 i2 ]")).load()
+	with pytest.raises(ValueError):
+		ul4on.loads(dump[:6] + b"}")
+	with pytest.raises(ValueError):
+		ul4on.dumps(data, indent="\t", binary=True)
+
+
+def test_iterload():
+	s = "gurk"
+	data = [[1, s, {"foo": [s]}], 42, [s, ul4c.Template("<?print x?>", "t")], []]
+	for binary in (False, True):
+		stream = io.BytesIO() if binary else io.StringIO()
+		encoder = ul4on.BinaryEncoder(stream) if binary else ul4on.Encoder(stream)
+		for obj in data:
+			encoder.dump(obj)
+		dump = stream.getvalue()
+
+		result = list(ul4on.iterload(io.BytesIO(dump) if binary else io.StringIO(dump)))
+		assert len(result) == 4
+		assert result[:2] == data[:2]
+		assert result[2][0] is result[0][1]
+		assert result[2][1].renders(x=17) == "17"
+
+		result = list(ul4on.iterload(io.BytesIO(dump) if binary else io.StringIO(dump), items=True))
+		assert len(result) == 6
+		assert result[:4] == [1, s, {"foo": [s]}, 42]
+		assert result[4] is result[1]
+		assert result[5].renders(x=17) == "17"
+
+		decoder = (ul4on.BinaryDecoder if binary else ul4on.Decoder)(io.BytesIO(dump) if binary else io.StringIO(dump), bufsize=3)
+		items = decoder.iterload(items=True)
+		assert next(items) == 1
+		assert next(items) == "gurk"
+
+	# Each call to :func:`ul4on.dump` writes its own binary header
+	stream = io.BytesIO()
+	for obj in data:
+		ul4on.dump(obj, stream, binary=True)
+	stream.seek(0)
+	result = list(ul4on.iterload(stream))
+	assert len(result) == 4
+	assert result[:2] == data[:2]
+	assert result[2][0] == s
+	assert result[2][1].renders(x=17) == "17"
+	assert result[3] == []
+	stream.seek(0)
+	assert list(ul4on.iterload(stream, items=True))[:4] == [1, s, {"foo": [s]}, 42]
+	stream.seek(0)
+	decoder = ul4on.BinaryDecoder(stream)
+	assert [decoder.load() for i in range(2)] == data[:2]
+	with pytest.raises(ValueError):
+		list(ul4on.iterload(io.BytesIO(ul4on.dumps(1, binary=True) + b"UL4ON\x02i\x02")))
+
+	assert list(ul4on.iterload(io.StringIO(""))) == []
+	assert list(ul4on.iterload(io.StringIO(" i1 i2 "))) == [1, 2]
+	assert list(ul4on.iterload(io.BytesIO(b""))) == []
+	with pytest.raises(EOFError):
+		list(ul4on.iterload(io.StringIO("L i1 i2"), items=True))
+
+
+def test_events():
+	s = "gurk"
+	data = [1, s, {"foo": {2}}, [s], []]
+	for binary in (False, True):
+		dump = ul4on.dumps(data, binary=binary)
+		decoder = (ul4on.BinaryDecoder if binary else ul4on.Decoder)(io.BytesIO(dump) if binary else io.StringIO(dump))
+		events = [(event, value) for (event, value) in decoder.events()]
+		assert events == [
+			("enterlist", []),
+			("value", 1),
+			("value", "gurk"),
+			("enterdict", {}),
+			("value", "foo"),
+			("enterset", set()),
+			("value", 2),
+			("leaveset", set()),
+			("leavedict", {}),
+			("enterlist", []),
+			("value", "gurk"),
+			("leavelist", []),
+			("enterlist", []),
+			("leavelist", []),
+			("leavelist", []),
+		]
+		assert events[0][1] is events[-1][1]
+		assert events[10][1] is events[2][1]
+		with pytest.raises(EOFError):
+			list(decoder.events())
+
+	decoder = ul4on.Decoder(io.StringIO("i42 L i1 ]"))
+	assert list(decoder.events()) == [("value", 42)]
+	assert list(decoder.events()) == [("enterlist", []), ("value", 1), ("leavelist", [])]
+	with pytest.raises(ValueError):
+		list(ul4on.Decoder(io.StringIO("D S'foo' }")).events())
+	with pytest.raises(EOFError):
+		list(ul4on.Decoder(io.StringIO("L i1")).events())
+
+
+def test_iterables():
+	def records(count):
+		for i in range(count):
+			yield {"id": i, "name": "Name {}".format(i), "tags": ["foo", "bar"]}
+
+	for binary in (False, True):
+		assert ul4on.loads(ul4on.dumps(records(3), binary=binary)) == list(records(3))
+		assert ul4on.loads(ul4on.dumps({"records": records(3), "map": map(str, range(3))}, binary=binary)) == {"records": list(records(3)), "map": ["0", "1", "2"]}
+
+		# Objects recorded outside of the items can still be referenced from inside the items
+		s = ["gurk"]
+		result = ul4on.loads(ul4on.dumps([s, (item for item in [[s, s], [s]])], binary=binary))
+		assert result[1][0][0] is result[0]
+		assert result[1][0][1] is result[0]
+		assert result[1][1][0] is result[0]
+
+		# The items are written to the stream before the iterable is exhausted
+		writes = []
+		class Stream:
+			def write(self, s):
+				writes.append(s)
+
+		ul4on.dumpiter(records(1000), Stream(), binary=binary)
+		assert len(writes) > 1
+		dump = (b"" if binary else "").join(writes)
+		assert ul4on.loads(dump) == list(records(1000))
+		assert list(ul4on.iterload(io.BytesIO(dump) if binary else io.StringIO(dump), items=True)) == list(records(1000))
+
+	stream = io.StringIO()
+	ul4on.dumpiter([1, 2, 3], stream, indent="\t")
+	assert stream.getvalue() == "L\n\ti1\n\ti2\n\ti3\n]\n"
+
+
 @pytest.mark.db
 def test_oracle_none(oracle):
 	if oracle: